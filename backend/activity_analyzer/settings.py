@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import datetime
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,7 +54,25 @@ REST_FRAMEWORK = {
     ]
 }
 
+# snapshots of account returned by api/snapshot/<id>/ per page when
+# pagination is asked for with page_size or cursor param (default and max
+# allowed with page_size param), without them all snapshots are returned
+API_SNAPSHOT_PAGE_SIZE = 1000
+API_SNAPSHOT_MAX_PAGE_SIZE = 5000
+
+# requests' metrics (api.middleware.MetricsMiddleware) are exposed on /metrics
+# in Prometheus text format to clients from API_METRICS_ALLOWED_IPS (client's
+# address as seen by Django, REMOTE_ADDR) or sending API_METRICS_TOKEN (if
+# set) in "Authorization: Bearer <token>" header, others get 403; requests
+# with X-Timing header get their timing breakdown (database, serializers,
+# bot_scorer) in Server-Timing header if API_TIMING_HEADER_ENABLED (only in
+# debug mode by default, as it reveals internals to any client)
+API_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+API_METRICS_TOKEN = None
+API_TIMING_HEADER_ENABLED = DEBUG
+
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +87,9 @@ CORS_ORIGIN_WHITELIST = [
     "http://localhost:4200",
 ]
 
+# links to pages of snapshots (api.pagination.SnapshotCursorPagination)
+CORS_EXPOSE_HEADERS = ['Link']
+
 ROOT_URLCONF = 'activity_analyzer.urls'
 
 TEMPLATES = [
@@ -133,3 +155,63 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Bot scorer
+
+# pickled pipeline (standard scaler and logistic regression)
+BOT_SCORER_CLASSIFIER_PATH = BASE_DIR / 'bot_scorer' / 'pipe.p'
+
+# Twitter API v1.1 root, client keeps up to BOT_SCORER_TWITTER_POOL_SIZE
+# connections alive; BOT_SCORER_TWITTER_API_VERIFY may be path of CA bundle
+BOT_SCORER_TWITTER_API_URL = 'https://api.twitter.com/1.1'
+BOT_SCORER_TWITTER_POOL_SIZE = 10
+BOT_SCORER_TWITTER_API_VERIFY = True
+
+# cache of on-demand snapshots (api/snapshot/single/), backend is
+# bot_scorer.cache.LocMemResultCache (in-process) or
+# bot_scorer.cache.DjangoResultCache (default cache from CACHES, may be
+# shared with other data, as clearing it removes only its own keys)
+BOT_SCORER_SINGLE_CACHE_BACKEND = 'bot_scorer.cache.LocMemResultCache'
+BOT_SCORER_SINGLE_CACHE_TTL = 300  # seconds
+BOT_SCORER_SINGLE_CACHE_MAX_SIZE = 1000
+# directory of lock files used to fetch the same account only once at a time
+# across processes (None - only within one process)
+BOT_SCORER_SINGLE_LOCK_DIR = None
+
+# number of threads fetching accounts from Twitter in snapshot job (cron.py)
+BOT_SCORER_SNAPSHOT_CONCURRENCY = 4
+
+# number of snapshots saved in single transaction by snapshot job
+BOT_SCORER_SNAPSHOT_WRITE_CHUNK_SIZE = 500
+
+# accounts with snapshot younger than this are skipped by snapshot job, so
+# interrupted job can be started again
+BOT_SCORER_SNAPSHOT_MIN_AGE = datetime.timedelta(hours=12)
+
+# run reports of snapshot job (timings of stages, rate limit waits, the
+# slowest accounts) are saved as bot_scorer.models.SnapshotRun and JSON files
+# in this directory (None - database only); only BOT_SCORER_RUN_REPORT_KEEP
+# latest runs are kept, older ones and their files are removed (None - all
+# runs are kept)
+BOT_SCORER_RUN_REPORT_DIR = BASE_DIR / 'run_reports'
+BOT_SCORER_RUN_REPORT_KEEP = 1000
+
+# adaptive snapshot scheduling (bot_scorer.scheduler): base interval is
+# divided by 1 + relative daily change of account's counters and bot score
+# (measured over BOT_SCORER_SCHEDULE_LOOKBACK) /
+# BOT_SCORER_SCHEDULE_VOLATILITY_SCALE, so it is halved when the change
+# equals the scale, multiplied by BOT_SCORER_SCHEDULE_INACTIVE_FACTOR for
+# inactive accounts and kept between min and max interval (max for suspended
+# or not found accounts). Accounts which could not be snapshotted are retried
+# after BOT_SCORER_SCHEDULE_RETRY_INTERVAL
+BOT_SCORER_SCHEDULE_BASE_INTERVAL = datetime.timedelta(days=1)
+BOT_SCORER_SCHEDULE_MIN_INTERVAL = datetime.timedelta(hours=6)
+BOT_SCORER_SCHEDULE_MAX_INTERVAL = datetime.timedelta(days=7)
+BOT_SCORER_SCHEDULE_LOOKBACK = datetime.timedelta(days=14)
+BOT_SCORER_SCHEDULE_VOLATILITY_SCALE = 0.01
+BOT_SCORER_SCHEDULE_INACTIVE_FACTOR = 3
+BOT_SCORER_SCHEDULE_RETRY_INTERVAL = datetime.timedelta(minutes=30)
+
+# accounts claimed by snapshot worker (bot_scorer.workers) are released after
+# this time if worker does not renew lease (e.g. it crashed)
+BOT_SCORER_WORKER_LEASE_TIME = datetime.timedelta(minutes=10)
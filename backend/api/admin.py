@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
-from .models import Account, AccountSnapshot
+from .models import Account, AccountSnapshot, AccountProfile
 
 
 @admin.register(Account)
@@ -8,5 +8,10 @@ class AccountAdmin(admin.ModelAdmin):
     list_display = ['twitter_id', 'screen_name']
 
 
-admin.site.register(AccountSnapshot)
+@admin.register(AccountSnapshot)
+class AccountSnapshotAdmin(admin.ModelAdmin):
+    raw_id_fields = ['profile']
+
+
+admin.site.register(AccountProfile)
 admin.site.unregister(Group)
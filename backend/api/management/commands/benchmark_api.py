@@ -0,0 +1,289 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.models import Account, AccountSnapshot, AccountProfile
+from api.serializers import AccountSerializer, \
+    AccountSnapshotAllSerializer, AccountSnapshotDetailSerializer
+
+from .benchmark_snapshot_queries import SNAPSHOT_COLUMNS, \
+    temporary_database
+
+# max number of SQL queries and 95th percentile of time (ms) of every
+# measured endpoint and serializer, exceeding any of them fails the benchmark
+# (queries must not depend on number of accounts, users and snapshots)
+BUDGETS = {
+    'account_list': {'queries': 2, 'p95_ms': 100},
+    'snapshot_retrieve': {'queries': 4, 'p95_ms': 500},
+    'snapshot_retrieve_range': {'queries': 4, 'p95_ms': 200},
+    'snapshot_series': {'queries': 5, 'p95_ms': 200},
+    'snapshot_details': {'queries': 4, 'p95_ms': 100},
+    'serializer_account': {'queries': 0, 'p95_ms': 50},
+    'serializer_snapshot_all': {'queries': 0, 'p95_ms': 300},
+    'serializer_snapshot_detail': {'queries': 1, 'p95_ms': 50},
+}
+
+
+class Command(BaseCommand):
+    help = "Measures API endpoints (accounts list, snapshots list, series " \
+           "and details) through DRF test client and their serializers on " \
+           "seeded accounts, users and snapshots. Reports time, SQL queries " \
+           "and response size, fails when query or time budget (see " \
+           "BUDGETS) is exceeded or time regressed against baseline. Data " \
+           "is seeded to temporary database, removed at the end."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=50,
+                            help="number of seeded accounts")
+        parser.add_argument('--users', type=int, default=10,
+                            help="number of seeded users, every one has all "
+                                 "accounts on the list")
+        parser.add_argument('--snapshots', type=int, default=365,
+                            help="number of daily snapshots per account")
+        parser.add_argument('--repeat', type=int, default=50,
+                            help="number of measured runs of every endpoint")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--latency-factor', type=float, default=1.0,
+                            help="multiplier of time budgets (for slower "
+                                 "machines)")
+        parser.add_argument('--baseline',
+                            help="path of results of previous run, median "
+                                 "times are compared with it")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="allowed relative slowdown against baseline")
+        parser.add_argument('--json', dest='json_path',
+                            help="path of file to save results to")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['results']
+
+        # test client's requests are sent to 'testserver' host
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts), \
+                temporary_database(DEFAULT_DB_ALIAS):
+            self.seed(options['accounts'], options['users'],
+                      options['snapshots'])
+            results = self.measure(options['repeat'])
+
+        failures = self.check_budgets(results, options['latency_factor'],
+                                      baseline, options['tolerance'])
+        self.print_results(results)
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as file:
+                json.dump({
+                    'accounts': options['accounts'],
+                    'users': options['users'],
+                    'snapshots_per_account': options['snapshots'],
+                    'repeat': options['repeat'],
+                    'results': results,
+                    'failures': failures,
+                }, file, indent=2)
+
+        if failures:
+            raise CommandError("Benchmark failed:\n" + "\n".join(failures))
+
+    def seed(self, accounts_count, users_count, snapshots_count):
+        """
+        Saves users, accounts (on the list of every user) and their daily
+        snapshots (the latest one made now).
+
+        :param accounts_count: int
+        :param users_count: int
+        :param snapshots_count: int
+        :return:
+        """
+        now = timezone.now()
+        User.objects.bulk_create(
+            [User(username=f'benchmark_{i}') for i in range(users_count)])
+        users = list(User.objects.order_by('id'))
+
+        Account.objects.bulk_create(
+            [Account(twitter_id=i + 1, screen_name=f'account{i}')
+             for i in range(accounts_count)], batch_size=500)
+        accounts = list(Account.objects.order_by('id'))
+        Account.users.through.objects.bulk_create(
+            [Account.users.through(account_id=account.id, user_id=user.id)
+             for account in accounts for user in users], batch_size=500)
+
+        profile_data = {'name': 'name', 'location': 'location',
+                        'url': 'https://example.com', 'description': 'text'}
+        profile = AccountProfile.objects.create(
+            digest=AccountProfile.get_digest(profile_data), **profile_data)
+
+        # inserted with SQL, as date_of_snapshot is set to now by ORM
+        table = AccountSnapshot._meta.db_table
+        sql = f"INSERT INTO {table} ({', '.join(SNAPSHOT_COLUMNS)}) " \
+              f"VALUES ({', '.join(['%s'] * len(SNAPSHOT_COLUMNS))})"
+        with connection.cursor() as cursor:
+            for day in range(snapshots_count, 0, -1):
+                date = now - timedelta(days=day - 1)
+                cursor.executemany(sql, [(
+                    account.id, profile.id, now - timedelta(days=3000),
+                    self.random.randint(0, 100000),
+                    self.random.randint(0, 100000),
+                    self.random.randint(0, 5000),
+                    self.random.randint(0, 10000),
+                    self.random.randint(0, 100),
+                    False, False, False, self.random.random(), True,
+                    date, '', '01234567',
+                ) for account in accounts])
+
+        self.user = users[0]
+        self.token = Token.objects.create(user=self.user)
+        self.account = accounts[0]
+        self.now = now
+
+    def get_endpoints(self):
+        """
+        Returns measured requests and serializations.
+
+        :return: dictionary (name: callable returning bytes of response or
+        serialized data)
+        """
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        account_id = self.account.id
+        snapshot = AccountSnapshot.objects.filter(account=account_id) \
+            .latest('date_of_snapshot', 'id')
+        retrieve_url = reverse('snapshot-detail', kwargs={'pk': account_id})
+        series_url = reverse('snapshot-series', kwargs={'pk': account_id})
+        details_url = reverse('snapshot-details', kwargs={'pk': snapshot.id})
+        since = (self.now - timedelta(days=30)).date().isoformat()
+
+        def get(url, params=None):
+            def request():
+                response = client.get(url, params)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} answered with "
+                                       f"{response.status_code}")
+                return response.content
+            return request
+
+        def serialize(serializer_class, get_data, many=False):
+            def run():
+                data = serializer_class(get_data(), many=many).data
+                return json.dumps(data, default=str).encode()
+            return run
+
+        # serializers get data queried before measurement
+        accounts = list(Account.objects.filter(users=self.user)
+                        .order_by('screen_name'))
+        snapshots = list(AccountSnapshot.objects.filter(account=account_id)
+                         .select_related('account', 'profile')
+                         .order_by('-date_of_snapshot', '-id')
+                         [:settings.API_SNAPSHOT_PAGE_SIZE])
+        snapshot = AccountSnapshot.objects \
+            .select_related('account', 'profile').get(id=snapshot.id)
+
+        return {
+            'account_list': get(reverse('account-list')),
+            'snapshot_retrieve': get(retrieve_url),
+            'snapshot_retrieve_range': get(retrieve_url, {'since': since}),
+            'snapshot_series': get(series_url, {'points': 100}),
+            'snapshot_details': get(details_url),
+            'serializer_account': serialize(AccountSerializer,
+                                            lambda: accounts, many=True),
+            'serializer_snapshot_all': serialize(
+                AccountSnapshotAllSerializer, lambda: snapshots, many=True),
+            'serializer_snapshot_detail': serialize(
+                AccountSnapshotDetailSerializer, lambda: snapshot),
+        }
+
+    def measure(self, repeat):
+        """
+        Runs every endpoint once to warm up and then repeat times.
+
+        :param repeat: int
+        :return: dictionary (endpoint name: dictionary with times in ms,
+        number of queries and response size in bytes)
+        """
+        results = {}
+        for name, run in self.get_endpoints().items():
+            run()
+            times = []
+            queries = 0
+            size = 0
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    content = run()
+                    times.append((time.perf_counter() - start) * 1000)
+                queries = max(queries, len(captured))
+                size = len(content)
+            times.sort()
+            results[name] = {
+                'median_ms': statistics.median(times),
+                'p95_ms': times[min(len(times) - 1, int(0.95 * len(times)))],
+                'queries': queries,
+                'response_bytes': size,
+            }
+        return results
+
+    @staticmethod
+    def check_budgets(results, latency_factor, baseline, tolerance):
+        """
+        Returns budgets exceeded by results and regressions against
+        baseline.
+
+        :param results: dictionary (see measure)
+        :param latency_factor: float, multiplier of time budgets
+        :param baseline: dictionary (results of previous run) or None
+        :param tolerance: float, allowed relative slowdown against baseline
+        :return: list of strings
+        """
+        failures = []
+        for name, result in results.items():
+            budget = BUDGETS[name]
+            if result['queries'] > budget['queries']:
+                failures.append(f"{name}: {result['queries']} queries "
+                                f"(budget {budget['queries']})")
+            p95_budget = budget['p95_ms'] * latency_factor
+            if result['p95_ms'] > p95_budget:
+                failures.append(f"{name}: p95 {result['p95_ms']:.1f} ms "
+                                f"(budget {p95_budget:.1f} ms)")
+
+            if baseline is None or name not in baseline:
+                continue
+            before = baseline[name]
+            if result['queries'] > before['queries']:
+                failures.append(f"{name}: {result['queries']} queries "
+                                f"(baseline {before['queries']})")
+            allowed = before['median_ms'] * (1 + tolerance)
+            if result['median_ms'] > allowed:
+                failures.append(f"{name}: median {result['median_ms']:.1f} "
+                                f"ms (baseline {before['median_ms']:.1f} "
+                                f"ms)")
+        return failures
+
+    def print_results(self, results):
+        """
+        Prints time, number of queries and response size of every endpoint.
+
+        :param results: dictionary (see measure)
+        :return:
+        """
+        for name, result in results.items():
+            self.stdout.write(f"{name:<28}"
+                              f"median {result['median_ms']:8.2f} ms  "
+                              f"p95 {result['p95_ms']:8.2f} ms  "
+                              f"{result['queries']:3d} queries  "
+                              f"{result['response_bytes']:9d} B")
@@ -0,0 +1,281 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, models, transaction
+from django.db.models import Count, Min, Max, Q
+from django.utils import timezone
+
+from api.models import Account, AccountSnapshot, AccountProfile
+
+# index of foreign key only, as it was before composite indexes were added
+FOREIGN_KEY_INDEX = models.Index(fields=['account'],
+                                 name='snapshot_account_fk_idx')
+
+SNAPSHOT_COLUMNS = ['account_id', 'profile_id', 'created_at',
+                    'statuses_count', 'followers_count', 'friends_count',
+                    'favourites_count', 'listed_count', 'default_profile',
+                    'verified', 'protected', 'bot_score', 'is_active',
+                    'date_of_snapshot', 'suspended_info', 'features_order']
+
+
+@contextmanager
+def temporary_database(alias, keep=False):
+    """
+    Makes temporary SQLite database with applied migrations available under
+    alias. If alias is already configured (e.g. 'default', so code which
+    uses default connection works on temporary database), its settings and
+    connection are restored at the end, it is never written to.
+
+    :param alias: string
+    :param keep: bool, if True database file is not removed
+    :return: string, path of database file
+    """
+    handle, path = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(handle)
+    previous_settings = connections.databases.get(alias)
+    previous_connection = None
+    if previous_settings is not None:
+        previous_connection = connections[alias]
+        del connections[alias]
+
+    connections.databases[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+    }
+    connections.ensure_defaults(alias)
+    connections.prepare_test_settings(alias)
+    try:
+        call_command('migrate', database=alias, verbosity=0)
+        yield path
+    finally:
+        connections[alias].close()
+        del connections[alias]
+        if previous_settings is None:
+            del connections.databases[alias]
+        else:
+            connections.databases[alias] = previous_settings
+            connections[alias] = previous_connection
+        if not keep:
+            os.remove(path)
+
+
+class Command(BaseCommand):
+    help = "Measures queries made on snapshots (history, previous and " \
+           "latest snapshot, series, accounts skipped by snapshot job) on " \
+           "seeded temporary database with foreign key index only and with " \
+           "composite indexes of AccountSnapshot"
+
+    alias = 'benchmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=10000,
+                            help="number of seeded accounts")
+        parser.add_argument('--snapshots', type=int, default=365,
+                            help="number of daily snapshots per account")
+        parser.add_argument('--repeat', type=int, default=50,
+                            help="number of runs of every query")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path',
+                            help="path of file to save results to")
+        parser.add_argument('--explain', action='store_true',
+                            help="prints query plans")
+        parser.add_argument('--keep', action='store_true',
+                            help="keeps temporary database file")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.explain = options['explain']
+        with temporary_database(self.alias, options['keep']) as path:
+            self.seed(options['accounts'], options['snapshots'])
+
+            index_sets = {
+                'foreign_key': [FOREIGN_KEY_INDEX],
+                'composite': AccountSnapshot._meta.indexes,
+            }
+            results = {}
+            for name, indexes in index_sets.items():
+                self.set_indexes(indexes)
+                self.stdout.write(f"Indexes: {name}")
+                results[name] = self.measure(options['repeat'])
+            self.print_comparison(results)
+
+            if options['json_path']:
+                with open(options['json_path'], 'w') as file:
+                    json.dump({
+                        'accounts': options['accounts'],
+                        'snapshots_per_account': options['snapshots'],
+                        'repeat': options['repeat'],
+                        'results': results,
+                    }, file, indent=2)
+
+        if options['keep']:
+            self.stdout.write(f"Database kept in {path}")
+
+    def seed(self, accounts_count, snapshots_count):
+        """
+        Saves accounts with daily snapshots (the latest one made now).
+
+        :param accounts_count: int
+        :param snapshots_count: int
+        :return:
+        """
+        now = timezone.now()
+        Account.objects.using(self.alias).bulk_create(
+            [Account(twitter_id=i + 1, screen_name=f'account{i}')
+             for i in range(accounts_count)], batch_size=500)
+        account_ids = list(Account.objects.using(self.alias)
+                           .values_list('id', flat=True))
+        profile = AccountProfile(name='name', description='description')
+        profile.digest = AccountProfile.get_digest(profile.__dict__)
+        profile.save(using=self.alias)
+
+        # snapshots are inserted day by day, like snapshot job saves them
+        # (snapshots of one account are spread over the whole table)
+        table = AccountSnapshot._meta.db_table
+        sql = f"INSERT INTO {table} ({', '.join(SNAPSHOT_COLUMNS)}) " \
+              f"VALUES ({', '.join(['%s'] * len(SNAPSHOT_COLUMNS))})"
+        connection = connections[self.alias]
+        with transaction.atomic(using=self.alias), \
+                connection.cursor() as cursor:
+            for day in range(snapshots_count, 0, -1):
+                date = now - timedelta(days=day - 1)
+                rows = []
+                for account_id in account_ids:
+                    followers = self.random.randint(0, 100000)
+                    rows.append((
+                        account_id, profile.id,
+                        now - timedelta(days=3000), 1000, followers,
+                        self.random.randint(0, 5000), 100, 10,
+                        False, False, False, self.random.random(), True,
+                        date, '', '01234567',
+                    ))
+                cursor.executemany(sql, rows)
+            cursor.execute('ANALYZE')
+        self.account_ids = account_ids
+        self.now = now
+
+    def set_indexes(self, indexes):
+        """
+        Replaces indexes of snapshots table with given ones.
+
+        :param indexes: list of django.db.models.Index
+        :return:
+        """
+        all_indexes = [FOREIGN_KEY_INDEX] + AccountSnapshot._meta.indexes
+        connection = connections[self.alias]
+        with connection.schema_editor() as editor:
+            existing = connection.introspection.get_constraints(
+                connection.cursor(), AccountSnapshot._meta.db_table)
+            for index in all_indexes:
+                if index.name in existing and index not in indexes:
+                    editor.remove_index(AccountSnapshot, index)
+            for index in indexes:
+                if index.name not in existing:
+                    editor.add_index(AccountSnapshot, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_queries(self):
+        """
+        Returns hot queries on snapshots, every one as function of account's
+        id.
+
+        :return: dictionary (name: callable)
+        """
+        snapshots = AccountSnapshot.objects.using(self.alias)
+        accounts = Account.objects.using(self.alias)
+        skip_since = self.now - timedelta(hours=12)
+
+        def history_page(account_id):
+            return snapshots.filter(account_id=account_id) \
+                .order_by('-date_of_snapshot', '-id')[:1000]
+
+        def date_range(account_id):
+            return snapshots.filter(
+                account_id=account_id,
+                date_of_snapshot__gte=self.now - timedelta(days=30)) \
+                .order_by('-date_of_snapshot', '-id')
+
+        def latest_snapshot(account_id):
+            return snapshots.filter(account_id=account_id) \
+                .order_by('-date_of_snapshot', '-id')[:1]
+
+        def previous_snapshot(account_id):
+            # the same query as bot_scorer.views.get_previous_snapshot
+            date = self.now - timedelta(days=10)
+            return snapshots.filter(
+                Q(date_of_snapshot__lt=date) |
+                Q(date_of_snapshot=date, id__lt=2 ** 62),
+                account_id=account_id,
+            ).order_by('-date_of_snapshot', '-id')[:1]
+
+        def series_summary(account_id):
+            return snapshots.filter(account_id=account_id).values(
+                'account_id').annotate(count=Count('id'),
+                                       first=Min('date_of_snapshot'),
+                                       last=Max('date_of_snapshot'))
+
+        def skipped_accounts(account_id):
+            return accounts.exclude(
+                accountsnapshot__date_of_snapshot__gte=skip_since) \
+                .values('id')
+
+        return {
+            'history_page': history_page,
+            'date_range': date_range,
+            'latest_snapshot': latest_snapshot,
+            'previous_snapshot': previous_snapshot,
+            'series_summary': series_summary,
+            'skipped_accounts': skipped_accounts,
+        }
+
+    def measure(self, repeat):
+        """
+        Runs every query repeat times for random accounts.
+
+        :param repeat: int
+        :return: dictionary (query name: dictionary with times in ms)
+        """
+        results = {}
+        for name, query in self.get_queries().items():
+            if self.explain:
+                self.stdout.write(f"  {name}: "
+                                  f"{query(self.account_ids[0]).explain()}")
+            times = []
+            for _ in range(repeat):
+                queryset = query(self.random.choice(self.account_ids))
+                start = time.perf_counter()
+                list(queryset)
+                times.append((time.perf_counter() - start) * 1000)
+            times.sort()
+            results[name] = {
+                'median_ms': statistics.median(times),
+                'p95_ms': times[min(len(times) - 1, int(0.95 * len(times)))],
+            }
+            self.stdout.write(f"  {name:<20}"
+                              f"median {results[name]['median_ms']:9.3f} ms"
+                              f"  p95 {results[name]['p95_ms']:9.3f} ms")
+        return results
+
+    def print_comparison(self, results):
+        """
+        Prints speedup of median time of every query with composite indexes
+        against foreign key index only.
+
+        :param results: dictionary (index set name: results of measure)
+        :return:
+        """
+        self.stdout.write("Speedup of median (foreign_key / composite):")
+        for name, before in results['foreign_key'].items():
+            after = results['composite'][name]
+            speedup = before['median_ms'] / after['median_ms'] \
+                if after['median_ms'] else float('inf')
+            self.stdout.write(f"  {name:<20}{speedup:9.2f}x")
@@ -0,0 +1,93 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from bot_scorer.metrics import registry, collect_timings
+
+# buckets of number of queries per request
+QUERIES_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+request_duration = registry.histogram(
+    'api_request_duration_seconds', "Time of handling requests",
+    ['view', 'method'])
+requests_total = registry.counter(
+    'api_requests', "Number of handled requests",
+    ['view', 'method', 'status'])
+request_queries = registry.histogram(
+    'api_request_db_queries', "Number of SQL queries per request",
+    ['view'], buckets=QUERIES_BUCKETS)
+request_db_duration = registry.histogram(
+    'api_request_db_duration_seconds', "Time of SQL queries per request",
+    ['view'])
+request_stage_duration = registry.histogram(
+    'api_request_stage_duration_seconds',
+    "Time of stages (serializer, model load, prediction, features' order, "
+    "Twitter API calls) per request", ['view', 'stage'])
+
+
+def get_view_name(request):
+    """
+    Returns name of view which handled request (URL pattern's name, e.g.
+    'snapshot-detail').
+
+    :param request: django.http.HttpRequest
+    :return: string
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+def get_server_timing(timings, duration):
+    """
+    Returns value of Server-Timing header with request's timing breakdown,
+    e.g. 'total;dur=52.1, db;dur=12.0;desc="4 queries", serializer;dur=30.2'.
+
+    :param timings: bot_scorer.metrics.RequestTimings
+    :param duration: float, seconds of whole request
+    :return: string
+    """
+    metrics = [f'total;dur={duration * 1000:.1f}',
+               f'db;dur={timings.db_time * 1000:.1f};'
+               f'desc="{timings.queries} queries"']
+    for stage, seconds in sorted(timings.stages.items()):
+        metrics.append(f'{stage};dur={seconds * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+class MetricsMiddleware:
+    """
+    Records time, SQL queries and time of stages (see bot_scorer.metrics.timed)
+    of every request per view, exposed on metrics endpoint. Requests with
+    X-Timing header get timing breakdown in Server-Timing header (if
+    settings.API_TIMING_HEADER_ENABLED, by default only in debug mode).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with collect_timings() as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(timings.execute_wrapper))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view = get_view_name(request)
+        request_duration.observe(duration, view=view, method=request.method)
+        requests_total.inc(view=view, method=request.method,
+                           status=response.status_code)
+        request_queries.observe(timings.queries, view=view)
+        request_db_duration.observe(timings.db_time, view=view)
+        for stage, seconds in timings.stages.items():
+            request_stage_duration.observe(seconds, view=view, stage=stage)
+
+        if settings.API_TIMING_HEADER_ENABLED and \
+                'HTTP_X_TIMING' in request.META:
+            response['Server-Timing'] = get_server_timing(timings, duration)
+        return response
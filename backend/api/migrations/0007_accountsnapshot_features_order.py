@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_auto_20201211_1152'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountsnapshot',
+            name='features_order',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_accountsnapshot_features_order'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accountsnapshot',
+            index=models.Index(fields=['account', 'date_of_snapshot', 'id'], name='snapshot_account_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.7 on 2026-10-18 15:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_accountsnapshot_account_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accountsnapshot',
+            name='account',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.account'),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 3.1.7 on 2026-10-18 16:20
+
+import hashlib
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PROFILE_FIELDS = ['name', 'location', 'url', 'description']
+
+BATCH_SIZE = 1000
+
+
+def get_digest(profile_data):
+    # the same as api.models.AccountProfile.get_digest
+    values = [profile_data[field] for field in PROFILE_FIELDS]
+    return hashlib.sha1(json.dumps(values).encode()).hexdigest()
+
+
+def move_text_to_profiles(apps, schema_editor):
+    AccountProfile = apps.get_model('api', 'AccountProfile')
+    AccountSnapshot = apps.get_model('api', 'AccountSnapshot')
+    db = schema_editor.connection.alias
+
+    profile_ids = {}
+    last_id = 0
+    while True:
+        batch = list(AccountSnapshot.objects.using(db)
+                     .filter(id__gt=last_id).order_by('id')
+                     .only('id', *PROFILE_FIELDS)[:BATCH_SIZE])
+        if not batch:
+            break
+
+        for snapshot in batch:
+            profile_data = {field: getattr(snapshot, field)
+                            for field in PROFILE_FIELDS}
+            digest = get_digest(profile_data)
+            if digest not in profile_ids:
+                profile_ids[digest] = AccountProfile.objects.using(db) \
+                    .create(digest=digest, **profile_data).id
+            snapshot.profile_id = profile_ids[digest]
+
+        AccountSnapshot.objects.using(db).bulk_update(batch, ['profile'])
+        last_id = batch[-1].id
+
+
+def move_text_to_snapshots(apps, schema_editor):
+    AccountProfile = apps.get_model('api', 'AccountProfile')
+    AccountSnapshot = apps.get_model('api', 'AccountSnapshot')
+    db = schema_editor.connection.alias
+
+    for profile in AccountProfile.objects.using(db).iterator():
+        AccountSnapshot.objects.using(db).filter(profile=profile).update(
+            **{field: getattr(profile, field) for field in PROFILE_FIELDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_accountsnapshot_account_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=40, unique=True)),
+                ('name', models.CharField(max_length=256)),
+                ('location', models.CharField(blank=True, max_length=256)),
+                ('url', models.URLField(blank=True)),
+                ('description', models.CharField(blank=True, max_length=512)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='accountsnapshot',
+            name='profile',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='api.accountprofile'),
+        ),
+        migrations.RunPython(move_text_to_profiles, move_text_to_snapshots),
+        # default lets migration be reversed (name is added back to
+        # existing snapshots)
+        migrations.AlterField(
+            model_name='accountsnapshot',
+            name='name',
+            field=models.CharField(default='', max_length=256),
+        ),
+        migrations.RemoveField(
+            model_name='accountsnapshot',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='accountsnapshot',
+            name='location',
+        ),
+        migrations.RemoveField(
+            model_name='accountsnapshot',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='accountsnapshot',
+            name='url',
+        ),
+        migrations.AlterField(
+            model_name='accountsnapshot',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api.accountprofile'),
+        ),
+    ]
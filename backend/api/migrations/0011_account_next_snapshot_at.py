@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_accountprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='next_snapshot_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_account_next_snapshot_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='lease_owner',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
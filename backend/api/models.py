@@ -1,23 +1,153 @@
+import hashlib
+import json
+
 from django.contrib.auth.models import User
 from django.db import models
 
+# account's text data, stored once per distinct value in AccountProfile and
+# shared by snapshots
+PROFILE_FIELDS = ['name', 'location', 'url', 'description']
+
+# max number of digests in single lookup query of profiles
+PROFILE_LOOKUP_CHUNK_SIZE = 500
+
 
 class Account(models.Model):
     twitter_id = models.PositiveIntegerField(unique=True)
     screen_name = models.CharField(max_length=128)
     users = models.ManyToManyField(User)
+    # when the next snapshot is due (see bot_scorer.scheduler), None - as
+    # soon as possible
+    next_snapshot_at = models.DateTimeField(null=True, blank=True,
+                                            db_index=True)
+    # snapshot worker processing account and when its lease expires (see
+    # bot_scorer.workers)
+    lease_owner = models.CharField(max_length=64, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.screen_name
 
 
-class AccountSnapshot(models.Model):
-    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+class AccountProfile(models.Model):
+    """
+    Account's profile text. Every distinct text is stored once, snapshots
+    with the same text point to the same profile.
+    """
+    digest = models.CharField(max_length=40, unique=True)
 
     name = models.CharField(max_length=256)
     location = models.CharField(max_length=256, blank=True)
     url = models.URLField(blank=True)
     description = models.CharField(max_length=512, blank=True)
+
+    @staticmethod
+    def get_digest(profile_data):
+        """
+        Returns digest identifying profile text.
+
+        :param profile_data: dictionary with PROFILE_FIELDS
+        :return: string
+        """
+        values = [profile_data[field] for field in PROFILE_FIELDS]
+        return hashlib.sha1(json.dumps(values).encode()).hexdigest()
+
+    def __str__(self):
+        return self.name
+
+
+def attach_profiles(snapshots, using=None):
+    """
+    Sets profiles of snapshots with profile text set but not saved yet.
+    Missing profiles are created, existing ones are reused.
+
+    :param snapshots: list of api.models.AccountSnapshot
+    :param using: string, database alias or None
+    :return:
+    """
+    pending = [snapshot for snapshot in snapshots
+               if snapshot._profile_data is not None]
+    if not pending:
+        return
+
+    profiles_data = {}
+    for snapshot in pending:
+        snapshot._profile_digest = AccountProfile.get_digest(
+            snapshot._profile_data)
+        profiles_data.setdefault(snapshot._profile_digest,
+                                 snapshot._profile_data)
+
+    def get_profiles(digests):
+        profiles = {}
+        for i in range(0, len(digests), PROFILE_LOOKUP_CHUNK_SIZE):
+            for profile in AccountProfile.objects.using(using).filter(
+                    digest__in=digests[i:i + PROFILE_LOOKUP_CHUNK_SIZE]):
+                profiles[profile.digest] = profile
+        return profiles
+
+    profiles = get_profiles(list(profiles_data))
+    missing = [digest for digest in profiles_data if digest not in profiles]
+    if missing:
+        # conflicts are ignored, as the same profile could be saved
+        # meanwhile by other process, so profiles are queried again
+        AccountProfile.objects.using(using).bulk_create(
+            [AccountProfile(digest=digest, **profiles_data[digest])
+             for digest in missing], ignore_conflicts=True)
+        profiles.update(get_profiles(missing))
+
+    for snapshot in pending:
+        snapshot.profile = profiles[snapshot._profile_digest]
+        snapshot._profile_data = None
+
+
+class AccountSnapshotQuerySet(models.QuerySet):
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Overrides default method - saves profiles of snapshots first.
+        """
+        objs = list(objs)
+        attach_profiles(objs, using=self.db)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+def profile_property(field):
+    """
+    Returns property of snapshot giving access to field of its profile.
+    Changed text is kept by snapshot until it is saved.
+
+    :param field: string, one of PROFILE_FIELDS
+    :return: property
+    """
+
+    def getter(snapshot):
+        if snapshot._profile_data is not None:
+            return snapshot._profile_data[field]
+        return getattr(snapshot.profile, field)
+
+    def setter(snapshot, value):
+        if snapshot._profile_data is None:
+            if snapshot.profile_id is None:
+                snapshot._profile_data = dict.fromkeys(PROFILE_FIELDS, '')
+            else:
+                snapshot._profile_data = {
+                    name: getattr(snapshot.profile, name)
+                    for name in PROFILE_FIELDS
+                }
+        snapshot._profile_data[field] = value
+
+    return property(getter, setter)
+
+
+class AccountSnapshot(models.Model):
+    # account's lookups use snapshot_account_date_idx (account is its first
+    # column), so separate index of foreign key is not needed
+    account = models.ForeignKey(Account, on_delete=models.CASCADE,
+                                db_index=False)
+
+    # name, location, url and description (see PROFILE_FIELDS) rarely
+    # change, so they are not repeated in every snapshot
+    profile = models.ForeignKey(AccountProfile, on_delete=models.PROTECT)
     created_at = models.DateTimeField()
     statuses_count = models.PositiveIntegerField()
     followers_count = models.PositiveIntegerField()
@@ -31,7 +161,56 @@ class AccountSnapshot(models.Model):
     is_active = models.BooleanField()
     date_of_snapshot = models.DateTimeField(auto_now=True)
     suspended_info = models.CharField(max_length=32, blank=True)
+    # indexes of features from most to least important, calculated once
+    # when snapshot is made (see bot_scorer.views.get_features_order)
+    features_order = models.CharField(max_length=8, blank=True, default='')
+
+    objects = AccountSnapshotQuerySet.as_manager()
+
+    name = profile_property('name')
+    location = profile_property('location')
+    url = profile_property('url')
+    description = profile_property('description')
+
+    class Meta:
+        indexes = [
+            # account's snapshots filtered by date and paginated by
+            # (date_of_snapshot, id)
+            models.Index(fields=['account', 'date_of_snapshot', 'id'],
+                         name='snapshot_account_date_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        # profile text set, but not saved yet (see attach_profiles)
+        self._profile_data = None
+        super().__init__(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        """
+        Overrides default method - saves profile of snapshot first.
+        """
+        attach_profiles([self], using=kwargs.get('using'))
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.account.screen_name} " \
                f"{self.date_of_snapshot.strftime('%d-%m-%Y %H:%M')}"
+
+
+def delete_accounts(accounts):
+    """
+    Deletes accounts with their snapshots and profiles which are no longer
+    used by any snapshot (profiles are protected, so they are not deleted
+    with snapshots).
+
+    :param accounts: django.db.models.QuerySet of api.models.Account
+    :return:
+    """
+    profile_ids = list(AccountSnapshot.objects.filter(account__in=accounts)
+                       .values_list('profile_id', flat=True).distinct())
+    accounts.delete()
+    for i in range(0, len(profile_ids), PROFILE_LOOKUP_CHUNK_SIZE):
+        AccountProfile.objects.filter(
+            id__in=profile_ids[i:i + PROFILE_LOOKUP_CHUNK_SIZE],
+            accountsnapshot__isnull=True,
+        ).delete()
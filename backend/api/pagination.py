@@ -0,0 +1,51 @@
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class SnapshotCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination of account's snapshots, newest first.
+    Response data is a list of snapshots (as without pagination), links to
+    the next and previous pages are sent in Link header. Used only when
+    request asks for it (see is_requested).
+    """
+    ordering = ('-date_of_snapshot', '-id')
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = settings.API_SNAPSHOT_PAGE_SIZE
+        self.max_page_size = settings.API_SNAPSHOT_MAX_PAGE_SIZE
+
+    def is_requested(self, request):
+        """
+        Checks if request asks for paginated snapshots (has page_size or
+        cursor param).
+
+        :param request: rest_framework.request.Request
+        :return: bool
+        """
+        return self.page_size_query_param in request.query_params or \
+            self.cursor_query_param in request.query_params
+
+    def get_paginated_response(self, data):
+        """
+        Overrides default method - returns list of snapshots with Link
+        header.
+
+        :param data: list
+        :return: rest_framework.response.Response
+        """
+        links = []
+        next_link = self.get_next_link()
+        previous_link = self.get_previous_link()
+        if next_link is not None:
+            links.append(f'<{next_link}>; rel="next"')
+        if previous_link is not None:
+            links.append(f'<{previous_link}>; rel="prev"')
+
+        response = Response(data=data)
+        if links:
+            response['Link'] = ', '.join(links)
+        return response
@@ -0,0 +1,62 @@
+from rest_framework.permissions import BasePermission
+
+from .models import Account, AccountSnapshot
+
+# table binding accounts with users who have them on their lists
+AccountUsers = Account.users.through
+
+
+def is_account_owner(user, account_id):
+    """
+    Checks if account is on user's list with single EXISTS query on the
+    account-user table (uses its unique (account, user) index, so it costs
+    the same no matter how many users have the account).
+
+    :param user: django.contrib.auth.models.User
+    :param account_id: int
+    :return: bool
+    """
+    return AccountUsers.objects.filter(account_id=account_id,
+                                       user_id=user.id).exists()
+
+
+def get_owners_count(account_id):
+    """
+    Returns number of users who have account on their list (counted in the
+    database, users are not loaded).
+
+    :param account_id: int
+    :return: int
+    """
+    return AccountUsers.objects.filter(account_id=account_id).count()
+
+
+def get_account_id(obj):
+    """
+    Returns id of account or of snapshot's account.
+
+    :param obj: api.models.Account or api.models.AccountSnapshot
+    :return: int
+    """
+    if isinstance(obj, AccountSnapshot):
+        return obj.account_id
+    return obj.id
+
+
+class IsAccountOwner(BasePermission):
+    """
+    Allows access to account (or its snapshot) only if it is on the logged
+    user's list. Results are remembered for the request, so checking many
+    objects of the same account costs one query.
+    """
+    message = "Account is not on the user's list"
+
+    def has_object_permission(self, request, view, obj):
+        account_id = get_account_id(obj)
+        owned_accounts = getattr(request, '_owned_accounts', None)
+        if owned_accounts is None:
+            owned_accounts = request._owned_accounts = {}
+        if account_id not in owned_accounts:
+            owned_accounts[account_id] = is_account_owner(request.user,
+                                                          account_id)
+        return owned_accounts[account_id]
@@ -1,15 +1,41 @@
 from django.contrib.auth.models import User
-from rest_framework.serializers import ModelSerializer, ValidationError, \
-    CharField, SerializerMethodField
+from django.db.models import Manager
+from rest_framework.serializers import ModelSerializer, ListSerializer, \
+    ValidationError, CharField, SerializerMethodField
 from .models import AccountSnapshot, Account
 
-from bot_scorer.views import get_most_important_features, get_data_change
+from bot_scorer.views import get_snapshot_features, \
+    get_snapshot_data_change, fill_features_orders
 
 import django.contrib.auth.password_validation as validators
 
 
+class AccountSnapshotListSerializer(ListSerializer):
+    """
+    Serializes many snapshots, features' importance order missing in any of
+    them is calculated for all at once.
+    """
+
+    def to_representation(self, data):
+        """
+        Overrides default method - fills missing features' orders before
+        serializing snapshots.
+
+        :param data: list or django.db.models.QuerySet
+        :return: list
+        """
+        snapshots = data.all() if isinstance(data, Manager) else data
+        snapshots = list(snapshots)
+        fill_features_orders(snapshots)
+        return super(AccountSnapshotListSerializer, self) \
+            .to_representation(snapshots)
+
+
 class AccountSnapshotAllSerializer(ModelSerializer):
-    """Serializes account's all snapshots (basic snapshot data)."""
+    """
+    Serializes account's all snapshots (basic snapshot data). Snapshots
+    should be queried with select_related('account', 'profile').
+    """
 
     features = SerializerMethodField()  # features are sorted from most to
                                         # least important
@@ -21,6 +47,7 @@ class AccountSnapshotAllSerializer(ModelSerializer):
             'id', 'name', 'screen_name', 'features', 'date_of_snapshot',
             'bot_score', 'is_active', 'account', 'suspended_info',
         ]
+        list_serializer_class = AccountSnapshotListSerializer
 
     def get_features(self, obj):
         """Returns snapshot's features sorted from most to least important.
@@ -28,17 +55,7 @@ class AccountSnapshotAllSerializer(ModelSerializer):
         :param obj: object
         :return: dict
         """
-        features = {
-            'statuses_count': obj.statuses_count,
-            'followers_count': obj.followers_count,
-            'friends_count': obj.friends_count,
-            'favourites_count': obj.favourites_count,
-            'listed_count': obj.listed_count,
-            'default_profile': obj.default_profile,
-            'verified': obj.verified,
-            'protected': obj.protected,
-        }
-        return get_most_important_features(features_input=features)
+        return get_snapshot_features(obj)
 
     def get_screen_name(self, obj):
         """Returns snapshot's account's screen name.
@@ -46,12 +63,14 @@ class AccountSnapshotAllSerializer(ModelSerializer):
         :param obj: object
         :return: string
         """
-        account = Account.objects.get(accountsnapshot=obj)
-        return account.screen_name
+        return obj.account.screen_name
 
 
 class AccountSnapshotDetailSerializer(ModelSerializer):
-    """Serializes account's specific snapshot (detailed snapshot data)."""
+    """
+    Serializes account's specific snapshot (detailed snapshot data).
+    Snapshot should be queried with select_related('account', 'profile').
+    """
     twitter_id = SerializerMethodField()
     features = SerializerMethodField()   # features are sorted from most to
                                          # least important
@@ -73,8 +92,7 @@ class AccountSnapshotDetailSerializer(ModelSerializer):
         :param obj: object
         :return: int
         """
-        account = Account.objects.get(accountsnapshot=obj)
-        return account.twitter_id
+        return obj.account.twitter_id
 
     def get_screen_name(self, obj):
         """
@@ -83,8 +101,7 @@ class AccountSnapshotDetailSerializer(ModelSerializer):
         :param obj: object
         :return: string
         """
-        account = Account.objects.get(accountsnapshot=obj)
-        return account.screen_name
+        return obj.account.screen_name
 
     def get_features(self, obj):
         """Returns snapshot's features sorted from most to least important.
@@ -92,17 +109,7 @@ class AccountSnapshotDetailSerializer(ModelSerializer):
         :param obj: object
         :return: dict
         """
-        features = {
-            'statuses_count': obj.statuses_count,
-            'followers_count': obj.followers_count,
-            'friends_count': obj.friends_count,
-            'favourites_count': obj.favourites_count,
-            'listed_count': obj.listed_count,
-            'default_profile': obj.default_profile,
-            'verified': obj.verified,
-            'protected': obj.protected,
-        }
-        return get_most_important_features(features)
+        return get_snapshot_features(obj)
 
     def get_change(self, obj):
         """Returns snapshot's features change info.
@@ -110,7 +117,7 @@ class AccountSnapshotDetailSerializer(ModelSerializer):
         :param obj: object
         :return: dict
         """
-        return get_data_change(obj.id)
+        return get_snapshot_data_change(obj)
 
 
 class AccountSerializer(ModelSerializer):
@@ -1,14 +1,30 @@
 import datetime
-
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from django.test import SimpleTestCase, TestCase, override_settings
+
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 
 from django.contrib.auth.models import User
 
-from api.models import AccountSnapshot, Account
+from api.management.commands import benchmark_api
+from api.middleware import request_duration
+from api.models import AccountSnapshot, Account, AccountProfile
+from bot_scorer.cache import get_snapshot_cache
+from bot_scorer.fake_twitter import FakeTwitterServer
+from bot_scorer.twitter import reset_client
 
 
 class APIUserTests(APITestCase):
@@ -141,8 +157,109 @@ class APIAccountTests(APITestCase):
         response = self.client.delete(url, **{'pk': 1, 'HTTP_AUTHORIZATION':
             f'Token {self.token}'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Account.objects.filter(id=1).exists())
+
+    def test_account_delete_shared(self):
+        """Tries to delete account which is on other user's list too."""
+        user2 = User.objects.create_user(username="user2",
+                                         password="some_password")
+        self.account1.users.add(user2)
+        url = reverse('account-detail', kwargs={'pk': 1})
+
+        response = self.client.delete(url, **{'HTTP_AUTHORIZATION':
+                                                  f'Token {self.token}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user2], list(self.account1.users.all()))
+
+    def test_account_delete_not_owned(self):
+        """Tries to delete account which is not on the user's list."""
+        user2 = User.objects.create_user(username="user2",
+                                         password="some_password")
+        account4 = Account.objects.create(id=4, twitter_id=4,
+                                          screen_name="name4")
+        account4.users.add(user2)
+        url = reverse('account-detail', kwargs={'pk': 4})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url, **{'HTTP_AUTHORIZATION':
+                                                      f'Token {self.token}'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertTrue(Account.objects.filter(id=4).exists())
+        # token, account and single ownership check
+        self.assertEqual(3, len(queries))
+
+    def test_user_delete_removes_not_shared_accounts(self):
+        """Deletes user - only accounts of no other user are deleted."""
+        user2 = User.objects.create_user(username="user2",
+                                         password="some_password")
+        self.account2.users.add(user2)
+
+        self.user.delete()
+        self.assertEqual([2], list(Account.objects.values_list('id',
+                                                               flat=True)))
 
 
+    def test_account_list_timing_header(self):
+        """Checks timing breakdown of request asked with X-Timing header."""
+        url = reverse('account-list')
+        count = request_duration.get_count(view='account-list', method='GET')
+
+        response = self.client.get(url, **{'HTTP_AUTHORIZATION':
+                                               f'Token {self.token}'})
+        self.assertNotIn('Server-Timing', response)
+
+        with override_settings(API_TIMING_HEADER_ENABLED=True):
+            response = self.client.get(url, HTTP_X_TIMING='1', **{
+                'HTTP_AUTHORIZATION': f'Token {self.token}'})
+        timing = response['Server-Timing']
+        self.assertTrue(timing.startswith('total;dur='))
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('serializer;dur=', timing)
+        self.assertEqual(count + 2, request_duration.get_count(
+            view='account-list', method='GET'))
+
+        with override_settings(API_TIMING_HEADER_ENABLED=False):
+            response = self.client.get(url, HTTP_X_TIMING='1', **{
+                'HTTP_AUTHORIZATION': f'Token {self.token}'})
+        self.assertNotIn('Server-Timing', response)
+
+    def test_metrics(self):
+        """Checks metrics in Prometheus text format."""
+        self.client.get(reverse('account-list'), **{
+            'HTTP_AUTHORIZATION': f'Token {self.token}'})
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        self.assertIn('# TYPE api_request_duration_seconds histogram',
+                      content)
+        self.assertIn('api_request_duration_seconds_bucket{view="account-list"'
+                      ',method="GET",le="+Inf"}', content)
+        self.assertIn('api_requests_total{view="account-list",method="GET",'
+                      'status="200"}', content)
+        self.assertIn('api_request_db_queries_count{view="account-list"}',
+                      content)
+        self.assertIn('api_request_stage_duration_seconds_count{'
+                      'view="account-list",stage="serializer"}', content)
+
+    def test_metrics_forbidden(self):
+        """Checks if metrics are hidden from not allowed clients."""
+        url = reverse('metrics')
+
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(API_METRICS_TOKEN='secret'):
+            response = self.client.get(url, REMOTE_ADDR='10.0.0.1',
+                                       HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code,
+                             status.HTTP_403_FORBIDDEN)
+            response = self.client.get(url, REMOTE_ADDR='10.0.0.1',
+                                       HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 class APIAccountSnapshot(APITestCase):
     """Tests accounts's API endpoints."""
 
@@ -207,6 +324,8 @@ class APIAccountSnapshot(APITestCase):
         AccountSnapshot.objects.filter(pk=self.snapshot2.pk). \
             update(date_of_snapshot=date2)
 
+        get_snapshot_cache().clear()
+
     def test_accountsnapshot_list(self):
         """Tries to list all snapshots of specific account."""
         url = reverse('snapshot-detail', kwargs={'pk': 1})
@@ -214,7 +333,107 @@ class APIAccountSnapshot(APITestCase):
         response = self.client.get(url, **{'HTTP_AUTHORIZATION':
                                                f'Token {self.token}'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        # oldest first and not paginated without page_size or cursor
+        self.assertEqual([self.snapshot1.id, self.snapshot2.id],
+                         [snapshot['id'] for snapshot in response.data])
+        self.assertNotIn('Link', response)
+
+    def test_accountsnapshot_list_paginated(self):
+        """Tries to list snapshots page by page."""
+        url = reverse('snapshot-detail', kwargs={'pk': 1})
+
+        response = self.client.get(url, {'page_size': 1},
+                                   **{'HTTP_AUTHORIZATION':
+                                          f'Token {self.token}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([self.snapshot2.id],
+                         [snapshot['id'] for snapshot in response.data])
+        self.assertIn('rel="next"', response['Link'])
+
+        next_url = response['Link'].split('>')[0].lstrip('<')
+        response = self.client.get(next_url, **{'HTTP_AUTHORIZATION':
+                                                    f'Token {self.token}'})
+        self.assertEqual([self.snapshot1.id],
+                         [snapshot['id'] for snapshot in response.data])
+        self.assertNotIn('rel="next"', response['Link'])
+
+    def test_accountsnapshot_list_date_range(self):
+        """Tries to list snapshots made in specific time range."""
+        url = reverse('snapshot-detail', kwargs={'pk': 1})
+        since = datetime.date.today() - datetime.timedelta(days=4)
+        until = datetime.date.today() - datetime.timedelta(days=4)
+
+        response = self.client.get(url, {'since': since.isoformat()},
+                                   **{'HTTP_AUTHORIZATION':
+                                          f'Token {self.token}'})
+        self.assertEqual([self.snapshot2.id],
+                         [snapshot['id'] for snapshot in response.data])
+
+        response = self.client.get(url, {'until': until.isoformat()},
+                                   **{'HTTP_AUTHORIZATION':
+                                          f'Token {self.token}'})
+        self.assertEqual([self.snapshot1.id],
+                         [snapshot['id'] for snapshot in response.data])
+
+        response = self.client.get(url, {'since': 'yesterday'},
+                                   **{'HTTP_AUTHORIZATION':
+                                          f'Token {self.token}'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_accountsnapshot_list_query_count(self):
+        """Checks if number of queries does not depend on snapshots count."""
+        url = reverse('snapshot-detail', kwargs={'pk': 1})
+
+        with CaptureQueriesContext(connection) as small_history:
+            self.client.get(url, **{'HTTP_AUTHORIZATION':
+                                        f'Token {self.token}'})
+
+        AccountSnapshot.objects.bulk_create([
+            AccountSnapshot(
+                account=self.account1, name='snapshot', location='',
+                url='', description='', created_at='0001-01-01T00:00Z',
+                statuses_count=i, followers_count=1, friends_count=1,
+                favourites_count=1, listed_count=1, default_profile=False,
+                verified=False, protected=False, bot_score=0.5,
+                is_active=True, suspended_info='')
+            for i in range(998)
+        ])
+
+        with CaptureQueriesContext(connection) as big_history:
+            response = self.client.get(url, **{'HTTP_AUTHORIZATION':
+                                                   f'Token {self.token}'})
+
+        self.assertEqual(1000, len(response.data))
+        self.assertEqual('name1', response.data[-1]['screen_name'])
+        self.assertEqual(len(small_history), len(big_history))
+
+    def test_accountsnapshot_series(self):
+        """Tries to get downsampled time series of account's data."""
+        url = reverse('snapshot-series', kwargs={'pk': 1})
+
+        response = self.client.get(url, **{'HTTP_AUTHORIZATION':
+                                               f'Token {self.token}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([0.45, 0.50], response.data['bot_score'])
+        self.assertEqual(2, len(response.data['date']))
+
+        response = self.client.get(url, {'bucket': 'month'},
+                                   **{'HTTP_AUTHORIZATION':
+                                          f'Token {self.token}'})
+        self.assertEqual('month', response.data['bucket'])
+        self.assertEqual(len(response.data['date']),
+                         len(response.data['friends_count']))
+        self.assertIn(len(response.data['date']), (1, 2))
+
+        response = self.client.get(url, {'bucket': 'year'},
+                                   **{'HTTP_AUTHORIZATION':
+                                          f'Token {self.token}'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {'bucket': 'day', 'mode': 'lttb'},
+                                   **{'HTTP_AUTHORIZATION':
+                                          f'Token {self.token}'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_accountsnapshot_detail(self):
         """Tries to list details of specific snapshot."""
@@ -229,9 +448,166 @@ class APIAccountSnapshot(APITestCase):
         """Tries to get single snapshot based on current Twitter data."""
         url = reverse('snapshot-single')
 
-        response = self.client.get(url, {'screen_name': 'BarackObama'},
-                                   **{'HTTP_AUTHORIZATION':
-                                          f'Token {self.token}'})
+        # local stand-in of Twitter API
+        with FakeTwitterServer() as server, \
+                override_settings(BOT_SCORER_TWITTER_API_URL=server.url):
+            reset_client()
+            try:
+                response = self.client.get(url,
+                                           {'screen_name': 'BarackObama'},
+                                           **{'HTTP_AUTHORIZATION':
+                                                  f'Token {self.token}'})
+            finally:
+                reset_client()
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(8, len(response.data['features']))
+
+    def test_accountsnapshot_single_cached(self):
+        """Tries to get the same single snapshot twice - from the cache."""
+        url = reverse('snapshot-single')
+        snapshot_dict = {
+            'twitter_id': 1, 'screen_name': 'Name1', 'name': 'name1',
+            'location': '', 'url': '', 'description': '',
+            'created_at': '2020-01-01T00:00:00Z', 'statuses_count': 1,
+            'followers_count': 1, 'friends_count': 1, 'favourites_count': 1,
+            'listed_count': 1, 'default_profile': False, 'verified': False,
+            'protected': False, 'bot_score': 0.5, 'is_active': True,
+            'suspended_info': '',
+        }
+
+        with mock.patch('bot_scorer.views.make_snapshot',
+                        return_value=snapshot_dict) as make_snapshot:
+            response1 = self.client.get(url, {'screen_name': 'Name1'},
+                                        **{'HTTP_AUTHORIZATION':
+                                               f'Token {self.token}'})
+            response2 = self.client.get(url, {'screen_name': '@name1'},
+                                        **{'HTTP_AUTHORIZATION':
+                                               f'Token {self.token}'})
+
+        self.assertEqual(1, make_snapshot.call_count)
+        self.assertEqual('MISS', response1['X-Cache'])
+        self.assertEqual('HIT', response2['X-Cache'])
+        self.assertEqual(response1.data, response2.data)
+        self.assertEqual(0.5, response2.data['bot_score'])
+        self.assertEqual(8, len(response2.data['features']))
+
 
+class AccountProfileTests(TestCase):
+    """Tests profile texts shared by snapshots"""
 
+    def setUp(self):
+        self.account = Account.objects.create(twitter_id=1,
+                                              screen_name="name1")
+
+    def make_snapshot(self, **kwargs):
+        """Returns not saved snapshot of account with given data."""
+        data = {
+            'account': self.account, 'name': 'name1', 'location': '',
+            'url': '', 'description': 'description', 'created_at':
+                '2020-01-01T00:00:00Z', 'statuses_count': 1,
+            'followers_count': 1, 'friends_count': 1, 'favourites_count': 1,
+            'listed_count': 1, 'default_profile': False, 'verified': False,
+            'protected': False, 'bot_score': 0.5, 'is_active': True,
+        }
+        data.update(kwargs)
+        return AccountSnapshot(**data)
+
+    def test_profile_text_shared(self):
+        """Saves snapshots with the same text - it is stored once."""
+        self.make_snapshot().save()
+        AccountSnapshot.objects.bulk_create(
+            [self.make_snapshot(followers_count=i) for i in range(5)] +
+            [self.make_snapshot(description='changed')])
+
+        self.assertEqual(2, AccountProfile.objects.count())
+        descriptions = [snapshot.description for snapshot in
+                        AccountSnapshot.objects.select_related('profile')
+                        .order_by('id')]
+        self.assertEqual(['description'] * 6 + ['changed'], descriptions)
+
+    def test_profile_text_changed(self):
+        """Changes text of saved snapshot - old profile is not modified."""
+        snapshot = self.make_snapshot()
+        snapshot.save()
+        other = self.make_snapshot()
+        other.save()
+
+        snapshot = AccountSnapshot.objects.get(id=snapshot.id)
+        snapshot.name = 'new name'
+        snapshot.save()
+
+        snapshot.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual('new name', snapshot.name)
+        self.assertEqual('description', snapshot.description)
+        self.assertEqual('name1', other.name)
+
+    def test_unused_profiles_deleted(self):
+        """Deletes user - profiles of deleted accounts' snapshots are
+        deleted unless other snapshot uses them."""
+        user = User.objects.create_user(username="user1",
+                                        password="some_password")
+        self.account.users.add(user)
+        other = Account.objects.create(twitter_id=2, screen_name="name2")
+        self.make_snapshot().save()
+        self.make_snapshot(description='changed').save()
+        self.make_snapshot(account=other).save()
+
+        user.delete()
+
+        self.assertFalse(Account.objects.filter(id=self.account.id).exists())
+        self.assertEqual(['description'], list(
+            AccountProfile.objects.values_list('description', flat=True)))
+
+
+class BenchmarkSnapshotQueriesTests(SimpleTestCase):
+    """Tests benchmark of snapshots' queries"""
+
+    def test_benchmark_snapshot_queries(self):
+        """Runs benchmark on tiny seeded database."""
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        call_command('benchmark_snapshot_queries', accounts=5, snapshots=3,
+                     repeat=2, json_path=path, stdout=io.StringIO())
+
+        with open(path) as file:
+            report = json.load(file)
+        self.assertEqual({'foreign_key', 'composite'},
+                         set(report['results']))
+        self.assertIn('latest_snapshot', report['results']['composite'])
+
+
+class BenchmarkAPITests(TestCase):
+    """Tests benchmark of API endpoints"""
+
+    def test_benchmark_api(self):
+        """Runs API benchmark on tiny seeded data within query budgets."""
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        call_command('benchmark_api', accounts=3, users=2, snapshots=5,
+                     repeat=2, latency_factor=100, json_path=path,
+                     stdout=io.StringIO())
+
+        with open(path) as file:
+            report = json.load(file)
+        self.assertEqual(set(benchmark_api.BUDGETS), set(report['results']))
+        self.assertEqual([], report['failures'])
+        self.assertGreater(
+            report['results']['snapshot_retrieve']['response_bytes'], 0)
+        # data is seeded to temporary database
+        self.assertFalse(Account.objects.exists())
+
+    def test_benchmark_api_query_budget_exceeded(self):
+        """Runs API benchmark with too low query budget - it fails."""
+        budgets = dict(benchmark_api.BUDGETS,
+                       account_list={'queries': 0, 'p95_ms': 1000})
+        with mock.patch.object(benchmark_api, 'BUDGETS', budgets):
+            with self.assertRaisesMessage(CommandError, 'account_list: 2 '
+                                                        'queries (budget 0)'):
+                call_command('benchmark_api', accounts=1, users=1,
+                             snapshots=1, repeat=1, latency_factor=100,
+                             stdout=io.StringIO())
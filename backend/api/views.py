@@ -1,7 +1,15 @@
+import datetime
+
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
 from django.db.models.signals import pre_delete
+from django.db import transaction
 from django.db.models import ObjectDoesNotExist
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
 
 from rest_framework import status
 from rest_framework.viewsets import ViewSet
@@ -15,20 +23,90 @@ from rest_framework.authtoken.models import Token
 
 from tweepy import TweepError
 
-from .models import Account, AccountSnapshot
+from .models import Account, AccountSnapshot, delete_accounts
+from .pagination import SnapshotCursorPagination
+from .permissions import IsAccountOwner, AccountUsers, is_account_owner, \
+    get_owners_count
 from .serializers import AccountSnapshotAllSerializer, \
     AccountSnapshotDetailSerializer, AccountSerializer, \
     UserRegistrationSerializer
 
-from bot_scorer.views import make_snapshot, get_most_important_features
+from bot_scorer.cache import get_cached_single_snapshot
+from bot_scorer.metrics import timed, registry
+from bot_scorer.series import get_snapshot_series, BUCKETS
+from bot_scorer.views import get_error_message
+
+
+def parse_date_param(value, end_of_day=False):
+    """
+    Parses date or datetime from request's param. Dates without time mean
+    start of the day or, with end_of_day, start of the next day.
+
+    :param value: string or None
+    :param end_of_day: bool
+    :return: datetime.datetime or None
+    """
+    if value is None or value == '':
+        return None
+
+    date_time = parse_datetime(value)
+    if date_time is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f"Incorrect date: {value}")
+        if end_of_day:
+            date += datetime.timedelta(days=1)
+        date_time = datetime.datetime.combine(date, datetime.time())
+
+    if timezone.is_naive(date_time):
+        date_time = timezone.make_aware(date_time)
+    return date_time
+
+
+def is_metrics_client(request):
+    """
+    Checks if request comes from address allowed to read metrics
+    (settings.API_METRICS_ALLOWED_IPS) or has metrics token
+    (settings.API_METRICS_TOKEN) in Authorization header.
+
+    :param request: django.http.HttpRequest
+    :return: bool
+    """
+    if request.META.get('REMOTE_ADDR') in settings.API_METRICS_ALLOWED_IPS:
+        return True
+    token = settings.API_METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(authorization,
+                                                 f'Bearer {token}')
+
+
+def metrics(request):
+    """
+    Returns metrics of the process (requests, SQL queries, bot_scorer's
+    stages) in Prometheus text format, only to allowed clients (see
+    is_metrics_client).
+
+    :param request: django.http.HttpRequest
+    :return: django.http.HttpResponse
+    """
+    if not is_metrics_client(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
 
 
 class AccountSnapshotViewSet(ViewSet):
     """Handles snapshots access."""
+    permission_classes = [IsAuthenticated, IsAccountOwner]
 
     def retrieve(self, request, pk=None):
         """
-        Returns all snapshots for specific user (pk = account id).
+        Returns all snapshots for specific user (pk = account id), oldest
+        first. With page_size or cursor param snapshots are paginated newest
+        first instead (see api.pagination.SnapshotCursorPagination). Optional
+        request's params: since, until (ISO date or datetime), page_size,
+        cursor.
 
         :param request: rest_framework.request.Request
         :param pk: int
@@ -41,14 +119,83 @@ class AccountSnapshotViewSet(ViewSet):
             return Response(data={'message': "Account not found"},
                             status=status.HTTP_404_NOT_FOUND)
         # checks if account is on logged user's list - permissions
-        users = User.objects.all().filter(account=account)
-        if request.user not in users:
-            return Response(data={'message': "Account is not on the user's list"},
-                            status=status.HTTP_403_FORBIDDEN)
-        else:
-            snapshots = AccountSnapshot.objects.all().filter(account=account_id)
-            serializer = AccountSnapshotAllSerializer(snapshots, many=True)
-            return Response(data=serializer.data, status=status.HTTP_200_OK)
+        self.check_object_permissions(request, account)
+
+        try:
+            since = parse_date_param(request.query_params.get('since'))
+            until = parse_date_param(request.query_params.get('until'),
+                                     end_of_day=True)
+        except ValueError:
+            return Response(data={'message': "Incorrect date"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        snapshots = AccountSnapshot.objects.all() \
+            .filter(account=account_id).select_related('account', 'profile')
+        if since is not None:
+            snapshots = snapshots.filter(date_of_snapshot__gte=since)
+        if until is not None:
+            snapshots = snapshots.filter(date_of_snapshot__lt=until)
+
+        paginator = SnapshotCursorPagination()
+        if not paginator.is_requested(request):
+            serializer = AccountSnapshotAllSerializer(
+                snapshots.order_by('date_of_snapshot', 'id'), many=True)
+            with timed('serializer'):
+                data = serializer.data
+            return Response(data=data, status=status.HTTP_200_OK)
+
+        page = paginator.paginate_queryset(snapshots, request, view=self)
+        serializer = AccountSnapshotAllSerializer(page, many=True)
+        with timed('serializer'):
+            data = serializer.data
+        return paginator.get_paginated_response(data)
+
+    @action(detail=True, methods=['get'])
+    def series(self, request, pk=None):
+        """
+        Returns account's bot score, followers and friends count over time
+        as parallel lists downsampled on the server (pk = account id).
+        Optional request's params: points (default 500), bucket (day, week,
+        month, only in bucket mode), mode (bucket or lttb), since, until.
+
+        :param request: rest_framework.request.Request
+        :param pk: int
+        :return: rest_framework.response.Response
+        """
+        account_id = pk
+        try:
+            account = Account.objects.get(id=account_id)
+        except ObjectDoesNotExist:
+            return Response(data={'message': "Account not found"},
+                            status=status.HTTP_404_NOT_FOUND)
+        # checks if account is on logged user's list - permissions
+        self.check_object_permissions(request, account)
+
+        try:
+            since = parse_date_param(request.query_params.get('since'))
+            until = parse_date_param(request.query_params.get('until'),
+                                     end_of_day=True)
+            points = int(request.query_params.get('points', 500))
+        except ValueError:
+            return Response(data={'message': "Incorrect params"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        bucket = request.query_params.get('bucket')
+        mode = request.query_params.get('mode', 'bucket')
+        if points < 1 or mode not in ('bucket', 'lttb') or \
+                (bucket is not None and bucket not in BUCKETS) or \
+                (bucket is not None and mode == 'lttb'):
+            return Response(data={'message': "Incorrect params"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        snapshots = AccountSnapshot.objects.filter(account=account_id)
+        if since is not None:
+            snapshots = snapshots.filter(date_of_snapshot__gte=since)
+        if until is not None:
+            snapshots = snapshots.filter(date_of_snapshot__lt=until)
+
+        series = get_snapshot_series(snapshots, points=points, bucket=bucket,
+                                     mode=mode)
+        return Response(data=series, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['get'])
     def details(self, request, pk=None):
@@ -62,26 +209,27 @@ class AccountSnapshotViewSet(ViewSet):
         snapshot_id = pk
         # checks if snapshot exists
         try:
-            snapshot = AccountSnapshot.objects.get(id=snapshot_id)
+            snapshot = AccountSnapshot.objects \
+                .select_related('account', 'profile').get(id=snapshot_id)
         except ObjectDoesNotExist:
             return Response(data={'message': "Snapshot not found"},
                             status=status.HTTP_404_NOT_FOUND)
         # checks if snapshot's account is on logged user's list
-        account = Account.objects.get(accountsnapshot=snapshot)
-        users = User.objects.all().filter(account=account)
-        if request.user not in users:
-            return Response(data={'message': "Account is not on the user's list"},
-                            status=status.HTTP_403_FORBIDDEN)
-        else:
-            serializer = AccountSnapshotDetailSerializer(snapshot)
-            return Response(data=serializer.data, status=status.HTTP_200_OK)
+        self.check_object_permissions(request, snapshot)
+
+        serializer = AccountSnapshotDetailSerializer(snapshot)
+        with timed('serializer'):
+            data = serializer.data
+        return Response(data=data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['get'])
     def single(self, request):
         """
         Returns current snapshot of specific account. Account's screen name
         needs to be provided as request's param
-        (screen_name).
+        (screen_name). Snapshots are cached for a while (see
+        bot_scorer.cache), X-Cache header of response is HIT, MISS or
+        COALESCED (result of concurrent request for the same account).
 
         :param request: rest_framework.request.Request
         :return: rest_framework.response.Response
@@ -91,45 +239,27 @@ class AccountSnapshotViewSet(ViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
         else:
             screen_name = request.query_params['screen_name']
+
+        # the same account checked recently is returned from the cache,
+        # concurrent requests for the same account share one fetch
         try:
-            snapshot_dict = make_snapshot(screen_name=screen_name)
+            output_dict, cache_status = get_cached_single_snapshot(
+                screen_name)
         except TweepError as e:
-            return Response(data={'message': e.args[0][0]['message']},
+            return Response(data={'message': get_error_message(e)},
                             status=status.HTTP_200_OK)
         except ValueError as e:
             return Response(data={'message': "Incorrect screen name"},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        features = {
-            'statuses_count': snapshot_dict['statuses_count'],
-            'followers_count': snapshot_dict['followers_count'],
-            'friends_count': snapshot_dict['friends_count'],
-            'favourites_count': snapshot_dict['favourites_count'],
-            'listed_count': snapshot_dict['listed_count'],
-            'default_profile': snapshot_dict['default_profile'],
-            'verified': snapshot_dict['verified'],
-            'protected': snapshot_dict['protected'],
-        }
-
-        output_dict = {
-            'twitter_id': snapshot_dict['twitter_id'],
-            'name': snapshot_dict['name'],
-            'screen_name': snapshot_dict['screen_name'],
-            'location': snapshot_dict['location'],
-            'url': snapshot_dict['url'],
-            'description': snapshot_dict['description'],
-            'created_at': snapshot_dict['created_at'],
-            'features': get_most_important_features(features),
-            'bot_score': snapshot_dict['bot_score'],
-            'is_active': snapshot_dict['is_active'],
-            'suspended_info': snapshot_dict['suspended_info'],
-        }
-
-        return Response(data=output_dict, status=status.HTTP_200_OK)
+        response = Response(data=output_dict, status=status.HTTP_200_OK)
+        response['X-Cache'] = cache_status
+        return response
 
 
 class AccountViewSet(ViewSet):
     """Handles accounts access."""
+    permission_classes = [IsAuthenticated, IsAccountOwner]
 
     def list(self, request):
         """
@@ -141,7 +271,9 @@ class AccountViewSet(ViewSet):
         accounts = Account.objects.all().filter(users=request.user) \
             .order_by('screen_name')
         serializer = AccountSerializer(accounts, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        with timed('serializer'):
+            data = serializer.data
+        return Response(data=data, status=status.HTTP_200_OK)
 
     def create(self, request):
         """
@@ -171,8 +303,7 @@ class AccountViewSet(ViewSet):
                 return Response(data=serializer.errors,
                                 status=status.HTTP_400_BAD_REQUEST)
             # checks if account is already on the user's list
-            users = User.objects.all().filter(account=account)
-            if user in users:
+            if is_account_owner(user, account.id):
                 return Response(data={'message': 'Account is already on the list'},
                                 status=status.HTTP_400_BAD_REQUEST)
             else:
@@ -189,24 +320,20 @@ class AccountViewSet(ViewSet):
         :return: rest_framework.response.Response
         """
         id_account = pk
-        print(pk)
         try:
             account = Account.objects.get(id=id_account)
         except ObjectDoesNotExist:
             return Response(data={'message': 'Account not found'},
                             status=status.HTTP_404_NOT_FOUND)
-        users = User.objects.all().filter(account=account)
         # checks if account is on logged user's list
-        if request.user not in users:
-            return Response(data={'message': "Account is not on the user's list"},
-                            status=status.HTTP_403_FORBIDDEN)
-        # checks if logged user is not only user with this specific account
-        # on his list
-        elif len(users) != 1:
-            account.users.remove(request.user)
-        else:
+        self.check_object_permissions(request, account)
+
+        with transaction.atomic():
             account.users.remove(request.user)
-            account.delete()
+            # account is deleted if logged user was the only user with this
+            # specific account on his list
+            if get_owners_count(account.id) == 0:
+                delete_accounts(Account.objects.filter(id=account.id))
         return Response(data={'message': 'Account removed from the list'},
                         status=status.HTTP_200_OK)
 
@@ -214,7 +341,7 @@ class AccountViewSet(ViewSet):
     def delete_accounts(sender, instance=None, **kwargs):
         """
         Deletes accounts with no users (when last
-        owner of account is being deleted).
+        owner of account is being deleted) with their unused profiles.
 
         :param sender: django.db.models.Model
         :param instance: model instance
@@ -222,11 +349,12 @@ class AccountViewSet(ViewSet):
         :return:
         """
         user = instance
-        accounts = Account.objects.all().filter(users=user)
-        for account in accounts:
-            users = User.objects.all().filter(account=account)
-            if (len(users) == 1) and (user in users):
-                account.delete()
+        # accounts of the user which are on other users' lists too
+        shared_accounts = AccountUsers.objects.exclude(user=user) \
+            .values('account_id')
+        with transaction.atomic():
+            delete_accounts(Account.objects.filter(users=user)
+                            .exclude(id__in=shared_accounts))
 
 
 class UserViewSet(ViewSet):
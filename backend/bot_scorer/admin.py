@@ -1,3 +1,60 @@
 from django.contrib import admin
+from django.utils.html import format_html, format_html_join
 
-# Register your models here.
+from .models import SnapshotRun
+
+
+@admin.register(SnapshotRun)
+class SnapshotRunAdmin(admin.ModelAdmin):
+    """Read-only history of snapshot job's runs."""
+    list_display = ['started_at', 'accounts', 'snapshots', 'failed',
+                    'unavailable', 'seconds', 'accounts_per_second', 'rate_limit_waits',
+                    'rate_limit_wait_seconds']
+    date_hierarchy = 'started_at'
+    list_filter = ['started_at']
+    fields = ['started_at', 'finished_at', 'accounts', 'snapshots', 'failed',
+              'unavailable', 'seconds', 'accounts_per_second', 'rate_limit_waits',
+              'rate_limit_wait_seconds', 'stages_table',
+              'slowest_accounts_table', 'report_path']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def stages_table(self, obj):
+        """
+        Returns stages' timings as HTML table.
+
+        :param obj: bot_scorer.models.SnapshotRun
+        :return: string
+        """
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>',
+            ((stage, f"{timing['seconds']:.3f}", timing['calls'],
+              f"{timing['seconds_per_account']:.4f}")
+             for stage, timing in obj.stages.items()))
+        return format_html('<table><tr><th>Stage</th><th>Seconds</th>'
+                           '<th>Calls</th><th>Seconds per account</th></tr>'
+                           '{}</table>', rows)
+
+    stages_table.short_description = 'Stages'
+
+    def slowest_accounts_table(self, obj):
+        """
+        Returns the slowest accounts as HTML table.
+
+        :param obj: bot_scorer.models.SnapshotRun
+        :return: string
+        """
+        rows = format_html_join(
+            '', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>',
+            ((account['screen_name'], account['twitter_id'],
+              f"{account['seconds']:.3f}")
+             for account in obj.slowest_accounts))
+        return format_html('<table><tr><th>Screen name</th><th>Twitter id'
+                           '</th><th>Seconds</th></tr>{}</table>', rows)
+
+    slowest_accounts_table.short_description = 'Slowest accounts'
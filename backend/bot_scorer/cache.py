@@ -0,0 +1,329 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .views import get_single_snapshot
+
+
+def normalize_screen_name(screen_name):
+    """
+    Returns screen name in form used as cache key (screen names are case
+    insensitive and may be given with '@').
+
+    :param screen_name: string
+    :return: string
+    """
+    return screen_name.strip().lstrip('@').lower()
+
+
+class LocMemResultCache:
+    """
+    In-process cache with time to live and LRU eviction of entries when
+    cache is full. Can be shared by many threads.
+    """
+
+    def __init__(self, ttl, max_size):
+        """
+        :param ttl: int, seconds
+        :param max_size: int, max number of entries
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns cached value or None if it is missing or expired.
+
+        :param key: string
+        :return: object or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Stores value, removes least recently used entry if cache is full.
+
+        :param key: string
+        :param value: object
+        :return:
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all entries.
+
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoResultCache:
+    """
+    Cache stored in one of Django's caches (settings.CACHES), so it can be
+    shared by many processes. Size and eviction depend on Django's cache
+    backend. Django's cache may be shared with other data (e.g. sessions),
+    so clear removes only entries of this cache - keys under prefix are
+    versioned with generation kept in the cache, clear starts new
+    generation and entries of the old one expire after ttl.
+    """
+
+    def __init__(self, ttl, max_size, alias='default', prefix='snapshot'):
+        """
+        :param ttl: int, seconds
+        :param max_size: int, not used (Django's cache has its own limits)
+        :param alias: string, name of cache in settings.CACHES
+        :param prefix: string, prefix of keys
+        """
+        self.ttl = ttl
+        self.alias = alias
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get_generation(self):
+        """
+        Returns current generation of keys (version of Django's cache key).
+
+        :return: int
+        """
+        key = self.make_key('generation')
+        generation = self.cache.get(key)
+        if generation is None:
+            self.cache.add(key, 1, timeout=None)
+            generation = self.cache.get(key, 1)
+        return generation
+
+    def get(self, key):
+        """
+        Returns cached value or None if it is missing or expired.
+
+        :param key: string
+        :return: object or None
+        """
+        return self.cache.get(self.make_key(key),
+                              version=self.get_generation())
+
+    def set(self, key, value):
+        """
+        Stores value for ttl seconds.
+
+        :param key: string
+        :param value: object
+        :return:
+        """
+        self.cache.set(self.make_key(key), value, timeout=self.ttl,
+                       version=self.get_generation())
+
+    def clear(self):
+        """
+        Removes all entries of this cache (starts new generation of keys),
+        other data in Django's cache is kept.
+
+        :return:
+        """
+        key = self.make_key('generation')
+        try:
+            self.cache.incr(key)
+        except ValueError:  # generation expired or evicted
+            self.cache.add(key, 2, timeout=None)
+
+
+_snapshot_cache = None
+_snapshot_cache_lock = threading.Lock()
+
+
+def get_snapshot_cache():
+    """
+    Returns process-wide cache of single snapshots (see
+    api.views.AccountSnapshotViewSet.single). Cache class, time to live and
+    size are taken from settings.BOT_SCORER_SINGLE_CACHE_BACKEND,
+    BOT_SCORER_SINGLE_CACHE_TTL and BOT_SCORER_SINGLE_CACHE_MAX_SIZE.
+
+    :return: LocMemResultCache or DjangoResultCache
+    """
+    global _snapshot_cache
+    if _snapshot_cache is None:
+        with _snapshot_cache_lock:
+            if _snapshot_cache is None:
+                cache_class = import_string(
+                    settings.BOT_SCORER_SINGLE_CACHE_BACKEND)
+                _snapshot_cache = cache_class(
+                    ttl=settings.BOT_SCORER_SINGLE_CACHE_TTL,
+                    max_size=settings.BOT_SCORER_SINGLE_CACHE_MAX_SIZE)
+    return _snapshot_cache
+
+
+class SingleFlight:
+    """
+    Runs only one call of function per key at once. Callers which come with
+    the same key while the call is in progress wait for it and get its
+    result or its exception.
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        """
+        Returns result of function and information if it was shared with
+        other caller (made by concurrent call with the same key).
+
+        :param key: string
+        :param function: callable without arguments
+        :return: tuple (object, bool)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class FileLock:
+    """
+    Exclusive lock on a local file, works across processes of one machine.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: string
+        """
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def get_process_lock(key):
+    """
+    Returns cross-process lock of key or None if
+    settings.BOT_SCORER_SINGLE_LOCK_DIR is not set.
+
+    :param key: string
+    :return: FileLock or None
+    """
+    lock_dir = settings.BOT_SCORER_SINGLE_LOCK_DIR
+    if not lock_dir:
+        return None
+    os.makedirs(lock_dir, exist_ok=True)
+    name = hashlib.sha1(key.encode()).hexdigest()
+    return FileLock(os.path.join(lock_dir, f'{name}.lock'))
+
+
+single_flight = SingleFlight()
+
+
+def get_cached_single_snapshot(screen_name):
+    """
+    Returns current snapshot of account (see
+    bot_scorer.views.get_single_snapshot) from the cache or from Twitter.
+    Concurrent calls for the same account in one process share one fetch.
+    With settings.BOT_SCORER_SINGLE_LOCK_DIR set, fetches of the same
+    account are also serialized across processes, so with cache shared by
+    processes (DjangoResultCache) only the first one calls Twitter.
+
+    :param screen_name: string
+    :return: tuple (dictionary, string - 'HIT', 'MISS' or 'COALESCED')
+    """
+    cache = get_snapshot_cache()
+    key = normalize_screen_name(screen_name)
+
+    output_dict = cache.get(key)
+    if output_dict is not None:
+        return output_dict, 'HIT'
+
+    def fetch():
+        lock = get_process_lock(key)
+        if lock is None:
+            output_dict = get_single_snapshot(screen_name)
+            cache.set(key, output_dict)
+            return output_dict, 'MISS'
+
+        with lock:
+            # other process could fetch it while we were waiting for lock
+            output_dict = cache.get(key)
+            if output_dict is not None:
+                return output_dict, 'HIT'
+            output_dict = get_single_snapshot(screen_name)
+            cache.set(key, output_dict)
+            return output_dict, 'MISS'
+
+    (output_dict, cache_status), shared = single_flight.do(key, fetch)
+    if shared:
+        cache_status = 'COALESCED'
+    return output_dict, cache_status
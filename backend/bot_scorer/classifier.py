@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+import threading
+
+from django.conf import settings
+
+from .metrics import timed
+
+
+class ClassifierRegistry:
+    """
+    Keeps unpickled classifier pipeline in memory for the whole process.
+    Pipeline is loaded again only when its file changes (mtime or content).
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: string or pathlib.Path, if None path is taken from
+        settings.BOT_SCORER_CLASSIFIER_PATH
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._pipe = None
+        self._stat = None
+        self._digest = None
+        self.loads = 0
+        self.hits = 0
+
+    @property
+    def path(self):
+        """
+        Returns path of the pickled pipeline.
+
+        :return: string
+        """
+        if self._path is not None:
+            return os.fspath(self._path)
+        return os.fspath(settings.BOT_SCORER_CLASSIFIER_PATH)
+
+    def get(self):
+        """
+        Returns pipeline, loads it from the file if it is not loaded yet or
+        the file has changed since last load.
+
+        :return: sklearn.pipeline.Pipeline
+        """
+        path = self.path
+        stat = os.stat(path)
+        stat = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if self._pipe is not None and stat == self._stat:
+                self.hits += 1
+                return self._pipe
+
+            with open(path, 'rb') as file:
+                content = file.read()
+            digest = hashlib.sha256(content).hexdigest()
+
+            # file was touched, but content is the same - no need to unpickle
+            if self._pipe is not None and digest == self._digest:
+                self._stat = stat
+                self.hits += 1
+                return self._pipe
+
+            with timed('model_load'):
+                self._pipe = pickle.loads(content)
+            self._stat = stat
+            self._digest = digest
+            self.loads += 1
+            return self._pipe
+
+    def clear(self):
+        """
+        Forgets loaded pipeline and resets counters.
+
+        :return:
+        """
+        with self._lock:
+            self._pipe = None
+            self._stat = None
+            self._digest = None
+            self.loads = 0
+            self.hits = 0
+
+    def stats(self):
+        """
+        Returns registry's counters.
+
+        :return: dictionary
+        """
+        return {
+            'path': self.path,
+            'digest': self._digest,
+            'loads': self.loads,
+            'hits': self.hits,
+        }
+
+
+# process-wide registry used by bot_scorer.views
+registry = ClassifierRegistry()
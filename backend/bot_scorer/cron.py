@@ -11,38 +11,25 @@ import django
 os.environ['DJANGO_SETTINGS_MODULE'] = 'activity_analyzer.settings'
 django.setup()
 
-from api.models import Account, AccountSnapshot
-from bot_scorer.views import make_snapshot
-
-accounts = Account.objects.all()
-
-for account in accounts:
-    snapshot_dict = make_snapshot(twitter_id=account.twitter_id)
-
-    snapshot = AccountSnapshot(
-        account=account,
-
-        name=snapshot_dict["name"],
-        location=snapshot_dict["location"],
-        url=snapshot_dict["url"],
-        description=snapshot_dict["description"],
-        created_at=snapshot_dict["created_at"],
-        statuses_count=snapshot_dict["statuses_count"],
-        followers_count=snapshot_dict["followers_count"],
-        friends_count=snapshot_dict["friends_count"],
-        favourites_count=snapshot_dict["favourites_count"],
-        listed_count=snapshot_dict["listed_count"],
-        default_profile=snapshot_dict["default_profile"],
-        verified=snapshot_dict["verified"],
-        protected=snapshot_dict["protected"],
-        bot_score=snapshot_dict["bot_score"],
-        is_active=snapshot_dict["is_active"],
-        suspended_info=snapshot_dict["suspended_info"],
-    )
-
-    if account.screen_name != snapshot_dict["screen_name"] and \
-            snapshot_dict["suspended_info"] == "":
-        account.screen_name = snapshot_dict["screen_name"]
-        account.save()
-
-    snapshot.save()
+from django.conf import settings
+from django.utils import timezone
+
+from bot_scorer.runner import SnapshotRunner, save_run_report
+
+# accounts snapshotted recently (e.g. by interrupted run) are skipped
+skip_since = timezone.now() - settings.BOT_SCORER_SNAPSHOT_MIN_AGE
+report = SnapshotRunner().run(skip_since=skip_since)
+run = save_run_report(report)
+
+print(f"Snapshots of {report['accounts']} accounts made in "
+      f"{report['seconds']:.1f} s "
+      f"({report['accounts_per_second']:.2f} accounts/s), "
+      f"{report['failed']} failed")
+print(f"Rate limit waits: {report['rate_limit_waits']} "
+      f"({report['rate_limit_wait_seconds']:.1f} s)")
+print(f"{'Stage':<20}{'Seconds':>12}{'Calls':>10}{'Per account':>14}")
+for stage, timing in report['stages'].items():
+    print(f"{stage:<20}{timing['seconds']:>12.2f}{timing['calls']:>10}"
+          f"{timing['seconds_per_account']:>14.4f}")
+print(f"Report saved as run {run.id}" +
+      (f" ({run.report_path})" if run.report_path else ""))
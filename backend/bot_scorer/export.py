@@ -0,0 +1,240 @@
+import json
+import os
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional
+    pyarrow = None
+
+from django.db.models import Max
+from django.utils import timezone
+
+from api.models import AccountSnapshot, AccountProfile
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# exported columns of tables: (column name, field lookup, numpy dtype),
+# strings have fixed width (max length of field), so every column can be
+# memory-mapped
+SNAPSHOT_COLUMNS = [
+    ('id', 'id', 'int64'),
+    ('account_id', 'account_id', 'int64'),
+    ('twitter_id', 'account__twitter_id', 'int64'),
+    ('profile_id', 'profile_id', 'int64'),
+    ('date_of_snapshot', 'date_of_snapshot', 'datetime64[s]'),
+    ('created_at', 'created_at', 'datetime64[s]'),
+    ('statuses_count', 'statuses_count', 'int64'),
+    ('followers_count', 'followers_count', 'int64'),
+    ('friends_count', 'friends_count', 'int64'),
+    ('favourites_count', 'favourites_count', 'int64'),
+    ('listed_count', 'listed_count', 'int64'),
+    ('default_profile', 'default_profile', 'bool'),
+    ('verified', 'verified', 'bool'),
+    ('protected', 'protected', 'bool'),
+    ('bot_score', 'bot_score', 'float64'),
+    ('is_active', 'is_active', 'bool'),
+    ('suspended_info', 'suspended_info', '<U32'),
+    ('features_order', 'features_order', '<U8'),
+]
+
+PROFILE_COLUMNS = [
+    ('id', 'id', 'int64'),
+    ('name', 'name', '<U256'),
+    ('location', 'location', '<U256'),
+    ('url', 'url', '<U200'),
+    ('description', 'description', '<U512'),
+]
+
+TABLES = {
+    'snapshots': (AccountSnapshot, SNAPSHOT_COLUMNS),
+    'profiles': (AccountProfile, PROFILE_COLUMNS),
+}
+
+FORMATS = ['npy', 'parquet']
+
+
+def to_array(values, dtype):
+    """
+    Returns column's values as numpy array.
+
+    :param values: sequence
+    :param dtype: string
+    :return: numpy.ndarray
+    """
+    if dtype.startswith('datetime64'):
+        seconds = [int(value.timestamp()) for value in values]
+        return np.array(seconds, dtype='int64').astype(dtype)
+    return np.array(values, dtype=dtype)
+
+
+def iterate_chunks(queryset, columns, chunk_size):
+    """
+    Yields rows of queryset (ordered by id) as dictionaries of column
+    arrays, one chunk at once.
+
+    :param queryset: django.db.models.QuerySet
+    :param columns: list of tuples (see SNAPSHOT_COLUMNS)
+    :param chunk_size: int
+    :return: generator of dictionaries (column name: numpy.ndarray)
+    """
+    lookups = [lookup for _, lookup, _ in columns]
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id')
+                    .values_list(*lookups)[:chunk_size])
+        if not rows:
+            return
+        values = list(zip(*rows))
+        yield {name: to_array(values[i], dtype)
+               for i, (name, _, dtype) in enumerate(columns)}
+        last_id = rows[-1][0]
+
+
+def export_npy(queryset, columns, directory, table, chunk_size):
+    """
+    Writes rows of queryset to one .npy file per column. Files are
+    allocated for all rows and filled chunk by chunk through memory map.
+
+    :param queryset: django.db.models.QuerySet
+    :param columns: list of tuples (see SNAPSHOT_COLUMNS)
+    :param directory: string
+    :param table: string, name of table (prefix of files)
+    :param chunk_size: int
+    :return: dictionary, manifest's entry of table
+    """
+    rows = queryset.count()
+    files = {}
+    arrays = {}
+    for name, _, dtype in columns:
+        files[name] = f'{table}.{name}.npy'
+        arrays[name] = np.lib.format.open_memmap(
+            os.path.join(directory, files[name]), mode='w+',
+            dtype=np.dtype(dtype), shape=(rows,))
+
+    written = 0
+    for chunk in iterate_chunks(queryset, columns, chunk_size):
+        # rows saved after counting are skipped
+        size = min(len(chunk['id']), rows - written)
+        for name, array in arrays.items():
+            array[written:written + size] = chunk[name][:size]
+        written += size
+        if written == rows:
+            break
+
+    for array in arrays.values():
+        array.flush()
+    return {
+        # less than number of rows in files, if rows were deleted during
+        # export
+        'rows': written,
+        'columns': {name: {'file': files[name], 'dtype': dtype}
+                    for name, _, dtype in columns},
+    }
+
+
+def export_parquet(queryset, columns, directory, table, chunk_size):
+    """
+    Writes rows of queryset to Parquet file, one row group per chunk.
+
+    :param queryset: django.db.models.QuerySet
+    :param columns: list of tuples (see SNAPSHOT_COLUMNS)
+    :param directory: string
+    :param table: string, name of table (name of file)
+    :param chunk_size: int
+    :return: dictionary, manifest's entry of table
+    """
+    if pyarrow is None:
+        raise ImportError("Parquet export needs pyarrow")
+
+    file = f'{table}.parquet'
+    schema = pyarrow.schema([
+        (name, pyarrow.string() if dtype.startswith('<U')
+         else pyarrow.from_numpy_dtype(np.dtype(dtype)))
+        for name, _, dtype in columns])
+
+    written = 0
+    with pyarrow.parquet.ParquetWriter(os.path.join(directory, file),
+                                       schema) as writer:
+        for chunk in iterate_chunks(queryset, columns, chunk_size):
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(chunk[name]) for name, _, _ in columns],
+                schema=schema))
+            written += len(chunk['id'])
+    return {
+        'rows': written,
+        'file': file,
+        'columns': {name: {'dtype': dtype} for name, _, dtype in columns},
+    }
+
+
+def export_snapshots(directory, file_format='npy', chunk_size=50000):
+    """
+    Exports all snapshots and their profiles to directory in columnar
+    format and writes manifest. Rows are streamed in chunks, so only one
+    chunk is kept in memory. Snapshots saved during export are not
+    exported.
+
+    :param directory: string
+    :param file_format: string, 'npy' or 'parquet'
+    :param chunk_size: int, number of rows read at once
+    :return: dictionary, manifest
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format: {file_format}")
+    export = export_npy if file_format == 'npy' else export_parquet
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'format': file_format,
+        'exported_at': timezone.now().isoformat(),
+        'tables': {},
+    }
+    for table, (model, columns) in TABLES.items():
+        last_id = model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        queryset = model.objects.filter(id__lte=last_id)
+        manifest['tables'][table] = export(queryset, columns, directory,
+                                           table, chunk_size)
+
+    with open(os.path.join(directory, MANIFEST_NAME), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def load_export(directory, mmap_mode='r'):
+    """
+    Returns exported tables as dictionaries of column arrays. Columns of
+    .npy export are memory-mapped (data is read from disk when used),
+    Parquet files are memory-mapped by pyarrow, but string columns are
+    converted to arrays of objects.
+
+    :param directory: string
+    :param mmap_mode: string, numpy's memory map mode
+    :return: tuple (dictionary - manifest, dictionary (table name:
+    dictionary (column name: numpy.ndarray)))
+    """
+    with open(os.path.join(directory, MANIFEST_NAME)) as file:
+        manifest = json.load(file)
+
+    tables = {}
+    for table, entry in manifest['tables'].items():
+        if manifest['format'] == 'npy':
+            tables[table] = {
+                name: np.load(os.path.join(directory, column['file']),
+                              mmap_mode=mmap_mode)[:entry['rows']]
+                for name, column in entry['columns'].items()
+            }
+        else:
+            if pyarrow is None:
+                raise ImportError("Parquet export needs pyarrow")
+            parquet_table = pyarrow.parquet.read_table(
+                os.path.join(directory, entry['file']), memory_map=True)
+            tables[table] = {
+                name: parquet_table.column(name).to_numpy()
+                for name in entry['columns']
+            }
+    return manifest, tables
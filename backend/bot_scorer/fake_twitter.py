@@ -0,0 +1,304 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# errors answered by Twitter API v1.1 (HTTP status, code, message)
+SUSPENDED_ERROR = (403, 63, 'User has been suspended.')
+NOT_FOUND_ERROR = (404, 50, 'User not found.')
+NO_MATCHES_ERROR = (404, 17, 'No user matches for specified terms.')
+RATE_LIMIT_ERROR = (429, 88, 'Rate limit exceeded')
+
+
+def format_twitter_date(date):
+    """
+    Returns date in Twitter API format, e.g. 'Wed Oct 10 20:19:24 +0000
+    2018'.
+
+    :param date: datetime.datetime, aware
+    :return: string
+    """
+    return date.strftime('%a %b %d %H:%M:%S +0000 %Y')
+
+
+class FakeTwitterServer:
+    """
+    Local stand-in of Twitter API v1.1 endpoints used by bot_scorer
+    (users/show, users/lookup, statuses/user_timeline) for tests and
+    benchmarks. Users are generated from their id (the same id gives the
+    same user), part of them is suspended or not found. Server answers with
+    configurable latency and rate limits every endpoint like Twitter does
+    (x-rate-limit-* headers, 429 when limit is exceeded).
+    """
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, suspended_rate=0.0,
+                 not_found_rate=0.0, status_rate=0.5, active_rate=0.8,
+                 rate_limit=None, rate_limit_window=900, seed=0,
+                 host='127.0.0.1', port=0):
+        """
+        :param latency: float, seconds of every response
+        :param latency_jitter: float, seconds of random latency added
+        :param suspended_rate: float, fraction of suspended users
+        :param not_found_rate: float, fraction of not existing users
+        :param status_rate: float, fraction of users with embedded latest
+        status (the rest needs timeline request)
+        :param active_rate: float, fraction of users tweeting recently
+        :param rate_limit: int or None, requests per window per endpoint
+        :param rate_limit_window: int, seconds
+        :param seed: int, seed of generated users
+        :param host: string
+        :param port: int, 0 - any free port
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.suspended_rate = suspended_rate
+        self.not_found_rate = not_found_rate
+        self.status_rate = status_rate
+        self.active_rate = active_rate
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        self._windows = {}
+
+        server = self
+
+        class Handler(FakeTwitterHandler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        Returns API root to be used as TwitterClient's base_url.
+
+        :return: string
+        """
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}/1.1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def get_fraction(self, twitter_id, salt):
+        """
+        Returns pseudo-random number from [0, 1) fixed for user.
+
+        :param twitter_id: int
+        :param salt: string
+        :return: float
+        """
+        digest = hashlib.sha1(f'{self.seed}:{salt}:{twitter_id}'.encode())
+        return int(digest.hexdigest()[:8], 16) / 16 ** 8
+
+    def get_error(self, twitter_id):
+        """
+        Returns error answered for user or None if user exists.
+
+        :param twitter_id: int
+        :return: tuple (see SUSPENDED_ERROR) or None
+        """
+        fraction = self.get_fraction(twitter_id, 'error')
+        if fraction < self.suspended_rate:
+            return SUSPENDED_ERROR
+        if fraction < self.suspended_rate + self.not_found_rate:
+            return NOT_FOUND_ERROR
+        return None
+
+    def get_status(self, twitter_id):
+        """
+        Returns user's latest status.
+
+        :param twitter_id: int
+        :return: dictionary
+        """
+        days = 1 if self.get_fraction(twitter_id, 'active') < \
+            self.active_rate else 400
+        date = datetime.now(timezone.utc) - timedelta(days=days)
+        return {'id': twitter_id * 1000, 'text': 'tweet',
+                'created_at': format_twitter_date(date)}
+
+    def get_user(self, twitter_id):
+        """
+        Returns user object as Twitter API does (generated from id).
+
+        :param twitter_id: int
+        :return: dictionary
+        """
+        generator = random.Random(f'{self.seed}:{twitter_id}')
+        user = {
+            'id': twitter_id,
+            'id_str': str(twitter_id),
+            'screen_name': f'user{twitter_id}',
+            'name': f'User {twitter_id}',
+            'location': generator.choice(['', 'Warsaw', 'Berlin']),
+            'url': generator.choice([None,
+                                     f'https://example.com/{twitter_id}']),
+            'description': generator.choice(['', 'Just a user', 'Bot?']),
+            'created_at': format_twitter_date(
+                datetime(2010, 1, 1, tzinfo=timezone.utc) +
+                timedelta(days=generator.randint(0, 4000))),
+            'statuses_count': generator.randint(0, 100000),
+            'followers_count': int(generator.paretovariate(1.2) * 10),
+            'friends_count': generator.randint(0, 5000),
+            'favourites_count': generator.randint(0, 50000),
+            'listed_count': generator.randint(0, 100),
+            'default_profile': generator.random() < 0.3,
+            'verified': generator.random() < 0.01,
+            'protected': generator.random() < 0.05,
+        }
+        if not user['protected'] and \
+                self.get_fraction(twitter_id, 'status') < self.status_rate:
+            user['status'] = self.get_status(twitter_id)
+        return user
+
+    def take_call(self, path):
+        """
+        Counts call of endpoint, returns its rate limit headers and if the
+        limit is exceeded.
+
+        :param path: string
+        :return: tuple (dictionary, bool)
+        """
+        with self.lock:
+            self.calls[path] += 1
+            if self.rate_limit is None:
+                return {}, False
+
+            now = time.time()
+            reset_time, used = self._windows.get(path, (0, 0))
+            if now >= reset_time:
+                reset_time, used = now + self.rate_limit_window, 0
+            exceeded = used >= self.rate_limit
+            if not exceeded:
+                used += 1
+            else:
+                self.rate_limited[path] += 1
+            self._windows[path] = (reset_time, used)
+
+        headers = {
+            'x-rate-limit-limit': str(self.rate_limit),
+            'x-rate-limit-remaining': str(self.rate_limit - used),
+            'x-rate-limit-reset': str(int(reset_time) + 1),
+        }
+        return headers, exceeded
+
+    def sleep(self):
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + random.random() * self.latency_jitter)
+
+
+def get_twitter_id(params):
+    """
+    Returns user's id from request params (user_id or screen_name of
+    generated user, e.g. 'user12', other screen names get id from hash).
+
+    :param params: dictionary
+    :return: int or None
+    """
+    if 'user_id' in params:
+        return int(params['user_id'])
+    if 'screen_name' in params:
+        screen_name = params['screen_name'].lstrip('@').lower()
+        if screen_name.startswith('user') and screen_name[4:].isdigit():
+            return int(screen_name[4:])
+        digest = hashlib.sha1(screen_name.encode()).hexdigest()
+        return int(digest[:7], 16)
+    return None
+
+
+class FakeTwitterHandler(BaseHTTPRequestHandler):
+    """Answers requests to FakeTwitterServer (set as fake attribute)."""
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_error_json(self, error, headers=None):
+        status, code, message = error
+        self.send_json(status, {'errors': [{'code': code,
+                                            'message': message}]}, headers)
+
+    def handle_request(self, path, params):
+        fake = self.fake
+        headers, exceeded = fake.take_call(path)
+        fake.sleep()
+        if exceeded:
+            return self.send_error_json(RATE_LIMIT_ERROR, headers)
+
+        if path == '/1.1/users/lookup.json':
+            ids = [int(twitter_id) for twitter_id in
+                   params.get('user_id', '').split(',') if twitter_id]
+            ids += [get_twitter_id({'screen_name': name}) for name in
+                    params.get('screen_name', '').split(',') if name]
+            users = [fake.get_user(twitter_id) for twitter_id in ids
+                     if fake.get_error(twitter_id) is None]
+            if not users:
+                return self.send_error_json(NO_MATCHES_ERROR, headers)
+            return self.send_json(200, users, headers)
+
+        if path in ('/1.1/users/show.json',
+                    '/1.1/statuses/user_timeline.json'):
+            twitter_id = get_twitter_id(params)
+            if twitter_id is None:
+                return self.send_error_json(NOT_FOUND_ERROR, headers)
+            error = fake.get_error(twitter_id)
+            if error is not None:
+                return self.send_error_json(error, headers)
+            if path == '/1.1/users/show.json':
+                return self.send_json(200, fake.get_user(twitter_id),
+                                      headers)
+            return self.send_json(200, [fake.get_status(twitter_id)],
+                                  headers)
+
+        self.send_json(404, {'errors': [{'code': 34, 'message':
+                                         'Sorry, that page does not '
+                                         'exist.'}]})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[-1]
+                  for key, values in parse_qs(url.query).items()}
+        self.handle_request(url.path, params)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode()
+        params = {key: values[-1] for key, values in parse_qs(body).items()}
+        self.handle_request(url.path, params)
+
+    def log_message(self, *args):
+        pass
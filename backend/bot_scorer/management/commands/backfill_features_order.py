@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import AccountSnapshot
+from bot_scorer.views import FEATURES, fill_features_orders
+
+
+class Command(BaseCommand):
+    help = "Calculates and stores features' importance order of snapshots " \
+           "saved without it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="number of snapshots updated at once")
+        parser.add_argument('--all', action='store_true',
+                            help="recalculates order of all snapshots (e.g. "
+                                 "after classifier change)")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        snapshots = AccountSnapshot.objects.all().order_by('id')
+        if not options['all']:
+            snapshots = snapshots.filter(features_order='')
+
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(snapshots.filter(id__gt=last_id)
+                         .only('id', 'features_order', *FEATURES)
+                         [:batch_size])
+            if not batch:
+                break
+
+            if options['all']:
+                for snapshot in batch:
+                    snapshot.features_order = ''
+            fill_features_orders(batch)
+
+            with transaction.atomic():
+                AccountSnapshot.objects.bulk_update(batch, ['features_order'])
+
+            updated += len(batch)
+            last_id = batch[-1].id
+
+        self.stdout.write(f"Updated {updated} snapshots")
@@ -0,0 +1,133 @@
+import json
+
+import numpy as np
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from api.management.commands.benchmark_snapshot_queries import \
+    temporary_database
+from api.models import Account
+from bot_scorer.fake_twitter import FakeTwitterServer
+from bot_scorer.runner import SnapshotRunner
+from bot_scorer.twitter import TwitterClient
+
+FAKE_KEYS = dict.fromkeys(['CONSUMER_KEY', 'CONSUMER_SECRET', 'ACCESS_TOKEN',
+                           'ACCESS_TOKEN_SECRET'], 'fake')
+
+
+class Command(BaseCommand):
+    help = "Runs snapshot job (bot_scorer.runner.SnapshotRunner, used by " \
+           "cron.py) for synthetic accounts against local fake Twitter API " \
+           "and reports throughput, API calls per account and latency of " \
+           "API calls. Accounts and snapshots are saved to temporary " \
+           "database, removed at the end."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=1000,
+                            help="number of synthetic accounts")
+        parser.add_argument('--concurrency', type=int,
+                            help="number of fetching threads (default from "
+                                 "settings)")
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help="number of accounts in users/lookup call")
+        parser.add_argument('--latency', type=float, default=50,
+                            help="latency of fake API in ms")
+        parser.add_argument('--latency-jitter', type=float, default=0,
+                            help="random latency added in ms")
+        parser.add_argument('--suspended-rate', type=float, default=0.01)
+        parser.add_argument('--not-found-rate', type=float, default=0.01)
+        parser.add_argument('--status-rate', type=float, default=0.5,
+                            help="fraction of users with embedded latest "
+                                 "status")
+        parser.add_argument('--rate-limit', type=int,
+                            help="requests per window per endpoint")
+        parser.add_argument('--rate-limit-window', type=int, default=900,
+                            help="seconds")
+        parser.add_argument('--json', dest='json_path',
+                            help="path of file to save results to")
+
+    def handle(self, *args, **options):
+        server = FakeTwitterServer(
+            latency=options['latency'] / 1000,
+            latency_jitter=options['latency_jitter'] / 1000,
+            suspended_rate=options['suspended_rate'],
+            not_found_rate=options['not_found_rate'],
+            status_rate=options['status_rate'],
+            rate_limit=options['rate_limit'],
+            rate_limit_window=options['rate_limit_window']).start()
+        client = TwitterClient(FAKE_KEYS, base_url=server.url)
+        latencies = []
+        client.session.hooks['response'].append(
+            lambda response, *args, **kwargs:
+            latencies.append(response.elapsed.total_seconds() * 1000))
+
+        try:
+            with temporary_database(DEFAULT_DB_ALIAS):
+                report = self.run_job(client, options)
+        finally:
+            client.close()
+            server.stop()
+
+        calls = sum(server.calls.values())
+        results = {
+            'accounts': report['accounts'],
+            'snapshots': report['snapshots'],
+            'failed': report['failed'],
+            'seconds': report['seconds'],
+            'accounts_per_second': report['accounts_per_second'],
+            'api_calls': calls,
+            'api_calls_per_account':
+                calls / report['accounts'] if report['accounts'] else 0.0,
+            'api_calls_by_endpoint': dict(server.calls),
+            'rate_limited_calls': sum(server.rate_limited.values()),
+            'rate_limit_waits': report['rate_limit_waits'],
+            'rate_limit_wait_seconds': report['rate_limit_wait_seconds'],
+            'stages': report['stages'],
+            'latency_p50_ms': float(np.percentile(latencies, 50))
+            if latencies else 0.0,
+            'latency_p99_ms': float(np.percentile(latencies, 99))
+            if latencies else 0.0,
+        }
+
+        self.stdout.write(
+            f"{results['accounts']} accounts in {results['seconds']:.2f} s "
+            f"({results['accounts_per_second']:.1f} accounts/s), "
+            f"{results['failed']} failed")
+        self.stdout.write(
+            f"API calls: {results['api_calls']} "
+            f"({results['api_calls_per_account']:.3f} per account, "
+            f"{results['rate_limited_calls']} rate limited)")
+        for endpoint, count in sorted(results['api_calls_by_endpoint']
+                                      .items()):
+            self.stdout.write(f"  {endpoint}: {count}")
+        self.stdout.write(f"API call latency: "
+                          f"p50 {results['latency_p50_ms']:.1f} ms, "
+                          f"p99 {results['latency_p99_ms']:.1f} ms")
+        self.stdout.write(f"Rate limit waits: {results['rate_limit_waits']} "
+                          f"({results['rate_limit_wait_seconds']:.1f} s)")
+        for stage, timing in results['stages'].items():
+            self.stdout.write(f"  {stage}: {timing['seconds']:.2f} s, "
+                              f"{timing['calls']} calls")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+    def run_job(self, client, options):
+        """
+        Makes synthetic accounts and runs snapshot job for them.
+
+        :param client: bot_scorer.twitter.TwitterClient
+        :param options: dictionary, command's options
+        :return: dictionary, runner's report
+        """
+        Account.objects.bulk_create(
+            [Account(twitter_id=i + 1, screen_name=f'user{i}')
+             for i in range(options['accounts'])], batch_size=500)
+        accounts = Account.objects.order_by('id')
+
+        runner = SnapshotRunner(concurrency=options['concurrency'],
+                                chunk_size=options['chunk_size'],
+                                api_factory=lambda: client)
+        return runner.run(accounts=accounts)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bot_scorer.export import export_snapshots, FORMATS
+
+
+class Command(BaseCommand):
+    help = "Exports snapshots' history to directory in columnar format " \
+           "(.npy file per column or Parquet) with manifest, see " \
+           "bot_scorer.export.load_export for loading"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=FORMATS, default='npy',
+                            help="Parquet needs pyarrow")
+        parser.add_argument('--chunk-size', type=int, default=50000,
+                            help="number of snapshots read at once")
+
+    def handle(self, *args, **options):
+        try:
+            manifest = export_snapshots(options['directory'],
+                                        file_format=options['format'],
+                                        chunk_size=options['chunk_size'])
+        except ImportError as e:
+            raise CommandError(e)
+
+        for table, entry in manifest['tables'].items():
+            self.stdout.write(f"Exported {entry['rows']} {table}")
@@ -0,0 +1,59 @@
+import multiprocessing
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def run_worker(batch_size, forever, max_sleep):
+    """
+    Runs one snapshot worker (in child process).
+
+    :param batch_size: int
+    :param forever: bool
+    :param max_sleep: int
+    :return: dictionary, report of cycle
+    """
+    if not apps.ready:  # child process started with spawn
+        import django
+        django.setup()
+    from bot_scorer.workers import LeaseWorker
+
+    worker = LeaseWorker(batch_size=batch_size)
+    if forever:
+        worker.run_forever(max_sleep=max_sleep)
+    return worker.run_cycle()
+
+
+class Command(BaseCommand):
+    help = "Makes snapshots of due accounts with many worker processes " \
+           "claiming disjoint batches of accounts (can be also started on " \
+           "many machines sharing the database)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help="number of worker processes")
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="number of accounts claimed at once")
+        parser.add_argument('--forever', action='store_true',
+                            help="keeps snapshotting accounts when they are "
+                                 "due, without it workers exit when no "
+                                 "account is due")
+        parser.add_argument('--max-sleep', type=int, default=300,
+                            help="max seconds between checks of due "
+                                 "accounts")
+
+    def handle(self, *args, **options):
+        # connections can not be shared with child processes
+        connections.close_all()
+        arguments = [(options['batch_size'], options['forever'],
+                      options['max_sleep'])] * options['workers']
+        with multiprocessing.Pool(options['workers']) as pool:
+            reports = pool.starmap(run_worker, arguments)
+
+        for i, report in enumerate(reports):
+            self.stdout.write(f"Worker {i}: {report['snapshots']} "
+                              f"snapshots, {report['failed']} failed")
+        self.stdout.write(f"Snapshots of "
+                          f"{sum(report['accounts'] for report in reports)} "
+                          f"accounts made")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from bot_scorer.scheduler import SnapshotScheduler
+
+
+class Command(BaseCommand):
+    help = "Makes snapshots of accounts when they are due - volatile " \
+           "accounts more often, inactive and suspended ones rarely " \
+           "(replaces daily cron.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="snapshots accounts due now and exits "
+                                 "(e.g. to be run hourly by cron)")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="max number of accounts snapshotted at once")
+        parser.add_argument('--max-sleep', type=int, default=300,
+                            help="max seconds between checks of due "
+                                 "accounts")
+
+    def handle(self, *args, **options):
+        scheduler = SnapshotScheduler(batch_size=options['batch_size'])
+        if not options['once']:
+            scheduler.run_forever(max_sleep=options['max_sleep'])
+            return
+
+        report = scheduler.run_due()
+        self.stdout.write(f"Snapshots of {report['accounts']} due accounts "
+                          f"made in {report['seconds']:.1f} s, "
+                          f"{report['failed']} failed")
+        if 'id' in report:
+            self.stdout.write(f"Report saved as run {report['id']}")
@@ -0,0 +1,363 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+# upper bounds (seconds) of histograms' buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+def escape_label_value(value):
+    """
+    Returns label's value escaped for Prometheus text format.
+
+    :param value: string
+    :return: string
+    """
+    return value.replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def format_labels(names, values):
+    """
+    Returns labels of sample in Prometheus text format, e.g.
+    '{view="account-list",method="GET"}'.
+
+    :param names: list of strings
+    :param values: list of strings
+    :return: string
+    """
+    if not names:
+        return ''
+    labels = ','.join(f'{name}="{escape_label_value(value)}"'
+                      for name, value in zip(names, values))
+    return '{' + labels + '}'
+
+
+def format_value(value):
+    """
+    Returns sample's value in Prometheus text format.
+
+    :param value: int or float
+    :return: string
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of metrics with values kept per combination of labels."""
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        """
+        :param name: string
+        :param documentation: string
+        :param labels: list of strings, names of labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = list(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def get_key(self, labels):
+        """
+        Returns key of values for given labels.
+
+        :param labels: dictionary (label's name: value)
+        :return: tuple of strings
+        """
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} needs labels: {self.labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def get_samples(self):
+        """
+        Returns samples of metric.
+
+        :return: list of tuples (suffix, label names, label values, value)
+        """
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Returns metric in Prometheus text format.
+
+        :return: list of strings (lines)
+        """
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.type}']
+        for suffix, names, values, value in self.get_samples():
+            lines.append(f'{self.name}{suffix}{format_labels(names, values)} '
+                         f'{format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increases counter of given labels.
+
+        :param amount: int or float
+        :param labels: labels' values
+        :return:
+        """
+        key = self.get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """
+        Returns counter of given labels.
+
+        :param labels: labels' values
+        :return: int or float
+        """
+        return self._values.get(self.get_key(labels), 0)
+
+    def get_samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [('_total', self.labels, key, value) for key, value in values]
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        """
+        :param name: string
+        :param documentation: string
+        :param labels: list of strings, names of labels
+        :param buckets: list of floats, upper bounds of buckets
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Adds observed value to histogram of given labels.
+
+        :param value: int or float
+        :param labels: labels' values
+        :return:
+        """
+        key = self.get_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            if key not in self._values:
+                # counts of buckets (the last one is +Inf), sum
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            counts, total = self._values[key]
+            counts[index] += 1
+            self._values[key][1] = total + value
+
+    def get_count(self, **labels):
+        """
+        Returns number of observed values of given labels.
+
+        :param labels: labels' values
+        :return: int
+        """
+        value = self._values.get(self.get_key(labels))
+        return sum(value[0]) if value is not None else 0
+
+    def get_sum(self, **labels):
+        """
+        Returns sum of observed values of given labels.
+
+        :param labels: labels' values
+        :return: int or float
+        """
+        value = self._values.get(self.get_key(labels))
+        return value[1] if value is not None else 0
+
+    def get_samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total))
+                            for key, (counts, total) in self._values.items())
+
+        names = self.labels + ['le']
+        samples = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float('inf')], counts):
+                cumulative += count
+                samples.append(('_bucket', names,
+                                key + (format_value(bound),), cumulative))
+            samples.append(('_count', self.labels, key, cumulative))
+            samples.append(('_sum', self.labels, key, total))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Keeps metrics of the process and renders them in Prometheus text format.
+    Every process (e.g. worker of WSGI server) has its own values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        """
+        Registers metric, metric already registered with the same name is
+        returned instead.
+
+        :param metric: bot_scorer.metrics.Metric
+        :return: bot_scorer.metrics.Metric
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        """
+        Returns registered counter.
+
+        :param name: string
+        :param documentation: string
+        :param labels: list of strings
+        :return: bot_scorer.metrics.Counter
+        """
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(),
+                  buckets=DEFAULT_BUCKETS):
+        """
+        Returns registered histogram.
+
+        :param name: string
+        :param documentation: string
+        :param labels: list of strings
+        :param buckets: list of floats
+        :return: bot_scorer.metrics.Histogram
+        """
+        return self.register(Histogram(name, documentation, labels,
+                                       buckets))
+
+    def render(self):
+        """
+        Returns all metrics in Prometheus text format.
+
+        :return: string
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(),
+                             key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# process-wide registry exposed on /metrics (see api.views.metrics)
+registry = MetricsRegistry()
+
+stage_duration = registry.histogram(
+    'bot_scorer_stage_duration_seconds',
+    "Time of bot_scorer stages (model load, prediction, features' order, "
+    "Twitter API calls)", ['stage'])
+
+
+class RequestTimings:
+    """
+    Time spent by one request (or thread of snapshot job) in database and
+    stages (see timed).
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.stages = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    def add_stage(self, stage, seconds):
+        """
+        Adds time of single call of stage.
+
+        :param stage: string
+        :param seconds: float
+        :return:
+        """
+        self.stages[stage] += seconds
+        self.calls[stage] += 1
+
+    def merge(self, other):
+        """
+        Adds timings collected by other thread.
+
+        :param other: bot_scorer.metrics.RequestTimings
+        :return:
+        """
+        self.queries += other.queries
+        self.db_time += other.db_time
+        for stage, seconds in other.stages.items():
+            self.stages[stage] += seconds
+            self.calls[stage] += other.calls[stage]
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """
+        Measures query (used with connection.execute_wrapper).
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+_local = threading.local()
+
+
+def get_request_timings():
+    """
+    Returns timings collected in current thread or None if they are not
+    collected.
+
+    :return: bot_scorer.metrics.RequestTimings or None
+    """
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collects time of stages run in current thread (e.g. during request).
+
+    :return: bot_scorer.metrics.RequestTimings
+    """
+    previous = get_request_timings()
+    _local.timings = RequestTimings()
+    try:
+        yield _local.timings
+    finally:
+        _local.timings = previous
+
+
+@contextmanager
+def timed(stage):
+    """
+    Measures time of stage, adds it to stage's histogram and to timings of
+    current request.
+
+    :param stage: string, e.g. 'predict'
+    :return:
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stage_duration.observe(seconds, stage=stage)
+        timings = get_request_timings()
+        if timings is not None:
+            timings.add_stage(stage, seconds)
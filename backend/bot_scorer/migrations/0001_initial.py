@@ -0,0 +1,35 @@
+# Generated by Django 3.1.7 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('finished_at', models.DateTimeField()),
+                ('accounts', models.PositiveIntegerField()),
+                ('snapshots', models.PositiveIntegerField()),
+                ('failed', models.PositiveIntegerField()),
+                ('seconds', models.FloatField()),
+                ('accounts_per_second', models.FloatField()),
+                ('rate_limit_waits', models.PositiveIntegerField(default=0)),
+                ('rate_limit_wait_seconds', models.FloatField(default=0.0)),
+                ('stages', models.JSONField(default=dict)),
+                ('slowest_accounts', models.JSONField(default=list)),
+                ('report_path', models.CharField(blank=True, max_length=512)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot_scorer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snapshotrun',
+            name='unavailable',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,3 +1,31 @@
 from django.db import models
 
-# Create your models here.
+
+class SnapshotRun(models.Model):
+    """
+    Summary of snapshot job's run (see bot_scorer.runner.save_run_report).
+    """
+    started_at = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField()
+    accounts = models.PositiveIntegerField()
+    snapshots = models.PositiveIntegerField()
+    failed = models.PositiveIntegerField()
+    # suspended or not found accounts
+    unavailable = models.PositiveIntegerField(default=0)
+    seconds = models.FloatField()
+    accounts_per_second = models.FloatField()
+    rate_limit_waits = models.PositiveIntegerField(default=0)
+    rate_limit_wait_seconds = models.FloatField(default=0.0)
+    # stage: seconds, calls and seconds per account (see
+    # SnapshotRunner.get_stages)
+    stages = models.JSONField(default=dict)
+    # the slowest accounts: id, twitter_id, screen_name, seconds
+    slowest_accounts = models.JSONField(default=list)
+    # JSON file with the report, empty if it was not saved
+    report_path = models.CharField(max_length=512, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Snapshot run {self.started_at.strftime('%d-%m-%Y %H:%M')}"
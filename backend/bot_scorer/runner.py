@@ -0,0 +1,421 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+
+from api.models import Account, AccountSnapshot
+from bot_scorer.metrics import RequestTimings, collect_timings, timed
+from bot_scorer.models import SnapshotRun
+from bot_scorer.views import make_snapshots, get_features_order, \
+    get_features_orders, get_api, LOOKUP_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# number of accounts with the longest processing time kept in run report
+SLOWEST_ACCOUNTS_COUNT = 10
+
+
+def build_snapshot(account, snapshot_dict, features_order=None):
+    """
+    Returns (not saved) snapshot of account made from snapshot dictionary
+    (see bot_scorer.views.make_snapshot)
+
+    :param account: api.models.Account
+    :param snapshot_dict: dictionary
+    :param features_order: string or None, calculated if not given
+    :return: api.models.AccountSnapshot
+    """
+    if features_order is None:
+        features_order = get_features_order(snapshot_dict)
+
+    return AccountSnapshot(
+        account=account,
+
+        name=snapshot_dict["name"],
+        location=snapshot_dict["location"],
+        url=snapshot_dict["url"],
+        description=snapshot_dict["description"],
+        created_at=snapshot_dict["created_at"],
+        statuses_count=snapshot_dict["statuses_count"],
+        followers_count=snapshot_dict["followers_count"],
+        friends_count=snapshot_dict["friends_count"],
+        favourites_count=snapshot_dict["favourites_count"],
+        listed_count=snapshot_dict["listed_count"],
+        default_profile=snapshot_dict["default_profile"],
+        verified=snapshot_dict["verified"],
+        protected=snapshot_dict["protected"],
+        bot_score=snapshot_dict["bot_score"],
+        is_active=snapshot_dict["is_active"],
+        suspended_info=snapshot_dict["suspended_info"],
+        features_order=features_order,
+    )
+
+
+def refresh_screen_name(account, snapshot_dict):
+    """
+    Sets account's screen name to the current one (accounts can be renamed).
+    Screen name of suspended or not found account is not changed.
+
+    :param account: api.models.Account
+    :param snapshot_dict: dictionary
+    :return: bool, True if screen name has changed
+    """
+    if account.screen_name != snapshot_dict["screen_name"] and \
+            snapshot_dict["suspended_info"] == "":
+        account.screen_name = snapshot_dict["screen_name"]
+        return True
+    return False
+
+
+class SnapshotRunner:
+    """
+    Makes snapshots of accounts. Chunks of accounts are fetched from Twitter
+    and scored concurrently by pool of threads, snapshots are saved to the
+    database by single writer (the thread which calls run). Writer buffers
+    snapshots and saves them with bulk_create, one transaction per write
+    chunk. Accounts of saved and failed chunks are kept in saved_accounts
+    and failed_accounts.
+    """
+
+    def __init__(self, concurrency=None, chunk_size=LOOKUP_CHUNK_SIZE,
+                 api_factory=get_api, write_chunk_size=None):
+        """
+        :param concurrency: int, number of fetching threads, if None it is
+        taken from settings.BOT_SCORER_SNAPSHOT_CONCURRENCY
+        :param chunk_size: int, number of accounts fetched at once
+        :param api_factory: callable returning tweepy.API, called once per
+        fetching thread
+        :param write_chunk_size: int, number of snapshots saved in single
+        transaction, if None it is taken from
+        settings.BOT_SCORER_SNAPSHOT_WRITE_CHUNK_SIZE
+        """
+        if concurrency is None:
+            concurrency = settings.BOT_SCORER_SNAPSHOT_CONCURRENCY
+        if write_chunk_size is None:
+            write_chunk_size = settings.BOT_SCORER_SNAPSHOT_WRITE_CHUNK_SIZE
+        self.concurrency = max(1, concurrency)
+        self.chunk_size = chunk_size
+        self.api_factory = api_factory
+        self.write_chunk_size = max(1, write_chunk_size)
+        self._local = threading.local()
+        self._snapshots = []
+        self._renamed_accounts = []
+        self.saved = 0
+        self.failed = 0
+        self.unavailable = 0
+        self.saved_accounts = []
+        self.failed_accounts = []
+        self.timings = RequestTimings()
+        self.account_times = {}
+        self._on_saved = None
+
+    def get_api(self):
+        """
+        Returns Twitter API client of current thread.
+
+        :return: tweepy.API
+        """
+        if not hasattr(self._local, 'api'):
+            self._local.api = self.api_factory()
+        return self._local.api
+
+    def fetch(self, chunk):
+        """
+        Fetch stage - returns current data of accounts from the chunk,
+        timings of the stage (Twitter API calls, rate limit waits, scoring)
+        and time of every account (its own time and equal part of time
+        shared by the chunk).
+
+        :param chunk: list of api.models.Account
+        :return: tuple (list of api.models.Account, dictionary,
+        bot_scorer.metrics.RequestTimings, dictionary (account's id: float))
+        """
+        twitter_ids = [account.twitter_id for account in chunk]
+        own_times = {}
+        errors = {}
+        with collect_timings() as timings:
+            with timed('fetch'):
+                snapshot_dicts = make_snapshots(
+                    twitter_ids, api=self.get_api(),
+                    chunk_size=self.chunk_size, account_times=own_times,
+                    errors=errors)
+        for twitter_id, error in errors.items():
+            logger.warning("Fetching account %d failed: %s", twitter_id,
+                           error)
+
+        shared_time = max(0.0, timings.stages['fetch'] -
+                          sum(own_times.values())) / len(chunk)
+        account_times = {
+            account.id: shared_time + own_times.get(account.twitter_id, 0.0)
+            for account in chunk
+        }
+        return chunk, snapshot_dicts, timings, account_times
+
+    def write(self, chunk, snapshot_dicts):
+        """
+        Writer stage - buffers snapshots of accounts from the chunk, saves
+        buffer when it is full. Accounts which could not be fetched are
+        counted as failed, suspended or not found ones as unavailable.
+
+        :param chunk: list of api.models.Account
+        :param snapshot_dicts: dictionary (twitter_id: dictionary)
+        :return:
+        """
+        fetched = [account for account in chunk
+                   if account.twitter_id in snapshot_dicts]
+        self.failed += len(chunk) - len(fetched)
+        self.failed_accounts.extend(account for account in chunk
+                                    if account.twitter_id not in snapshot_dicts)
+        chunk = fetched
+        snapshot_dicts = [snapshot_dicts[account.twitter_id]
+                          for account in chunk]
+        self.unavailable += sum(1 for snapshot_dict in snapshot_dicts
+                                if snapshot_dict['suspended_info'] != '')
+        features_orders = get_features_orders(snapshot_dicts)
+
+        for account, snapshot_dict, features_order in zip(chunk,
+                                                          snapshot_dicts,
+                                                          features_orders):
+            self._snapshots.append(build_snapshot(account, snapshot_dict,
+                                                  features_order))
+
+            if refresh_screen_name(account, snapshot_dict):
+                self._renamed_accounts.append(account)
+
+            if len(self._snapshots) >= self.write_chunk_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Saves buffered snapshots and renamed accounts in single transaction
+        (on_saved callback given to run is called with chunk's accounts in
+        the same transaction). If saving fails, whole chunk is rolled back -
+        these accounts have no new snapshot, so they are fetched again by the
+        next run.
+
+        :return:
+        """
+        snapshots = self._snapshots
+        renamed_accounts = self._renamed_accounts
+        self._snapshots = []
+        self._renamed_accounts = []
+        if not snapshots:
+            return
+
+        accounts = [snapshot.account for snapshot in snapshots]
+        try:
+            with timed('db_write'), transaction.atomic():
+                AccountSnapshot.objects.bulk_create(snapshots)
+                if renamed_accounts:
+                    Account.objects.bulk_update(renamed_accounts,
+                                                ['screen_name'])
+                if self._on_saved is not None:
+                    self._on_saved(accounts)
+        except DatabaseError:
+            logger.exception("Saving chunk of %d snapshots failed",
+                             len(snapshots))
+            self.failed += len(snapshots)
+            self.failed_accounts.extend(accounts)
+        else:
+            self.saved += len(snapshots)
+            self.saved_accounts.extend(accounts)
+
+    def get_accounts(self, skip_since=None):
+        """
+        Returns accounts to snapshot. Accounts with snapshot made after
+        skip_since are skipped, so interrupted or partially failed run can
+        be started again.
+
+        :param skip_since: datetime.datetime or None
+        :return: django.db.models.QuerySet
+        """
+        accounts = Account.objects.all().order_by('id')
+        if skip_since is not None:
+            accounts = accounts.exclude(
+                accountsnapshot__date_of_snapshot__gte=skip_since)
+        return accounts
+
+    def get_stages(self):
+        """
+        Returns total time and number of calls of every stage of the last
+        run. Stages are nested - fetch contains twitter_api, rate_limit_wait
+        and predict.
+
+        :return: dictionary (stage: dictionary)
+        """
+        accounts = len(self.account_times)
+        return {
+            stage: {
+                'seconds': seconds,
+                'calls': self.timings.calls[stage],
+                'seconds_per_account': seconds / accounts if accounts
+                else 0.0,
+            }
+            for stage, seconds in sorted(self.timings.stages.items())
+        }
+
+    def get_slowest_accounts(self, accounts):
+        """
+        Returns accounts of the last run with the longest processing time.
+
+        :param accounts: list of api.models.Account
+        :return: list of dictionaries
+        """
+        slowest = heapq.nlargest(
+            SLOWEST_ACCOUNTS_COUNT, accounts,
+            key=lambda account: self.account_times.get(account.id, 0.0))
+        return [{
+            'id': account.id,
+            'twitter_id': account.twitter_id,
+            'screen_name': account.screen_name,
+            'seconds': self.account_times.get(account.id, 0.0),
+        } for account in slowest]
+
+    def run(self, accounts=None, skip_since=None, on_saved=None):
+        """
+        Makes snapshots of all accounts (or given ones) and returns run
+        report with timings of stages (see get_stages), rate limit waits and
+        the slowest accounts.
+
+        :param accounts: iterable of api.models.Account or None
+        :param skip_since: datetime.datetime or None, used if accounts are
+        not given (see get_accounts)
+        :param on_saved: callable or None, called with list of accounts of
+        every saved write chunk (see flush)
+        :return: dictionary
+        """
+        if accounts is None:
+            accounts = self.get_accounts(skip_since)
+        accounts = list(accounts)
+        chunks = [accounts[i:i + self.chunk_size]
+                  for i in range(0, len(accounts), self.chunk_size)]
+
+        started_at = timezone.now()
+        start = time.monotonic()
+        self.saved = 0
+        self.failed = 0
+        self.unavailable = 0
+        self.saved_accounts = []
+        self.failed_accounts = []
+        self.timings = RequestTimings()
+        self.account_times = {}
+        self._on_saved = on_saved
+        # number of fetched chunks waiting for writer is limited, so fetched
+        # data of all accounts is never kept in memory at once
+        max_pending = 2 * self.concurrency
+        with collect_timings() as writer_timings, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = deque()
+            chunks = iter(chunks)
+            for chunk in chunks:
+                pending.append(executor.submit(self.fetch, chunk))
+                if len(pending) >= max_pending:
+                    break
+
+            while pending:
+                chunk, snapshot_dicts, timings, account_times = \
+                    pending.popleft().result()
+                self.timings.merge(timings)
+                self.account_times.update(account_times)
+                self.write(chunk, snapshot_dicts)
+
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending.append(executor.submit(self.fetch, next_chunk))
+            self.flush()
+        self.timings.merge(writer_timings)
+
+        seconds = time.monotonic() - start
+        return {
+            'started_at': started_at,
+            'finished_at': timezone.now(),
+            'accounts': len(accounts),
+            'snapshots': self.saved,
+            'failed': self.failed,
+            'unavailable': self.unavailable,
+            'seconds': seconds,
+            'accounts_per_second': len(accounts) / seconds if seconds else 0.0,
+            'rate_limit_waits': self.timings.calls.get('rate_limit_wait', 0),
+            'rate_limit_wait_seconds':
+                self.timings.stages.get('rate_limit_wait', 0.0),
+            'stages': self.get_stages(),
+            'slowest_accounts': self.get_slowest_accounts(accounts),
+        }
+
+
+def save_run_report(report, directory=None):
+    """
+    Saves run report of SnapshotRunner as bot_scorer.models.SnapshotRun and
+    JSON file (named after run's id and start time), runs exceeding
+    settings.BOT_SCORER_RUN_REPORT_KEEP are removed (see prune_run_reports).
+
+    :param report: dictionary (see SnapshotRunner.run)
+    :param directory: string or pathlib.Path, if None it is taken from
+    settings.BOT_SCORER_RUN_REPORT_DIR (None - file is not saved)
+    :return: bot_scorer.models.SnapshotRun
+    """
+    if directory is None:
+        directory = settings.BOT_SCORER_RUN_REPORT_DIR
+
+    run = SnapshotRun.objects.create(
+        started_at=report['started_at'],
+        finished_at=report['finished_at'],
+        accounts=report['accounts'],
+        snapshots=report['snapshots'],
+        failed=report['failed'],
+        unavailable=report['unavailable'],
+        seconds=report['seconds'],
+        accounts_per_second=report['accounts_per_second'],
+        rate_limit_waits=report['rate_limit_waits'],
+        rate_limit_wait_seconds=report['rate_limit_wait_seconds'],
+        stages=report['stages'],
+        slowest_accounts=report['slowest_accounts'],
+    )
+
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        name = f"snapshot_run_{run.id}_" \
+               f"{run.started_at.strftime('%Y%m%d_%H%M%S')}.json"
+        run.report_path = os.path.join(directory, name)
+        with open(run.report_path, 'w') as file:
+            json.dump(dict(report, id=run.id), file, indent=2,
+                      cls=DjangoJSONEncoder)
+        run.save(update_fields=['report_path'])
+
+    prune_run_reports()
+    return run
+
+
+def prune_run_reports(keep=None):
+    """
+    Removes all but keep latest runs with their JSON files.
+
+    :param keep: int or None, if None it is taken from
+    settings.BOT_SCORER_RUN_REPORT_KEEP (None - nothing is removed)
+    :return: int, number of removed runs
+    """
+    if keep is None:
+        keep = settings.BOT_SCORER_RUN_REPORT_KEEP
+        if keep is None:
+            return 0
+
+    old_runs = list(SnapshotRun.objects.order_by('-started_at', '-id')
+                    .values_list('id', 'report_path')[keep:])
+    for run_id, report_path in old_runs:
+        if report_path:
+            try:
+                os.remove(report_path)
+            except FileNotFoundError:
+                pass
+    SnapshotRun.objects.filter(
+        id__in=[run_id for run_id, report_path in old_runs]).delete()
+    return len(old_runs)
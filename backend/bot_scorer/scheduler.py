@@ -0,0 +1,238 @@
+import random
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Min
+from django.utils import timezone
+
+from api.models import Account, AccountSnapshot
+
+from .runner import SnapshotRunner, save_run_report
+
+# counters compared between consecutive snapshots to measure volatility
+VOLATILITY_FIELDS = ['statuses_count', 'followers_count', 'friends_count',
+                     'favourites_count', 'listed_count']
+
+# bot score change counted the same as this relative change of counters
+BOT_SCORE_WEIGHT = 1.0
+
+
+def get_volatility(history):
+    """
+    Returns how fast account changes - mean relative change of counters
+    plus weighted absolute change of bot score, per day, averaged over
+    consecutive snapshots.
+
+    :param history: list of dictionaries (snapshots' data with
+    date_of_snapshot, bot_score and VOLATILITY_FIELDS), oldest first
+    :return: float or None if there are less than 2 snapshots
+    """
+    if len(history) < 2:
+        return None
+
+    counters = np.array([[snapshot[field] for field in VOLATILITY_FIELDS]
+                         for snapshot in history], dtype=float)
+    bot_scores = np.array([snapshot['bot_score'] for snapshot in history])
+    days = np.array([(history[i]['date_of_snapshot'] -
+                      history[i - 1]['date_of_snapshot']).total_seconds()
+                     for i in range(1, len(history))]) / 86400
+    days = np.maximum(days, 1 / 24)  # snapshots made within an hour
+
+    counters_change = np.abs(np.diff(counters, axis=0)) / \
+        np.maximum(counters[:-1], 1)
+    change = counters_change.mean(axis=1) + \
+        BOT_SCORE_WEIGHT * np.abs(np.diff(bot_scores))
+    return float((change / days).mean())
+
+
+def get_snapshot_interval(history):
+    """
+    Returns time to the next snapshot of account. Base interval is
+    shortened for volatile accounts (divided by 1 + daily change /
+    settings.BOT_SCORER_SCHEDULE_VOLATILITY_SCALE, so it is halved when
+    daily change equals the scale) and lengthened for inactive ones,
+    suspended or not found accounts get the longest interval.
+
+    :param history: list of dictionaries (see get_volatility), oldest first
+    :return: datetime.timedelta
+    """
+    min_interval = settings.BOT_SCORER_SCHEDULE_MIN_INTERVAL
+    max_interval = settings.BOT_SCORER_SCHEDULE_MAX_INTERVAL
+    interval = settings.BOT_SCORER_SCHEDULE_BASE_INTERVAL
+    if not history:
+        return interval
+
+    latest = history[-1]
+    if latest['suspended_info'] != '':
+        return max_interval
+
+    volatility = get_volatility(history)
+    if volatility is not None:
+        interval = interval / (
+            1 + volatility / settings.BOT_SCORER_SCHEDULE_VOLATILITY_SCALE)
+    if not latest['is_active']:
+        interval = interval * settings.BOT_SCORER_SCHEDULE_INACTIVE_FACTOR
+    return min(max(interval, min_interval), max_interval)
+
+
+class SnapshotScheduler:
+    """
+    Makes snapshots of accounts when they are due. Account's due time
+    (Account.next_snapshot_at, indexed, so accounts table works as priority
+    queue) depends on its recent volatility and activity (see
+    get_snapshot_interval). Due times are jittered, so snapshots spread
+    evenly over the day instead of being made in one burst. Accounts which
+    could not be snapshotted are retried after
+    settings.BOT_SCORER_SCHEDULE_RETRY_INTERVAL.
+    """
+
+    def __init__(self, runner=None, batch_size=500, jitter=0.1, seed=None):
+        """
+        :param runner: bot_scorer.runner.SnapshotRunner or None (default
+        runner)
+        :param batch_size: int, max number of accounts snapshotted at once
+        :param jitter: float, due time is moved randomly by up to this
+        fraction of interval
+        :param seed: int or None, seed of jitter
+        """
+        self.runner = runner if runner is not None else SnapshotRunner()
+        self.batch_size = batch_size
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def get_due_accounts(self, now):
+        """
+        Returns accounts due at now, the most overdue first (accounts never
+        scheduled go first).
+
+        :param now: datetime.datetime
+        :return: list of api.models.Account
+        """
+        return list(Account.objects.filter(
+            Q(next_snapshot_at__isnull=True) | Q(next_snapshot_at__lte=now))
+            .order_by(F('next_snapshot_at').asc(nulls_first=True), 'id')
+            [:self.batch_size])
+
+    def get_histories(self, accounts, now):
+        """
+        Returns recent snapshots (from settings.BOT_SCORER_SCHEDULE_LOOKBACK)
+        of accounts, read with single query.
+
+        :param accounts: list of api.models.Account
+        :param now: datetime.datetime
+        :return: dictionary (account's id: list of dictionaries, oldest
+        first)
+        """
+        since = now - settings.BOT_SCORER_SCHEDULE_LOOKBACK
+        rows = AccountSnapshot.objects.filter(
+            account__in=[account.id for account in accounts],
+            date_of_snapshot__gte=since,
+        ).order_by('account_id', 'date_of_snapshot', 'id').values(
+            'account_id', 'date_of_snapshot', 'bot_score', 'is_active',
+            'suspended_info', *VOLATILITY_FIELDS)
+
+        histories = defaultdict(list)
+        for row in rows:
+            histories[row['account_id']].append(row)
+        return histories
+
+    def schedule(self, accounts, now):
+        """
+        Sets next due time of accounts. Accounts never scheduled before
+        (e.g. just added ones) are spread randomly over their interval.
+        Jittered interval is never shorter than
+        settings.BOT_SCORER_SCHEDULE_MIN_INTERVAL.
+
+        :param accounts: list of api.models.Account
+        :param now: datetime.datetime
+        :return:
+        """
+        min_interval = settings.BOT_SCORER_SCHEDULE_MIN_INTERVAL
+        histories = self.get_histories(accounts, now)
+        for account in accounts:
+            history = histories.get(account.id, [])
+            interval = get_snapshot_interval(history)
+            if account.next_snapshot_at is None:
+                factor = self.random.random()
+            else:
+                factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+            account.next_snapshot_at = now + max(interval * factor,
+                                                 min_interval)
+
+        with transaction.atomic():
+            Account.objects.bulk_update(accounts, ['next_snapshot_at'])
+
+    def schedule_retry(self, accounts, now):
+        """
+        Sets due time of accounts which could not be snapshotted to retry
+        interval (jittered) from now.
+
+        :param accounts: list of api.models.Account
+        :param now: datetime.datetime
+        :return:
+        """
+        interval = settings.BOT_SCORER_SCHEDULE_RETRY_INTERVAL
+        for account in accounts:
+            account.next_snapshot_at = now + interval * (
+                1 + self.random.uniform(0, self.jitter))
+
+        with transaction.atomic():
+            Account.objects.bulk_update(accounts, ['next_snapshot_at'])
+
+    def run_due(self, now=None):
+        """
+        Snapshots accounts which are due (up to batch size). Accounts of
+        every saved write chunk are scheduled in chunk's transaction, failed
+        ones are retried soon (see schedule_retry). Runner's report is saved
+        (see bot_scorer.runner.save_run_report).
+
+        :param now: datetime.datetime or None (current time)
+        :return: dictionary, runner's report with id of saved run
+        """
+        if now is None:
+            now = timezone.now()
+        accounts = self.get_due_accounts(now)
+        if not accounts:
+            return {'accounts': 0, 'snapshots': 0, 'failed': 0,
+                    'seconds': 0.0, 'accounts_per_second': 0.0}
+
+        report = self.runner.run(
+            accounts=accounts,
+            on_saved=lambda saved: self.schedule(saved, timezone.now()))
+        self.schedule_retry(self.runner.failed_accounts, timezone.now())
+        run = save_run_report(report)
+        return dict(report, id=run.id)
+
+    def get_next_due(self):
+        """
+        Returns the earliest due time of accounts.
+
+        :return: datetime.datetime or None
+        """
+        return Account.objects.aggregate(
+            next_due=Min('next_snapshot_at'))['next_due']
+
+    def run_forever(self, max_sleep=300):
+        """
+        Snapshots due accounts in a loop, sleeps until the next account is
+        due (but no longer than max_sleep seconds, so new accounts are
+        noticed).
+
+        :param max_sleep: int, seconds
+        :return:
+        """
+        while True:
+            report = self.run_due()
+            if report['accounts'] == self.batch_size:
+                continue
+
+            next_due = self.get_next_due()
+            sleep_time = max_sleep
+            if next_due is not None:
+                sleep_time = min(max_sleep, max(
+                    0.0, (next_due - timezone.now()).total_seconds()))
+            time.sleep(sleep_time)
@@ -0,0 +1,162 @@
+import numpy as np
+
+from django.db.models import Avg, Count, Min, Max
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+
+from api.models import AccountSnapshot
+
+# account data returned in time series
+SERIES_FIELDS = ['bot_score', 'followers_count', 'friends_count']
+
+# SQL functions truncating date of snapshot to bucket, from the smallest
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# approximate bucket lengths in days, used to choose bucket automatically
+BUCKET_DAYS = {
+    'day': 1,
+    'week': 7,
+    'month': 30,
+}
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Returns indexes of points chosen by Largest-Triangle-Three-Buckets
+    downsampling (keeps visual shape of the series).
+
+    :param x: numpy.ndarray, increasing
+    :param y: numpy.ndarray
+    :param threshold: int, number of points to return
+    :return: numpy.ndarray
+    """
+    length = len(x)
+    if threshold >= length:
+        return np.arange(length)
+    # too few points for buckets between the first and the last one
+    if threshold < 1:
+        return np.arange(0)
+    if threshold == 1:
+        return np.array([0])
+    if threshold == 2:
+        return np.array([0, length - 1])
+
+    bucket_size = (length - 2) / (threshold - 2)
+    indices = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(np.floor(i * bucket_size)) + 1
+        end = int(np.floor((i + 1) * bucket_size)) + 1
+        next_end = min(int(np.floor((i + 2) * bucket_size)) + 1, length)
+
+        # average point of the next bucket (the last point for last bucket)
+        if end < next_end:
+            average_x = x[end:next_end].mean()
+            average_y = y[end:next_end].mean()
+        else:
+            average_x = x[length - 1]
+            average_y = y[length - 1]
+
+        areas = np.abs((x[a] - average_x) * (y[start:end] - y[a]) -
+                       (x[a] - x[start:end]) * (average_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices.append(a)
+
+    indices.append(length - 1)
+    return np.array(indices)
+
+
+def choose_bucket(first_date, last_date, points):
+    """
+    Returns the smallest bucket which gives no more than requested number
+    of points (month if every bucket gives more, months are then downsampled
+    in get_snapshot_series).
+
+    :param first_date: datetime.datetime
+    :param last_date: datetime.datetime
+    :param points: int
+    :return: string
+    """
+    days = (last_date - first_date).days + 1
+    for bucket, bucket_days in BUCKET_DAYS.items():
+        if days / bucket_days <= points:
+            return bucket
+    return 'month'
+
+
+def get_snapshot_series(snapshots, points=500, bucket=None, mode='bucket'):
+    """
+    Returns time series of account's bot score, followers and friends count
+    as parallel lists, downsampled to no more than requested number of
+    points. In bucket mode values are averaged in SQL per day, week or month
+    (bucket is chosen automatically if not given), buckets exceeding points
+    are downsampled further with Largest-Triangle-Three-Buckets. In lttb
+    mode raw values are downsampled with Largest-Triangle-Three-Buckets (by
+    bot score), bucket can not be given then.
+
+    :param snapshots: django.db.models.QuerySet of snapshots of one account
+    :param points: int
+    :param bucket: string ('day', 'week', 'month') or None
+    :param mode: string ('bucket' or 'lttb')
+    :return: dictionary
+    """
+    if mode == 'lttb' and bucket is not None:
+        raise ValueError("Bucket can not be used in lttb mode")
+
+    summary = snapshots.aggregate(count=Count('id'),
+                                  first_date=Min('date_of_snapshot'),
+                                  last_date=Max('date_of_snapshot'))
+
+    if summary['count'] == 0:
+        output = {'bucket': None, 'date': []}
+        for field in SERIES_FIELDS:
+            output[field] = []
+        return output
+
+    if bucket is None and (mode == 'lttb' or summary['count'] <= points):
+        rows = list(snapshots.order_by('date_of_snapshot', 'id')
+                    .values_list('date_of_snapshot', *SERIES_FIELDS))
+        dates = [row[0] for row in rows]
+        values = np.array([row[1:] for row in rows], dtype=float) \
+            .reshape(-1, len(SERIES_FIELDS))
+
+        if mode == 'lttb':
+            timestamps = np.array([date.timestamp() for date in dates])
+            indices = lttb_indices(timestamps, values[:, 0], points)
+            dates = [dates[i] for i in indices]
+            values = values[indices]
+
+        output = {'bucket': None, 'date': [date.isoformat()
+                                           for date in dates]}
+        for i, field in enumerate(SERIES_FIELDS):
+            output[field] = values[:, i].tolist()
+        return output
+
+    if bucket is None:
+        bucket = choose_bucket(summary['first_date'], summary['last_date'],
+                               points)
+
+    averages = {}
+    for field in SERIES_FIELDS:
+        averages[field] = Avg(field)
+    rows = list(snapshots.order_by()
+                .annotate(bucket=BUCKETS[bucket]('date_of_snapshot'))
+                .values('bucket').annotate(**averages).order_by('bucket'))
+
+    if len(rows) > points:
+        timestamps = np.array([row['bucket'].timestamp() for row in rows])
+        bot_scores = np.array([row['bot_score'] for row in rows])
+        rows = [rows[i] for i in lttb_indices(timestamps, bot_scores,
+                                              points)]
+
+    output = {'bucket': bucket, 'date': []}
+    for field in SERIES_FIELDS:
+        output[field] = []
+    for row in rows:
+        output['date'].append(row['bucket'].date().isoformat())
+        for field in SERIES_FIELDS:
+            output[field].append(row[field])
+    return output
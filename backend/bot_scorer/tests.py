@@ -1,11 +1,151 @@
 import datetime
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+import numpy as np
 
 from sklearn.preprocessing import StandardScaler
 from sklearn.linear_model import LogisticRegression
 
-from .views import load_classifier, make_snapshot, get_most_important_features
+from tweepy import TweepError
+
+from api.models import Account, AccountSnapshot
+
+from . import twitter, views, workers
+from .cache import DjangoResultCache, LocMemResultCache, SingleFlight, \
+    get_cached_single_snapshot, get_snapshot_cache
+from .classifier import ClassifierRegistry
+from .export import export_snapshots, load_export
+from .fake_twitter import FakeTwitterServer
+from .metrics import MetricsRegistry, collect_timings, timed, \
+    stage_duration
+from .models import SnapshotRun
+from .runner import SnapshotRunner, save_run_report
+from .scheduler import SnapshotScheduler, get_snapshot_interval
+from .series import lttb_indices, get_snapshot_series
+from .twitter import TwitterClient
+from .workers import LeaseWorker
+from .views import load_classifier, make_snapshot, \
+    get_most_important_features, get_bot_scores, get_features_order, \
+    get_features_orders, get_snapshot_features, get_data_change, \
+    get_data_changes, make_snapshots, is_user_active
+
+
+FAKE_KEYS = dict.fromkeys(['CONSUMER_KEY', 'CONSUMER_SECRET', 'ACCESS_TOKEN',
+                           'ACCESS_TOKEN_SECRET'], 'x')
+
+
+class FakeTwitterAPI:
+    """Imitates tweepy.API with users kept in memory."""
+
+    def __init__(self, users, latency=0.0, broken_ids=()):
+        self.users = {user.id: user for user in users}
+        self.latency = latency
+        # ids which can not be fetched because of connection error
+        self.broken_ids = set(broken_ids)
+        # error raised by every users/lookup call (e.g. rate limit)
+        self.lookup_error = None
+        self.calls = []
+        # current and peak number of users/lookup calls made at once
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def lookup_users(self, user_ids):
+        self.calls.append('lookup_users')
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        if self.lookup_error is not None:
+            raise self.lookup_error
+        users = [self.users[twitter_id] for twitter_id in user_ids
+                 if twitter_id in self.users]
+        if not users:
+            raise TweepError([{'code': 17, 'message': 'No user matches for '
+                                                      'specified terms.'}])
+        return users
+
+    def get_user(self, user_id=None, screen_name=None):
+        self.calls.append('get_user')
+        time.sleep(self.latency)
+        user_id = user_id if user_id is not None else screen_name
+        if user_id in self.broken_ids:
+            raise TweepError('Failed to send request: timed out')
+        if user_id not in self.users:
+            raise TweepError([{'code': 63,
+                               'message': 'User has been suspended.'}])
+        return self.users[user_id]
+
+    def user_timeline(self, user_id=None, screen_name=None, count=1):
+        self.calls.append('user_timeline')
+        return [SimpleNamespace(created_at=datetime.datetime.now())]
+
+
+def make_fake_user(twitter_id):
+    """Returns object with the same data as tweepy.models.User has."""
+    return SimpleNamespace(
+        id=twitter_id, screen_name=f'name{twitter_id}',
+        name=f'Name {twitter_id}', location='', url=None, description='',
+        created_at=datetime.datetime(2020, 1, 1), statuses_count=twitter_id,
+        followers_count=2 * twitter_id, friends_count=3, favourites_count=4,
+        listed_count=5, default_profile=False, verified=False,
+        protected=False,
+    )
+
+
+class CountingTwitterHandler(BaseHTTPRequestHandler):
+    """Answers as users/show and counts opened connections."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if self.path.startswith('/1.1/users/show.json'):
+            body = {
+                'id': 1, 'screen_name': 'name1', 'name': 'Name 1',
+                'location': '', 'url': None, 'description': '',
+                'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+                'statuses_count': 1, 'followers_count': 2,
+                'friends_count': 3, 'favourites_count': 4, 'listed_count': 5,
+                'default_profile': False, 'verified': False,
+                'protected': False,
+            }
+        else:
+            body = []
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
 
 
 class ClassifierTests(TestCase):
@@ -20,7 +160,10 @@ class ClassifierTests(TestCase):
 
     def test_make_snapshot(self):
         """Tests making of snapshot."""
-        snapshot = make_snapshot(screen_name='BarackObama')
+        with FakeTwitterServer() as server:
+            client = TwitterClient(FAKE_KEYS, base_url=server.url)
+            snapshot = make_snapshot(screen_name='BarackObama', api=client)
+            client.close()
 
         self.assertIsInstance(snapshot['twitter_id'], int)
         self.assertIsInstance(snapshot['screen_name'], str)
@@ -66,3 +209,1003 @@ class ClassifierTests(TestCase):
         self.assertEqual('protected', output.popitem()[0])
         self.assertEqual('listed_count', output.popitem()[0])
         self.assertEqual('followers_count', output.popitem()[0])
+
+    def test_get_bot_scores(self):
+        """Tests if batch scoring gives the same scores as single scoring."""
+        records = [
+            {
+                'statuses_count': 71944,
+                'followers_count': 70787,
+                'friends_count': 1055,
+                'favourites_count': 36147,
+                'listed_count': 265,
+                'default_profile': False,
+                'verified': True,
+                'protected': False,
+            },
+            {
+                'statuses_count': 12,
+                'followers_count': 3,
+                'friends_count': 4012,
+                'favourites_count': 0,
+                'listed_count': 0,
+                'default_profile': True,
+                'verified': False,
+                'protected': False,
+            },
+        ]
+        classifier = load_classifier()
+
+        scores = get_bot_scores(records)
+
+        self.assertEqual(2, len(scores))
+        for record, score in zip(records, scores):
+            single = classifier.predict_proba(
+                [[record[key] for key in record]])[0][1]
+            self.assertAlmostEqual(single, score)
+        self.assertEqual(0, len(get_bot_scores([])))
+
+
+class MakeSnapshotsTests(TestCase):
+    """Tests fetching many accounts at once"""
+
+    def test_make_snapshots(self):
+        """Tests if accounts are fetched in chunks and mapped back."""
+        api = FakeTwitterAPI([make_fake_user(i) for i in range(1, 251)])
+        twitter_ids = list(range(1, 253))
+
+        snapshots = make_snapshots(twitter_ids, api=api)
+
+        self.assertEqual(3, api.calls.count('lookup_users'))
+        self.assertEqual(2, api.calls.count('get_user'))
+        self.assertEqual(twitter_ids, sorted(snapshots))
+        self.assertEqual('name7', snapshots[7]['screen_name'])
+        self.assertEqual('', snapshots[7]['url'])
+        self.assertEqual('User has been suspended.',
+                         snapshots[252]['suspended_info'])
+        self.assertEqual(252, snapshots[252]['twitter_id'])
+
+    def test_make_snapshots_failed_account(self):
+        """Tests if account not fetched because of error is left out."""
+        api = FakeTwitterAPI([make_fake_user(1)], broken_ids=[2])
+        errors = {}
+
+        snapshots = make_snapshots([1, 2, 3], api=api, errors=errors)
+
+        self.assertEqual([1, 3], sorted(snapshots))
+        self.assertEqual({2: 'Failed to send request: timed out'}, errors)
+        with self.assertRaises(TweepError):
+            make_snapshot(twitter_id=2, api=api)
+
+    def test_make_snapshots_failed_lookup(self):
+        """Tests if chunk is not fetched one by one when lookup fails."""
+        api = FakeTwitterAPI([make_fake_user(i) for i in range(1, 4)])
+        api.lookup_error = TweepError([{'code': 88,
+                                        'message': 'Rate limit exceeded'}])
+        errors = {}
+
+        snapshots = make_snapshots([1, 2, 3], api=api, errors=errors)
+
+        self.assertEqual({}, snapshots)
+        self.assertEqual(dict.fromkeys([1, 2, 3], 'Rate limit exceeded'),
+                         errors)
+        self.assertNotIn('get_user', api.calls)
+
+        # no matching user - accounts are fetched one by one
+        api.lookup_error = None
+        snapshots = make_snapshots([4, 5], api=api)
+        self.assertEqual(2, api.calls.count('get_user'))
+        self.assertEqual('User has been suspended.',
+                         snapshots[4]['suspended_info'])
+
+
+class SnapshotRunnerTests(TestCase):
+    """Tests snapshot job runner"""
+
+    def setUp(self):
+        for i in range(1, 11):
+            Account.objects.create(twitter_id=i, screen_name=f'old{i}')
+        self.api = FakeTwitterAPI([make_fake_user(i) for i in range(1, 10)],
+                                  latency=0.1)
+
+    def test_run(self):
+        """Tests if chunks are fetched concurrently and all are saved."""
+        runner = SnapshotRunner(concurrency=5, chunk_size=2,
+                                api_factory=lambda: self.api)
+
+        report = runner.run()
+
+        self.assertGreater(self.api.max_in_flight, 1)
+        self.assertLessEqual(self.api.max_in_flight, 5)
+        self.assertEqual(10, report['accounts'])
+        self.assertEqual(10, report['snapshots'])
+        self.assertGreater(report['accounts_per_second'], 0)
+        self.assertEqual(10, AccountSnapshot.objects.count())
+        # renamed accounts get new screen name, suspended ones keep old one
+        self.assertEqual('name3',
+                         Account.objects.get(twitter_id=3).screen_name)
+        self.assertEqual('old10',
+                         Account.objects.get(twitter_id=10).screen_name)
+
+    def test_run_failed_fetch(self):
+        """Tests if accounts which could not be fetched are not saved."""
+        self.api.broken_ids = {10}
+        self.api.users.pop(9)
+        runner = SnapshotRunner(concurrency=2, chunk_size=2,
+                                api_factory=lambda: self.api)
+
+        report = runner.run()
+
+        self.assertEqual(9, report['snapshots'])
+        self.assertEqual(1, report['failed'])
+        self.assertEqual(1, report['unavailable'])
+        self.assertFalse(AccountSnapshot.objects.filter(
+            account__twitter_id=10).exists())
+
+    def test_run_resumed_after_failed_chunk(self):
+        """Tests if accounts from failed write chunk are snapshotted again."""
+        runner = SnapshotRunner(concurrency=2, chunk_size=2,
+                                write_chunk_size=4,
+                                api_factory=lambda: self.api)
+        bulk_create = AccountSnapshot.objects.bulk_create
+        calls = []
+
+        def failing_bulk_create(snapshots, *args, **kwargs):
+            calls.append(len(snapshots))
+            if len(calls) == 2:
+                raise DatabaseError("disk I/O error")
+            return bulk_create(snapshots, *args, **kwargs)
+
+        start = datetime.datetime.now(datetime.timezone.utc)
+        with mock.patch.object(AccountSnapshot.objects, 'bulk_create',
+                               failing_bulk_create):
+            report = runner.run(skip_since=start)
+
+        self.assertEqual([4, 4, 2], calls)
+        self.assertEqual(6, report['snapshots'])
+        self.assertEqual(4, report['failed'])
+        self.assertEqual('old5',
+                         Account.objects.get(twitter_id=5).screen_name)
+
+        report = runner.run(skip_since=start)
+
+        self.assertEqual(4, report['accounts'])
+        self.assertEqual(10, AccountSnapshot.objects.count())
+        self.assertEqual('name5',
+                         Account.objects.get(twitter_id=5).screen_name)
+
+    def test_run_report(self):
+        """Tests timings of stages, the slowest accounts and saved report."""
+        runner = SnapshotRunner(concurrency=5, chunk_size=2,
+                                api_factory=lambda: self.api)
+
+        report = runner.run()
+
+        self.assertLessEqual({'fetch', 'predict', 'features_order',
+                              'db_write'}, set(report['stages']))
+        self.assertEqual(5, report['stages']['fetch']['calls'])
+        self.assertEqual(0, report['rate_limit_waits'])
+        # suspended account is fetched once again alone
+        slowest = report['slowest_accounts']
+        seconds = [account['seconds'] for account in slowest]
+        self.assertEqual(sorted(seconds, reverse=True), seconds)
+        suspended = [account for account in slowest
+                     if account['twitter_id'] == 10]
+        self.assertGreaterEqual(suspended[0]['seconds'], 0.1)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        run = save_run_report(report, directory=directory)
+
+        run = SnapshotRun.objects.get(id=run.id)
+        self.assertEqual(10, run.snapshots)
+        self.assertEqual(1, run.unavailable)
+        self.assertEqual(report['stages'], run.stages)
+        with open(run.report_path) as file:
+            saved = json.load(file)
+        self.assertEqual(run.id, saved['id'])
+        self.assertEqual(10, len(saved['slowest_accounts']))
+
+        User.objects.create_superuser('admin', password='password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get(reverse(
+            'admin:bot_scorer_snapshotrun_change', args=[run.id]))
+        self.assertContains(response, 'old10')
+        response = self.client.get(
+            reverse('admin:bot_scorer_snapshotrun_changelist'))
+        self.assertEqual(200, response.status_code)
+
+
+class TwitterClientTests(TestCase):
+    """Tests Twitter API client"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          CountingTwitterHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.client = TwitterClient(
+            FAKE_KEYS, base_url=f'http://127.0.0.1:{self.server.server_port}/1.1')
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        """Tests if many snapshots are made through one connection."""
+        for i in range(5):
+            snapshot = make_snapshot(twitter_id=1, api=self.client)
+            self.assertEqual('name1', snapshot['screen_name'])
+            self.assertFalse(snapshot['is_active'])
+
+        self.assertEqual(1, self.server.connections)
+
+    def test_client_shared_by_threads(self):
+        """Tests if client can be used by many threads at once."""
+        results = []
+
+        def fetch():
+            for i in range(5):
+                results.append(self.client.get_user(user_id=1).screen_name)
+
+        threads = [threading.Thread(target=fetch) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(['name1'] * 20, results)
+        self.assertLessEqual(self.server.connections, 4)
+
+    def test_rate_limit_wait_counted(self):
+        """Tests if waits for rate limit reset are timed."""
+        self.client._limits['/users/show.json'] = (0, time.time() + 60)
+
+        with mock.patch.object(twitter.time, 'sleep') as sleep, \
+                collect_timings() as timings:
+            self.client.get_user(user_id=1)
+
+        sleep.assert_called_once()
+        self.assertEqual(1, timings.calls['rate_limit_wait'])
+        self.assertEqual(1, timings.calls['twitter_api'])
+
+
+class IsUserActiveTests(TestCase):
+    """Tests checking of user's activity"""
+
+    def setUp(self):
+        self.api = FakeTwitterAPI([])
+
+    def test_embedded_status_used(self):
+        """Tests if embedded status is used instead of timeline."""
+        user = make_fake_user(1)
+        user.status = SimpleNamespace(
+            created_at=datetime.datetime.now() - datetime.timedelta(days=91))
+
+        self.assertFalse(is_user_active(self.api, user))
+        user.status.created_at = datetime.datetime.now()
+        self.assertTrue(is_user_active(self.api, user))
+        self.assertEqual([], self.api.calls)
+
+    def test_timeline_fallback(self):
+        """Tests if timeline is fetched only when status is missing."""
+        user = make_fake_user(1)
+        self.assertTrue(is_user_active(self.api, user))
+        self.assertEqual(['user_timeline'], self.api.calls)
+
+        user.protected = True
+        self.assertFalse(is_user_active(self.api, user))
+        self.assertEqual(['user_timeline'], self.api.calls)
+
+
+class FeaturesOrderTests(TestCase):
+    """Tests storing of features' importance order"""
+
+    def setUp(self):
+        self.features = {
+            'statuses_count': 71944,
+            'followers_count': 70787,
+            'friends_count': 1055,
+            'favourites_count': 36147,
+            'listed_count': 265,
+            'default_profile': False,
+            'verified': True,
+            'protected': False,
+        }
+        account = Account.objects.create(twitter_id=1, screen_name='name1')
+        self.snapshot = AccountSnapshot.objects.create(
+            account=account, name='name1', created_at='2020-01-01T00:00Z',
+            bot_score=0.5, is_active=True, **self.features)
+
+    def test_get_features_order(self):
+        """Tests if stored order gives the same features as calculation."""
+        self.assertEqual('14720536', get_features_order(self.features))
+
+        self.snapshot.features_order = get_features_order(self.features)
+        self.assertEqual(list(get_most_important_features(self.features)
+                              .items()),
+                         list(get_snapshot_features(self.snapshot).items()))
+
+    def test_get_features_orders_parity(self):
+        """Tests if batch orders are identical to single ones."""
+        generator = random.Random(0)
+        records = []
+        for i in range(500):
+            records.append({
+                'statuses_count': generator.randint(0, 10**6),
+                'followers_count': generator.choice(
+                    [0, generator.randint(0, 10**8)]),
+                'friends_count': generator.randint(0, 10**5),
+                'favourites_count': generator.randint(0, 10**6),
+                'listed_count': generator.choice(
+                    [0, generator.randint(0, 10**4)]),
+                'default_profile': generator.random() < 0.5,
+                'verified': generator.random() < 0.5,
+                'protected': generator.random() < 0.5,
+            })
+
+        orders = get_features_orders(records)
+
+        self.assertEqual([get_features_order(record) for record in records],
+                         orders)
+        self.assertEqual([], get_features_orders([]))
+
+    def test_backfill_features_order(self):
+        """Tests if backfill command stores order of old snapshots."""
+        call_command('backfill_features_order', stdout=io.StringIO())
+
+        self.snapshot.refresh_from_db()
+        self.assertEqual(get_features_order(self.features),
+                         self.snapshot.features_order)
+
+
+class DataChangeTests(TestCase):
+    """Tests calculating of data change between snapshots"""
+
+    def setUp(self):
+        self.account = Account.objects.create(twitter_id=1,
+                                              screen_name='name1')
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+        self.snapshots = []
+        for i, followers_count in enumerate([5, 7, 7, 3, 9]):
+            snapshot = AccountSnapshot.objects.create(
+                account=self.account, name='name1',
+                created_at='2020-01-01T00:00Z', statuses_count=1,
+                followers_count=followers_count, friends_count=1,
+                favourites_count=1, listed_count=1, default_profile=False,
+                verified=False, protected=False, bot_score=0.5,
+                is_active=True)
+            AccountSnapshot.objects.filter(pk=snapshot.pk).update(
+                date_of_snapshot=self.now - datetime.timedelta(days=5 - i))
+            self.snapshots.append(snapshot.pk)
+
+    def test_get_data_change(self):
+        """Tests if snapshot is compared with directly previous one."""
+        changes = [get_data_change(snapshot_id)['followers_count']
+                   for snapshot_id in self.snapshots]
+
+        self.assertEqual([None, 'up', '-', 'down', 'up'], changes)
+
+    def test_get_data_changes(self):
+        """Tests if range changes are the same as single ones."""
+        since = self.now - datetime.timedelta(days=3, hours=12)
+
+        with self.assertNumQueries(1):
+            changes = get_data_changes(self.account.id, since=since)
+
+        self.assertEqual(self.snapshots[2:], list(changes))
+        for snapshot_id in self.snapshots[2:]:
+            self.assertEqual(get_data_change(snapshot_id),
+                             changes[snapshot_id])
+        self.assertEqual(
+            {self.snapshots[0]: get_data_change(self.snapshots[0])},
+            get_data_changes(self.account.id, until=self.now -
+                             datetime.timedelta(days=4, hours=12)))
+
+
+class SeriesTests(TestCase):
+    """Tests downsampling of time series"""
+
+    def test_lttb_indices(self):
+        """Tests if LTTB keeps ends, requested length and spikes."""
+        x = np.arange(1000, dtype=float)
+        y = np.zeros(1000)
+        y[500] = 1.0
+
+        indices = lttb_indices(x, y, 50)
+
+        self.assertEqual(50, len(indices))
+        self.assertEqual(0, indices[0])
+        self.assertEqual(999, indices[-1])
+        self.assertIn(500, indices)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual([0], list(lttb_indices(x, y, 1)))
+        self.assertEqual([0, 999], list(lttb_indices(x, y, 2)))
+
+    def test_get_snapshot_series(self):
+        """Tests if long history is averaged in buckets."""
+        account = Account.objects.create(twitter_id=1, screen_name='name1')
+        start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        for i in range(60):
+            snapshot = AccountSnapshot.objects.create(
+                account=account, name='name1', created_at=start,
+                statuses_count=1, followers_count=i, friends_count=1,
+                favourites_count=1, listed_count=1, default_profile=False,
+                verified=False, protected=False, bot_score=i / 100,
+                is_active=True)
+            AccountSnapshot.objects.filter(pk=snapshot.pk).update(
+                date_of_snapshot=start + datetime.timedelta(days=i))
+        snapshots = AccountSnapshot.objects.filter(account=account)
+
+        weekly = get_snapshot_series(snapshots, points=10)
+        lttb = get_snapshot_series(snapshots, points=10, mode='lttb')
+
+        self.assertEqual('week', weekly['bucket'])
+        self.assertLessEqual(len(weekly['date']), 10)
+        # 2020-01-01 is Wednesday, first week has 5 snapshots
+        self.assertEqual('2019-12-30', weekly['date'][0])
+        self.assertEqual(2.0, weekly['followers_count'][0])
+        self.assertEqual(10, len(lttb['date']))
+        self.assertEqual([0.0, 0.59], [lttb['bot_score'][0],
+                                       lttb['bot_score'][-1]])
+
+        # 2 months are downsampled to the first one
+        monthly = get_snapshot_series(snapshots, points=1, bucket='month')
+        self.assertEqual(['2020-01-01'], monthly['date'])
+        with self.assertRaises(ValueError):
+            get_snapshot_series(snapshots, bucket='day', mode='lttb')
+
+
+class DjangoResultCacheTests(TestCase):
+    """Tests result cache stored in Django's cache"""
+
+    def test_clear_keeps_other_keys(self):
+        """Tests if clear removes only entries of result cache."""
+        django_cache = caches['default']
+        django_cache.set('session:1', 'data')
+        self.addCleanup(django_cache.clear)
+        cache = DjangoResultCache(ttl=60, max_size=10)
+        cache.set('name1', {'twitter_id': 1})
+        self.assertEqual({'twitter_id': 1}, cache.get('name1'))
+
+        cache.clear()
+
+        self.assertIsNone(cache.get('name1'))
+        self.assertEqual('data', django_cache.get('session:1'))
+        cache.set('name1', {'twitter_id': 2})
+        self.assertEqual({'twitter_id': 2}, cache.get('name1'))
+
+
+class LocMemResultCacheTests(TestCase):
+    """Tests in-process result cache"""
+
+    def test_lru_eviction(self):
+        """Tests if least recently used entry is removed from full cache."""
+        cache = LocMemResultCache(ttl=60, max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_ttl(self):
+        """Tests if expired entries are not returned."""
+        cache = LocMemResultCache(ttl=0.05, max_size=2)
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('a'))
+
+
+class SingleFlightTests(TestCase):
+    """Tests coalescing of concurrent calls"""
+
+    def run_concurrently(self, single_flight, function, count=5):
+        """Calls function with the same key from many threads at once."""
+        results = []
+
+        def call():
+            try:
+                results.append(single_flight.do('key', function))
+            except TweepError as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_result_shared(self):
+        """Tests if concurrent callers share one call's result."""
+        calls = []
+
+        def function():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'result'
+
+        results = self.run_concurrently(SingleFlight(), function)
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(['result'] * 5, [result for result, shared
+                                          in results])
+        self.assertEqual(4, [shared for result, shared
+                             in results].count(True))
+
+    def test_error_shared(self):
+        """Tests if concurrent callers get the same error."""
+        error = TweepError([{'code': 50, 'message': 'User not found.'}])
+
+        def function():
+            time.sleep(0.2)
+            raise error
+
+        results = self.run_concurrently(SingleFlight(), function)
+
+        self.assertEqual([error] * 5, results)
+
+    def test_cached_single_snapshot(self):
+        """Tests if concurrent requests for the same account share fetch."""
+        directory = tempfile.mkdtemp()
+        get_snapshot_cache().clear()
+        api = FakeTwitterAPI([make_fake_user(1)], latency=0.2)
+        api.users['Name1'] = api.users[1]
+        statuses = []
+
+        def request(screen_name):
+            statuses.append(get_cached_single_snapshot(screen_name)[1])
+
+        try:
+            with override_settings(BOT_SCORER_SINGLE_LOCK_DIR=directory), \
+                    mock.patch.object(views, 'get_api', return_value=api):
+                threads = [threading.Thread(target=request, args=(name,))
+                           for name in ['Name1', 'name1', '@NAME1']]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                request('name1')
+        finally:
+            shutil.rmtree(directory)
+            get_snapshot_cache().clear()
+
+        self.assertEqual(1, api.calls.count('get_user'))
+        self.assertEqual(['COALESCED', 'COALESCED', 'MISS'],
+                         sorted(statuses[:3]))
+        self.assertEqual('HIT', statuses[3])
+
+
+class ClassifierRegistryTests(TestCase):
+    """Tests classifier registry"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'pipe.p')
+        shutil.copyfile(settings.BOT_SCORER_CLASSIFIER_PATH, self.path)
+        self.registry = ClassifierRegistry(path=self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pipeline_loaded_once(self):
+        """Tests if pipeline is unpickled only once."""
+        first = self.registry.get()
+        for i in range(10):
+            self.assertIs(first, self.registry.get())
+
+        self.assertEqual(1, self.registry.loads)
+        self.assertEqual(10, self.registry.hits)
+
+    def test_pipeline_reloaded_after_change(self):
+        """Tests if pipeline is reloaded only when file content changes."""
+        first = self.registry.get()
+
+        # same content, different mtime
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIs(first, self.registry.get())
+        self.assertEqual(1, self.registry.loads)
+
+        # different content
+        with open(self.path, 'ab') as file:
+            file.write(b'\n')
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+        self.assertIsNot(first, self.registry.get())
+        self.assertEqual(2, self.registry.loads)
+
+
+class ExportTests(TestCase):
+    """Tests columnar export of snapshots"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        account = Account.objects.create(twitter_id=7, screen_name='name1')
+        for i in range(5):
+            AccountSnapshot.objects.create(
+                account=account, name='name1', description=f'text{i % 2}',
+                created_at='2020-01-01T00:00Z', statuses_count=1,
+                followers_count=i, friends_count=1, favourites_count=1,
+                listed_count=1, default_profile=False, verified=False,
+                protected=False, bot_score=i / 10, is_active=True,
+                features_order='01234567')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_export_npy(self):
+        """Exports snapshots in small chunks and loads them back."""
+        manifest = export_snapshots(self.directory, chunk_size=2)
+        self.assertEqual(5, manifest['tables']['snapshots']['rows'])
+
+        manifest, tables = load_export(self.directory)
+        snapshots = tables['snapshots']
+        self.assertIsInstance(snapshots['followers_count'], np.memmap)
+        self.assertEqual([0, 1, 2, 3, 4],
+                         snapshots['followers_count'].tolist())
+        self.assertEqual([7] * 5, snapshots['twitter_id'].tolist())
+        self.assertEqual(np.datetime64('2020-01-01T00:00:00'),
+                         snapshots['created_at'][0])
+        self.assertEqual('01234567', snapshots['features_order'][0])
+
+        profiles = tables['profiles']
+        descriptions = dict(zip(profiles['id'].tolist(),
+                                profiles['description'].tolist()))
+        self.assertEqual(['text0', 'text1', 'text0', 'text1', 'text0'],
+                         [descriptions[profile_id] for profile_id
+                          in snapshots['profile_id'].tolist()])
+
+    def test_export_empty(self):
+        """Exports empty table."""
+        AccountSnapshot.objects.all().delete()
+        export_snapshots(self.directory)
+        manifest, tables = load_export(self.directory)
+        self.assertEqual(0, len(tables['snapshots']['id']))
+
+
+class SnapshotRunRetentionTests(TestCase):
+    """Tests removal of old run reports"""
+
+    def test_old_runs_removed(self):
+        """Tests if only the latest runs and their files are kept."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        runs = []
+        with override_settings(BOT_SCORER_RUN_REPORT_KEEP=2):
+            for i in range(3):
+                started_at = start + datetime.timedelta(hours=i)
+                runs.append(save_run_report({
+                    'started_at': started_at, 'finished_at': started_at,
+                    'accounts': 1, 'snapshots': 1, 'failed': 0,
+                    'unavailable': 0, 'seconds': 1.0,
+                    'accounts_per_second': 1.0, 'rate_limit_waits': 0,
+                    'rate_limit_wait_seconds': 0.0, 'stages': {},
+                    'slowest_accounts': [],
+                }, directory=directory))
+
+        self.assertEqual([runs[2].id, runs[1].id],
+                         list(SnapshotRun.objects.values_list('id',
+                                                              flat=True)))
+        self.assertFalse(os.path.exists(runs[0].report_path))
+        self.assertTrue(os.path.exists(runs[1].report_path))
+
+
+@override_settings(BOT_SCORER_RUN_REPORT_DIR=None)
+class SchedulerTests(TestCase):
+    """Tests adaptive snapshot scheduling"""
+
+    def make_history(self, followers, is_active=True, suspended_info=''):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return [{
+            'date_of_snapshot': now - datetime.timedelta(days=len(followers)
+                                                         - i),
+            'bot_score': 0.5, 'is_active': is_active,
+            'suspended_info': suspended_info, 'statuses_count': 100,
+            'followers_count': count, 'friends_count': 10,
+            'favourites_count': 10, 'listed_count': 1,
+        } for i, count in enumerate(followers)]
+
+    def test_snapshot_interval(self):
+        """Tests if volatile accounts are refreshed more often."""
+        base = settings.BOT_SCORER_SCHEDULE_BASE_INTERVAL
+        stable = get_snapshot_interval(self.make_history([100] * 7))
+        volatile = get_snapshot_interval(
+            self.make_history([100, 150, 90, 200, 120, 300, 100]))
+        inactive = get_snapshot_interval(
+            self.make_history([100] * 7, is_active=False))
+        suspended = get_snapshot_interval(
+            self.make_history([100] * 7, suspended_info='suspended'))
+
+        self.assertEqual(base, get_snapshot_interval([]))
+        self.assertEqual(base, stable)
+        self.assertEqual(settings.BOT_SCORER_SCHEDULE_MIN_INTERVAL, volatile)
+        self.assertGreater(inactive, stable)
+        self.assertEqual(settings.BOT_SCORER_SCHEDULE_MAX_INTERVAL,
+                         suspended)
+
+    def test_run_due(self):
+        """Tests if only due accounts are snapshotted and rescheduled."""
+        for i in range(1, 11):
+            Account.objects.create(twitter_id=i, screen_name=f'name{i}')
+        api = FakeTwitterAPI([make_fake_user(i) for i in range(1, 11)])
+        runner = SnapshotRunner(concurrency=2, chunk_size=5,
+                                api_factory=lambda: api)
+        scheduler = SnapshotScheduler(runner=runner, batch_size=4, seed=0)
+
+        start = datetime.datetime.now(datetime.timezone.utc)
+        report = scheduler.run_due()
+        self.assertEqual(4, report['snapshots'])
+        self.assertEqual(4, SnapshotRun.objects.get(id=report['id'])
+                         .snapshots)
+        self.assertEqual(4, scheduler.run_due()['snapshots'])
+        self.assertEqual(2, scheduler.run_due()['snapshots'])
+        self.assertEqual(0, scheduler.run_due()['accounts'])
+
+        self.assertEqual(10, AccountSnapshot.objects.count())
+        due_times = Account.objects.values_list('next_snapshot_at',
+                                                flat=True)
+        for due_time in due_times:
+            self.assertGreaterEqual(
+                due_time, start + settings.BOT_SCORER_SCHEDULE_MIN_INTERVAL)
+            self.assertLess(due_time, start +
+                            settings.BOT_SCORER_SCHEDULE_BASE_INTERVAL +
+                            datetime.timedelta(minutes=1))
+        # accounts snapshotted for the first time are spread over the day
+        self.assertGreater(max(due_times) - min(due_times),
+                           datetime.timedelta(hours=6))
+
+    def test_run_due_failed(self):
+        """Tests if accounts which were not saved are retried soon."""
+        for i in range(1, 5):
+            Account.objects.create(twitter_id=i, screen_name=f'name{i}')
+        api = FakeTwitterAPI([make_fake_user(i) for i in range(1, 4)],
+                             broken_ids={4})
+        runner = SnapshotRunner(concurrency=1, chunk_size=2,
+                                write_chunk_size=1, api_factory=lambda: api)
+        scheduler = SnapshotScheduler(runner=runner, seed=0)
+        bulk_create = AccountSnapshot.objects.bulk_create
+
+        def failing_bulk_create(snapshots, *args, **kwargs):
+            if snapshots[0].account.twitter_id == 3:
+                raise DatabaseError("disk I/O error")
+            return bulk_create(snapshots, *args, **kwargs)
+
+        start = datetime.datetime.now(datetime.timezone.utc)
+        with mock.patch.object(AccountSnapshot.objects, 'bulk_create',
+                               failing_bulk_create):
+            report = scheduler.run_due()
+
+        self.assertEqual(2, report['snapshots'])
+        self.assertEqual([3, 4], sorted(account.twitter_id for account
+                                        in runner.failed_accounts))
+        self.assertEqual(2, AccountSnapshot.objects.count())
+        retry = settings.BOT_SCORER_SCHEDULE_RETRY_INTERVAL
+        for account in Account.objects.filter(twitter_id__in=[3, 4]):
+            self.assertGreater(account.next_snapshot_at, start + retry)
+            self.assertLess(account.next_snapshot_at,
+                            start + 1.1 * retry + datetime.timedelta(
+                                minutes=1))
+        for account in Account.objects.filter(twitter_id__in=[1, 2]):
+            self.assertGreater(account.next_snapshot_at, start)
+
+
+@override_settings(BOT_SCORER_RUN_REPORT_DIR=None)
+class LeaseWorkerTests(TestCase):
+    """Tests snapshot workers claiming accounts with leases"""
+
+    def setUp(self):
+        for i in range(1, 11):
+            Account.objects.create(twitter_id=i, screen_name=f'name{i}')
+        self.api = FakeTwitterAPI([make_fake_user(i) for i in range(1, 11)])
+
+    def make_worker(self, worker_id):
+        runner = SnapshotRunner(concurrency=1, chunk_size=5,
+                                api_factory=lambda: self.api)
+        return LeaseWorker(worker_id=worker_id, runner=runner, batch_size=4,
+                           lease_time=datetime.timedelta(minutes=10))
+
+    def test_batches_disjoint(self):
+        """Tests if workers claim different accounts."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        worker1 = self.make_worker('worker1')
+        worker2 = self.make_worker('worker2')
+
+        batch1 = {account.id for account in worker1.get_due_accounts(now)}
+        batch2 = {account.id for account in worker2.get_due_accounts(now)}
+
+        self.assertEqual(4, len(batch1))
+        self.assertEqual(4, len(batch2))
+        self.assertFalse(batch1 & batch2)
+
+    def test_snapshotted_candidates_not_claimed(self):
+        """Tests if accounts snapshotted by other worker after selection of
+        candidates are not claimed again."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        worker1 = self.make_worker('worker1')
+        worker2 = self.make_worker('worker2')
+
+        candidates = worker1.get_candidates(now)
+        self.assertEqual(4, worker2.run_due(now)['snapshots'])
+        claimed = worker1.claim(candidates, now)
+
+        self.assertEqual([], claimed)
+        self.assertEqual(4, AccountSnapshot.objects.count())
+
+    def test_expired_lease_reclaimed(self):
+        """Tests if accounts of crashed worker are claimed again."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        crashed = {account.id for account in
+                   self.make_worker('crashed').get_due_accounts(now)}
+        worker = self.make_worker('worker')
+
+        claimed = set()
+        for account in worker.get_due_accounts(now):
+            claimed.add(account.id)
+        for account in worker.get_due_accounts(now):
+            claimed.add(account.id)
+        self.assertFalse(crashed & claimed)
+
+        later = now + datetime.timedelta(minutes=11)
+        reclaimed = {account.id for account in
+                     worker.get_due_accounts(later)}
+        self.assertEqual(crashed, reclaimed)
+
+    def test_run_cycle(self):
+        """Tests if every account is snapshotted once per cycle."""
+        worker1 = self.make_worker('worker1')
+        worker2 = self.make_worker('worker2')
+
+        first = worker1.run_due()
+        report2 = worker2.run_cycle()
+        report1 = worker1.run_cycle()
+
+        self.assertEqual(4, first['snapshots'])
+        self.assertEqual(10, AccountSnapshot.objects.count())
+        self.assertEqual(10, AccountSnapshot.objects
+                         .values('account').distinct().count())
+        self.assertEqual(0, report1['accounts'])
+        self.assertEqual(6, report2['snapshots'])
+        self.assertFalse(Account.objects.exclude(lease_owner='').exists())
+        self.assertEqual(3, SnapshotRun.objects.count())
+        self.assertEqual(6, sum(SnapshotRun.objects.filter(
+            id__in=report2['runs']).values_list('snapshots', flat=True)))
+
+    def test_saved_chunk_released(self):
+        """Tests if saved chunk is rescheduled when batch is interrupted."""
+        lookup_users = self.api.lookup_users
+
+        def failing_lookup_users(user_ids):
+            if 3 in user_ids:
+                raise RuntimeError("worker killed")
+            return lookup_users(user_ids)
+
+        self.api.lookup_users = failing_lookup_users
+        runner = SnapshotRunner(concurrency=1, chunk_size=2,
+                                write_chunk_size=2,
+                                api_factory=lambda: self.api)
+        worker = LeaseWorker(worker_id='worker', runner=runner, batch_size=4)
+        with self.assertRaises(RuntimeError):
+            worker.run_due()
+
+        saved = Account.objects.filter(twitter_id__in=[1, 2])
+        self.assertFalse(saved.exclude(lease_owner='').exists())
+        self.assertEqual(2, AccountSnapshot.objects.count())
+        self.assertEqual(2, Account.objects.filter(
+            lease_owner='worker').count())
+        claimed = {account.twitter_id for account in
+                   self.make_worker('other').get_due_accounts(
+                       datetime.datetime.now(datetime.timezone.utc))}
+        self.assertEqual({5, 6, 7, 8}, claimed)
+
+    def test_heartbeat_survives_database_error(self):
+        """Tests if leases are still renewed after failed renewal."""
+        worker = LeaseWorker(worker_id='worker', runner=SnapshotRunner(),
+                             lease_time=datetime.timedelta(seconds=0.03))
+        worker._claimed = list(Account.objects.all())
+        calls = []
+
+        def renew(accounts):
+            calls.append(len(accounts))
+            if len(calls) == 1:
+                raise DatabaseError("database is locked")
+
+        stop = threading.Event()
+        with mock.patch.object(worker, 'renew', renew), \
+                self.assertLogs(workers.logger, 'ERROR'):
+            thread = threading.Thread(target=worker.heartbeat, args=(stop,))
+            thread.start()
+            time.sleep(0.1)
+            stop.set()
+            thread.join()
+
+        self.assertGreater(len(calls), 1)
+
+
+class FakeTwitterServerTests(TestCase):
+    """Tests local stand-in of Twitter API"""
+
+    def test_errors_and_rate_limit(self):
+        """Tests suspended users and rate limit headers."""
+        with FakeTwitterServer(suspended_rate=0.5, rate_limit=100) as server:
+            client = TwitterClient(FAKE_KEYS, base_url=server.url)
+            snapshots = make_snapshots(list(range(1, 41)), api=client,
+                                       chunk_size=20)
+            client.close()
+
+        suspended = [snapshot for snapshot in snapshots.values()
+                     if snapshot['suspended_info'] != '']
+        self.assertEqual(40, len(snapshots))
+        self.assertTrue(0 < len(suspended) < 40)
+        self.assertEqual('User has been suspended.',
+                         suspended[0]['suspended_info'])
+        self.assertEqual(2, server.calls['/1.1/users/lookup.json'])
+        self.assertEqual(len(suspended),
+                         server.calls['/1.1/users/show.json'])
+        remaining, reset_time = client._limits['/users/lookup.json']
+        self.assertEqual(98, remaining)
+
+    def test_benchmark_snapshot_job(self):
+        """Runs snapshot job benchmark for few accounts."""
+        handle, path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+
+        call_command('benchmark_snapshot_job', accounts=30, latency=0,
+                     json_path=path, stdout=io.StringIO())
+
+        with open(path) as file:
+            results = json.load(file)
+        self.assertEqual(30, results['snapshots'])
+        self.assertGreater(results['api_calls_per_account'], 0)
+        self.assertFalse(Account.objects.exists())
+
+
+class MetricsTests(TestCase):
+    """Tests metrics of requests and bot_scorer's stages"""
+
+    def test_histogram_render(self):
+        """Tests Prometheus text format of histogram and counter."""
+        registry = MetricsRegistry()
+        histogram = registry.histogram('duration_seconds', "Duration",
+                                       ['view'], buckets=[0.1, 1])
+        for value in [0.05, 0.5, 5]:
+            histogram.observe(value, view='a"b')
+        registry.counter('calls', "Calls").inc(2)
+
+        lines = registry.render().splitlines()
+        self.assertEqual([
+            '# HELP calls Calls',
+            '# TYPE calls counter',
+            'calls_total 2',
+            '# HELP duration_seconds Duration',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{view="a\\"b",le="0.1"} 1',
+            'duration_seconds_bucket{view="a\\"b",le="1"} 2',
+            'duration_seconds_bucket{view="a\\"b",le="+Inf"} 3',
+            'duration_seconds_count{view="a\\"b"} 3',
+            'duration_seconds_sum{view="a\\"b"} 5.55',
+        ], lines)
+        with self.assertRaises(ValueError):
+            histogram.observe(1)
+
+    def test_timed_collects_request_timings(self):
+        """Tests if stage's time is added to timings of current thread."""
+        count = stage_duration.get_count(stage='predict')
+        with collect_timings() as timings:
+            views.get_bot_scores([[1, 2, 3, 4, 5, False, False, False]])
+        views.get_bot_scores([[1, 2, 3, 4, 5, False, False, False]])
+
+        self.assertEqual(count + 2, stage_duration.get_count(stage='predict'))
+        self.assertEqual({'predict'}, set(timings.stages) - {'model_load'})
+        with timed('other'):
+            pass
+        self.assertNotIn('other', timings.stages)
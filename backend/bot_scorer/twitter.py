@@ -0,0 +1,255 @@
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_oauthlib import OAuth1
+
+from django.conf import settings
+
+from tweepy import TweepError, RateLimitError
+from tweepy.models import User, Status
+
+from .metrics import timed
+
+# needs to import file with Twitter API keys with this structure:
+# keys = {
+#     "ACCESS_TOKEN": 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx',
+#     "ACCESS_TOKEN_SECRET": 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx',
+#     "CONSUMER_KEY": 'xxxxxxxxxxxxxxxxxxxxxxxxx',
+#     "CONSUMER_SECRET": 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx',
+# }
+
+from .twitter_api_keys import keys
+
+
+class TwitterClient:
+    """
+    Client of Twitter API v1.1 endpoints used by bot_scorer (users/show,
+    users/lookup, statuses/user_timeline). Has the same interface and
+    returns the same models and errors as tweepy.API, but all requests go
+    through one long-lived session, so HTTP connections are kept alive and
+    reused. Client can be shared by many threads.
+    """
+
+    def __init__(self, keys=keys, base_url=None, pool_size=None, timeout=60,
+                 wait_on_rate_limit=True, verify=None):
+        """
+        :param keys: dictionary with Twitter API keys (see
+        bot_scorer.twitter_api_keys)
+        :param base_url: string, if None it is taken from
+        settings.BOT_SCORER_TWITTER_API_URL
+        :param pool_size: int, max number of kept alive connections, if None
+        it is taken from settings.BOT_SCORER_TWITTER_POOL_SIZE
+        :param timeout: int, seconds
+        :param wait_on_rate_limit: bool, if True client sleeps until rate
+        limit is reset instead of raising RateLimitError
+        :param verify: bool or string (path of CA bundle), if None it is taken
+        from settings.BOT_SCORER_TWITTER_API_VERIFY
+        """
+        if base_url is None:
+            base_url = settings.BOT_SCORER_TWITTER_API_URL
+        if pool_size is None:
+            pool_size = settings.BOT_SCORER_TWITTER_POOL_SIZE
+        if verify is None:
+            verify = settings.BOT_SCORER_TWITTER_API_VERIFY
+
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.wait_on_rate_limit = wait_on_rate_limit
+        self.auth = OAuth1(keys['CONSUMER_KEY'], keys['CONSUMER_SECRET'],
+                           keys['ACCESS_TOKEN'], keys['ACCESS_TOKEN_SECRET'])
+
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # rate limits are counted separately for every endpoint
+        self._limits_lock = threading.Lock()
+        self._limits = {}
+
+    def wait_for_rate_limit(self, path):
+        """
+        Sleeps until rate limit of endpoint is reset if there are no calls
+        left.
+
+        :param path: string
+        :return:
+        """
+        with self._limits_lock:
+            remaining, reset_time = self._limits.get(path, (None, None))
+        if remaining is not None and remaining < 1:
+            sleep_time = reset_time - time.time()
+            if sleep_time > 0:
+                # waits are counted and timed (see bot_scorer.metrics)
+                with timed('rate_limit_wait'):
+                    time.sleep(sleep_time + 5)  # sleep for few extra sec
+
+    def update_rate_limit(self, path, response):
+        """
+        Remembers endpoint's rate limit from response headers.
+
+        :param path: string
+        :param response: requests.Response
+        :return:
+        """
+        remaining = response.headers.get('x-rate-limit-remaining')
+        reset_time = response.headers.get('x-rate-limit-reset')
+        if response.status_code in (420, 429):
+            remaining = 0
+            if reset_time is None:
+                reset_time = time.time() + \
+                             float(response.headers.get('retry-after', 60))
+
+        if remaining is not None and reset_time is not None:
+            with self._limits_lock:
+                self._limits[path] = (int(remaining), float(reset_time))
+
+    def request(self, method, path, params):
+        """
+        Sends request to Twitter API and returns decoded response.
+
+        :param method: string, 'GET' or 'POST'
+        :param path: string, e.g. '/users/show.json'
+        :param params: dictionary
+        :return: dictionary or list
+        """
+        while True:
+            if self.wait_on_rate_limit:
+                self.wait_for_rate_limit(path)
+
+            try:
+                with timed('twitter_api'):
+                    if method == 'GET':
+                        response = self.session.get(
+                            self.base_url + path, params=params,
+                            auth=self.auth, timeout=self.timeout)
+                    else:
+                        response = self.session.post(
+                            self.base_url + path, data=params,
+                            auth=self.auth, timeout=self.timeout)
+            except requests.RequestException as e:
+                raise TweepError('Failed to send request: %s' % e)
+
+            self.update_rate_limit(path, response)
+            if response.status_code in (420, 429) and \
+                    self.wait_on_rate_limit:
+                continue
+            break
+
+        if not 200 <= response.status_code < 300:
+            try:
+                error_object = json.loads(response.text)
+                if 'error' in error_object:
+                    reason = error_object['error']
+                    api_code = error_object.get('code')
+                else:
+                    reason = error_object['errors']
+                    api_code = reason[0].get('code')
+            except (ValueError, KeyError, IndexError, TypeError):
+                reason = "Twitter error response: status code = %s" % \
+                         response.status_code
+                api_code = None
+
+            if response.status_code in (420, 429):
+                raise RateLimitError(reason, response)
+            raise TweepError(reason, response, api_code=api_code)
+
+        try:
+            return response.json()
+        except ValueError as e:
+            raise TweepError('Failed to parse JSON payload: %s' % e)
+
+    def get_user(self, user_id=None, screen_name=None):
+        """
+        Returns Twitter user (users/show).
+
+        :param user_id: id
+        :param screen_name: string
+        :return: tweepy.models.User
+        """
+        params = {}
+        if user_id is not None:
+            params['user_id'] = user_id
+        if screen_name is not None:
+            params['screen_name'] = screen_name
+        return User.parse(self, self.request('GET', '/users/show.json',
+                                             params))
+
+    def lookup_users(self, user_ids=None, screen_names=None):
+        """
+        Returns up to 100 Twitter users (users/lookup). Users which were not
+        found are not returned.
+
+        :param user_ids: list of ids
+        :param screen_names: list of strings
+        :return: list of tweepy.models.User
+        """
+        params = {}
+        if user_ids:
+            params['user_id'] = ','.join(str(i) for i in user_ids)
+        if screen_names:
+            params['screen_name'] = ','.join(screen_names)
+        return User.parse_list(
+            self, self.request('POST', '/users/lookup.json', params))
+
+    def user_timeline(self, user_id=None, screen_name=None, count=None):
+        """
+        Returns user's latest statuses (statuses/user_timeline).
+
+        :param user_id: id
+        :param screen_name: string
+        :param count: int
+        :return: list of tweepy.models.Status
+        """
+        params = {}
+        if user_id is not None:
+            params['user_id'] = user_id
+        if screen_name is not None:
+            params['screen_name'] = screen_name
+        if count is not None:
+            params['count'] = count
+        return Status.parse_list(
+            self, self.request('GET', '/statuses/user_timeline.json', params))
+
+    def close(self):
+        """
+        Closes all kept alive connections.
+
+        :return:
+        """
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns process-wide Twitter API client, makes it on first call.
+
+    :return: bot_scorer.twitter.TwitterClient
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TwitterClient(keys)
+    return _client
+
+
+def reset_client():
+    """
+    Closes process-wide client, next get_client call makes new one.
+
+    :return:
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
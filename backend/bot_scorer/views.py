@@ -1,99 +1,199 @@
 import datetime
-import tweepy
+import time
 import sklearn
 import numpy as np
-import pickle
 
 from tweepy import TweepError
 
-# needs to import file with Twitter API keys with this structure:
-# keys = {
-#     "ACCESS_TOKEN": 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx',
-#     "ACCESS_TOKEN_SECRET": 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx',
-#     "CONSUMER_KEY": 'xxxxxxxxxxxxxxxxxxxxxxxxx',
-#     "CONSUMER_SECRET": 'xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx',
-# }
-
-from .twitter_api_keys import keys
+from django.db.models import Q, F, Value, Subquery, Window, DateTimeField
+from django.db.models.functions import Coalesce, Lag
 
 from api.models import AccountSnapshot
 
+from .classifier import registry
+from .metrics import timed
+from .twitter import get_client
+
+# order of features expected by the classifier
+FEATURES = [
+    'statuses_count', 'followers_count', 'friends_count', 'favourites_count',
+    'listed_count', 'default_profile', 'verified', 'protected',
+]
+
+# max number of accounts in single users/lookup request
+LOOKUP_CHUNK_SIZE = 100
+
+# account data compared between snapshots (see get_data_change)
+CHANGE_FIELDS = FEATURES + ['bot_score', 'is_active']
+
+# codes of Twitter API errors meaning that account is not available (no user
+# matches, user not found, user suspended), snapshot of such account keeps
+# the error message, other errors (e.g. connection) are raised
+ACCOUNT_ERROR_CODES = {17, 50, 63}
+
+# code of users/lookup error answered when none of ids was found
+NO_USER_MATCHES_CODE = 17
+
 
 def load_classifier():
     """
-    Loads pipeline (standard scaler and logistic regression) from the file
+    Returns pipeline (standard scaler and logistic regression). Pipeline is
+    unpickled once per process and reloaded only when the file changes.
 
     :return: sklearn.pipeline.Pipeline
     """
-    pipe = pickle.load(open('bot_scorer/pipe.p', 'rb'))
-    return pipe
+    return registry.get()
+
+
+def get_features_matrix(features_records):
+    """
+    Returns (N, 8) matrix of features in the order expected by the
+    classifier. Records may be dictionaries (keys as in FEATURES) or
+    sequences which are already in this order.
+
+    :param features_records: list of dictionaries or lists
+    :return: numpy.ndarray
+    """
+    rows = []
+    for record in features_records:
+        if isinstance(record, dict):
+            rows.append([record[feature] for feature in FEATURES])
+        else:
+            rows.append(list(record))
+
+    features = np.array(rows)
+    return features.reshape(-1, len(FEATURES))
+
+
+def get_bot_scores(features_records):
+    """
+    Returns bot scores of many accounts calculated with single classifier
+    call.
+
+    :param features_records: list of dictionaries or lists (see
+    get_features_matrix) or numpy.ndarray of shape (N, 8)
+    :return: numpy.ndarray
+    """
+    if isinstance(features_records, np.ndarray):
+        features = features_records.reshape(-1, len(FEATURES))
+    else:
+        features = get_features_matrix(features_records)
+
+    if features.shape[0] == 0:
+        return np.empty(0)
+
+    classifier = load_classifier()
+    with timed('predict'):
+        return classifier.predict_proba(features)[:, 1]
+
+
+def get_api():
+    """
+    Returns process-wide Twitter API client (keeps connections alive, can be
+    shared by many threads)
+
+    :return: bot_scorer.twitter.TwitterClient
+    """
+    return get_client()
+
+
+def get_error_code(error):
+    """
+    Returns code of Twitter API error.
+
+    :param error: tweepy.TweepError
+    :return: int or None (error not answered by Twitter API)
+    """
+    if error.api_code is not None:
+        return error.api_code
+    try:
+        return error.args[0][0]['code']
+    except (IndexError, KeyError, TypeError):
+        return None
+
 
+def get_error_message(error):
+    """
+    Returns message of Twitter API error.
 
-def make_snapshot(twitter_id=-1, screen_name="-1"):
+    :param error: tweepy.TweepError
+    :return: string
     """
-    Returns dictionary with current data of specific Twitter account
+    try:
+        return error.args[0][0]['message']
+    except (IndexError, KeyError, TypeError):
+        return str(error.reason)
+
+
+def get_error_snapshot(twitter_id, screen_name, error):
+    """
+    Returns snapshot dictionary of account which could not be fetched (e.g.
+    suspended or not found)
 
     :param twitter_id: id
     :param screen_name: string
+    :param error: string, error message from Twitter API
     :return: dictionary
     """
-    authentication = tweepy.OAuthHandler(keys['CONSUMER_KEY'],
-                                         keys['CONSUMER_SECRET'])
-    authentication.set_access_token(
-        keys['ACCESS_TOKEN'], keys['ACCESS_TOKEN_SECRET'])
-    api = tweepy.API(authentication, wait_on_rate_limit=True)
+    output_dict = {
+        'twitter_id': twitter_id,
+        'screen_name': screen_name,
+        'name': screen_name,
+        'location': error,
+        'url': error,
+        'description': error,
+        'created_at': "0001-01-01 00:00",
+        'statuses_count': 0,
+        'followers_count': 0,
+        'friends_count': 0,
+        'favourites_count': 0,
+        'listed_count': 0,
+        'default_profile': False,
+        'verified': False,
+        'protected': False,
+        'bot_score': 0.0,
+        'is_active': False,
+        'suspended_info': error,
+    }
+    return output_dict
 
-    try:
-        if twitter_id != -1:
-            user = api.get_user(user_id=twitter_id)
-        elif screen_name != '-1':
-            user = api.get_user(screen_name=screen_name)
-        else:
-            raise ValueError("Missing twitter_id or screen_name as argument")
-    except TweepError as e:
-        error = e.args[0][0]['message']
-
-        output_dict = {
-            'twitter_id': twitter_id,
-            'screen_name': screen_name,
-            'name': screen_name,
-            'location': error,
-            'url': error,
-            'description': error,
-            'created_at': "0001-01-01 00:00",
-            'statuses_count': 0,
-            'followers_count': 0,
-            'friends_count': 0,
-            'favourites_count': 0,
-            'listed_count': 0,
-            'default_profile': False,
-            'verified': False,
-            'protected': False,
-            'bot_score': 0.0,
-            'is_active': False,
-            'suspended_info': error,
-        }
-        return output_dict
-
-    features = [
-        user.statuses_count, user.followers_count, user.friends_count,
-        user.favourites_count, user.listed_count, user.default_profile,
-        user.verified, user.protected
-    ]
+
+def get_user_features(users):
+    """
+    Returns (N, 8) matrix of features of Twitter users
+
+    :param users: list of tweepy.models.User
+    :return: numpy.ndarray
+    """
+    features = []
+    for user in users:
+        features.append([
+            user.statuses_count, user.followers_count, user.friends_count,
+            user.favourites_count, user.listed_count, user.default_profile,
+            user.verified, user.protected
+        ])
 
     features = np.array(features)
-    features = features.reshape(1, -1)
+    return features.reshape(-1, len(FEATURES))
 
-    classifier = load_classifier()
 
-    proba_result = classifier.predict_proba(features)
-    bot_score = proba_result[0][1]
+def is_user_active(api, user):
+    """
+    Checks if user has tweeted in the last 90 days. Uses user's latest
+    status embedded in user object, timeline is fetched only if it is
+    missing (protected accounts' timelines are not available).
 
+    :param api: tweepy.API
+    :param user: tweepy.models.User
+    :return: bool
+    """
     try:
-        if twitter_id != -1:
-            tweet = api.user_timeline(user_id=twitter_id, count=1)[0]
-        elif screen_name != '-1':
-            tweet = api.user_timeline(screen_name=screen_name, count=1)[0]
+        if hasattr(user, 'status'):
+            tweet = user.status
+        elif user.protected:
+            return False
+        else:
+            tweet = api.user_timeline(user_id=user.id, count=1)[0]
 
         diff_days = (datetime.date.today() - tweet.created_at.date()).days
         is_active = True
@@ -105,6 +205,19 @@ def make_snapshot(twitter_id=-1, screen_name="-1"):
     except TweepError:
         is_active = False
 
+    return is_active
+
+
+def get_user_snapshot(api, user, features, bot_score):
+    """
+    Returns snapshot dictionary of fetched Twitter user
+
+    :param api: tweepy.API
+    :param user: tweepy.models.User
+    :param features: numpy.ndarray, user's row of get_user_features
+    :param bot_score: float
+    :return: dictionary
+    """
     output_dict = {
         'twitter_id': user.id,
         'screen_name': user.screen_name,
@@ -113,16 +226,17 @@ def make_snapshot(twitter_id=-1, screen_name="-1"):
         'url': user.url,
         'description': user.description,
         'created_at': user.created_at,
-        'statuses_count': features[0][0],
-        'followers_count': features[0][1],
-        'friends_count': features[0][2],
-        'favourites_count': features[0][3],
-        'listed_count': features[0][4],
-        'default_profile': features[0][5],
-        'verified': features[0][6],
-        'protected': features[0][7],
-        'bot_score': bot_score,
-        'is_active': is_active,
+        # numpy values converted to Python's int, bool and float
+        'statuses_count': int(features[0]),
+        'followers_count': int(features[1]),
+        'friends_count': int(features[2]),
+        'favourites_count': int(features[3]),
+        'listed_count': int(features[4]),
+        'default_profile': bool(features[5]),
+        'verified': bool(features[6]),
+        'protected': bool(features[7]),
+        'bot_score': float(bot_score),
+        'is_active': is_user_active(api, user),
         'suspended_info': "",
     }
 
@@ -133,15 +247,150 @@ def make_snapshot(twitter_id=-1, screen_name="-1"):
     return output_dict
 
 
-def get_most_important_features(features_input):
+def make_snapshot(twitter_id=-1, screen_name="-1", api=None):
     """
-    Returns features sorted from most important
+    Returns dictionary with current data of specific Twitter account.
+    Suspended or not found account gets snapshot with the error (see
+    ACCOUNT_ERROR_CODES), other errors are raised.
+
+    :param twitter_id: id
+    :param screen_name: string
+    :param api: tweepy.API or TwitterClient, if None get_api is used
+    :return: dictionary
+    """
+    if api is None:
+        api = get_api()
+
+    try:
+        if twitter_id != -1:
+            user = api.get_user(user_id=twitter_id)
+        elif screen_name != '-1':
+            user = api.get_user(screen_name=screen_name)
+        else:
+            raise ValueError("Missing twitter_id or screen_name as argument")
+    except TweepError as e:
+        if get_error_code(e) not in ACCOUNT_ERROR_CODES:
+            raise
+        return get_error_snapshot(twitter_id, screen_name,
+                                  get_error_message(e))
+
+    features = get_user_features([user])
+    bot_score = get_bot_scores(features)[0]
+
+    return get_user_snapshot(api, user, features[0], bot_score)
+
+
+def make_snapshots(twitter_ids, api=None, chunk_size=LOOKUP_CHUNK_SIZE,
+                   account_times=None, errors=None):
+    """
+    Returns current data of many Twitter accounts. Accounts are fetched in
+    chunks with users/lookup and scored with single classifier call per
+    chunk. Accounts missing in the lookup response (e.g. suspended) are
+    fetched one by one to get the same error data as make_snapshot gives.
+    Accounts which could not be fetched because of other errors (see
+    make_snapshot) are left out of the result, as well as whole chunk if
+    lookup fails for other reason than no matching user (e.g. rate limit,
+    connection error).
+
+    :param twitter_ids: list of ids
+    :param api: tweepy.API or TwitterClient, if None get_api is used
+    :param chunk_size: int, number of ids per lookup (max 100)
+    :param account_times: dictionary or None, filled with seconds spent on
+    every account alone (activity check or fetching of account missing in
+    lookup), without time of lookup and scoring shared by its chunk
+    :param errors: dictionary or None, filled with messages of errors of
+    accounts left out
+    :return: dictionary (twitter_id: dictionary)
+    """
+    if api is None:
+        api = get_api()
+
+    snapshots = {}
+    for i in range(0, len(twitter_ids), chunk_size):
+        chunk = twitter_ids[i:i + chunk_size]
+        try:
+            users = api.lookup_users(user_ids=chunk)
+        except TweepError as e:
+            if get_error_code(e) != NO_USER_MATCHES_CODE:
+                # accounts are not fetched one by one, so outage or rate
+                # limit does not cost chunk_size calls more
+                if errors is not None:
+                    message = get_error_message(e)
+                    errors.update(dict.fromkeys(chunk, message))
+                continue
+            # Twitter answers with error if none of ids was found
+            users = []
+
+        chunk_ids = set(chunk)
+        users = [user for user in users if user.id in chunk_ids]
+        if users:
+            features = get_user_features(users)
+            bot_scores = get_bot_scores(features)
+
+            for user, user_features, bot_score in zip(users, features,
+                                                      bot_scores):
+                start = time.perf_counter()
+                snapshots[user.id] = get_user_snapshot(api, user,
+                                                       user_features,
+                                                       bot_score)
+                if account_times is not None:
+                    account_times[user.id] = time.perf_counter() - start
+
+        for twitter_id in chunk:
+            if twitter_id not in snapshots:
+                start = time.perf_counter()
+                try:
+                    snapshots[twitter_id] = make_snapshot(
+                        twitter_id=twitter_id, api=api)
+                except TweepError as e:
+                    if errors is not None:
+                        errors[twitter_id] = get_error_message(e)
+                if account_times is not None:
+                    account_times[twitter_id] = time.perf_counter() - start
+
+    return snapshots
+
+
+def get_single_snapshot(screen_name):
+    """
+    Returns current data of specific Twitter account with features sorted
+    from most important (data of api/snapshot/single/ endpoint)
+
+    :param screen_name: string
+    :return: dictionary
+    """
+    snapshot_dict = make_snapshot(screen_name=screen_name)
+
+    features = {}
+    for feature in FEATURES:
+        features[feature] = snapshot_dict[feature]
+
+    output_dict = {
+        'twitter_id': snapshot_dict['twitter_id'],
+        'name': snapshot_dict['name'],
+        'screen_name': snapshot_dict['screen_name'],
+        'location': snapshot_dict['location'],
+        'url': snapshot_dict['url'],
+        'description': snapshot_dict['description'],
+        'created_at': snapshot_dict['created_at'],
+        'features': get_most_important_features(features),
+        'bot_score': snapshot_dict['bot_score'],
+        'is_active': snapshot_dict['is_active'],
+        'suspended_info': snapshot_dict['suspended_info'],
+    }
+    return output_dict
+
+
+def get_features_order(features_input):
+    """
+    Returns features' importance order as compact string of indexes (see
+    FEATURES), from most to least important, e.g. '61352047'
 
     :param features_input: dictionary
-    :return: list
+    :return: string
     """
     features = []
-    for feature in features_input:
+    for feature in FEATURES:
         features.append(features_input[feature])
 
     features = np.array(features)
@@ -149,35 +398,178 @@ def get_most_important_features(features_input):
 
     pipe = load_classifier()
 
-    features_std = pipe['standardscaler'].transform(features)
-    coefs = pipe['logisticregression'].coef_[0]
-
-    multiplified_coefs = []
-    for i in range(8):
-        multiplified_coefs.append(coefs[i] * features_std[0][i])
-
-    multiplified_coefs_dict = {
-        'statuses_count': multiplified_coefs[0],
-        'followers_count': multiplified_coefs[1],
-        'friends_count': multiplified_coefs[2],
-        'favourites_count': multiplified_coefs[3],
-        'listed_count': multiplified_coefs[4],
-        'default_profile': multiplified_coefs[5],
-        'verified': multiplified_coefs[6],
-        'protected': multiplified_coefs[7],
-    }
+    with timed('features_order'):
+        features_std = pipe['standardscaler'].transform(features)
+        coefs = pipe['logisticregression'].coef_[0]
+
+        multiplified_coefs = []
+        for i in range(8):
+            multiplified_coefs.append(coefs[i] * features_std[0][i])
+
+    sorted_indexes = []
+    for index, value in sorted(enumerate(multiplified_coefs),
+                               key=lambda item: item[1], reverse=True):
+        sorted_indexes.append(str(index))
 
-    sorted_keys = []
-    for key, value in sorted(multiplified_coefs_dict.items(),
-                             key=lambda item: item[1], reverse=True):
-        sorted_keys.append(key)
+    return ''.join(sorted_indexes)
 
+
+def get_features_orders(features_records):
+    """
+    Returns features' importance orders (see get_features_order) of many
+    snapshots calculated with single scaler transform and argsort
+
+    :param features_records: list of dictionaries or lists (see
+    get_features_matrix)
+    :return: list of strings
+    """
+    features = get_features_matrix(features_records)
+    if features.shape[0] == 0:
+        return []
+
+    pipe = load_classifier()
+
+    with timed('features_order'):
+        features_std = pipe['standardscaler'].transform(features)
+        multiplified_coefs = features_std * \
+            pipe['logisticregression'].coef_[0]
+
+        # stable sort of negated values keeps ties in FEATURES order, the
+        # same way as sorted(..., reverse=True) does
+        sorted_indexes = np.argsort(-multiplified_coefs, axis=1,
+                                    kind='stable')
+    return [''.join(map(str, row)) for row in sorted_indexes.tolist()]
+
+
+def fill_features_orders(snapshots):
+    """
+    Sets features' importance order of snapshots saved without it (not
+    saved to the database). Orders are calculated with single call of
+    get_features_orders.
+
+    :param snapshots: list of api.models.AccountSnapshot
+    :return:
+    """
+    missing = [snapshot for snapshot in snapshots
+               if not snapshot.features_order]
+    records = [[getattr(snapshot, feature) for feature in FEATURES]
+               for snapshot in missing]
+
+    for snapshot, features_order in zip(missing,
+                                        get_features_orders(records)):
+        snapshot.features_order = features_order
+
+
+def get_ordered_features(features_input, features_order):
+    """
+    Returns features sorted according to features' importance order
+
+    :param features_input: dictionary
+    :param features_order: string (see get_features_order)
+    :return: dictionary
+    """
     output = {}
-    for key in sorted_keys:
+    for index in features_order:
+        key = FEATURES[int(index)]
         output[key] = features_input[key]
     return output
 
 
+def get_most_important_features(features_input):
+    """
+    Returns features sorted from most important
+
+    :param features_input: dictionary
+    :return: dictionary
+    """
+    return get_ordered_features(features_input,
+                                get_features_order(features_input))
+
+
+def get_snapshot_features(snapshot):
+    """
+    Returns snapshot's features sorted from most important. Uses order
+    stored in the snapshot, calculates it only for snapshots saved without
+    it.
+
+    :param snapshot: api.models.AccountSnapshot
+    :return: dictionary
+    """
+    features = {}
+    for feature in FEATURES:
+        features[feature] = getattr(snapshot, feature)
+
+    features_order = snapshot.features_order
+    if not features_order:
+        features_order = get_features_order(features)
+    return get_ordered_features(features, features_order)
+
+
+def get_previous_snapshot(snapshot, fields=None):
+    """
+    Returns snapshot of the same account made directly before input snapshot
+    or None if input snapshot is the first one
+
+    :param snapshot: api.models.AccountSnapshot
+    :param fields: list of strings, only these fields are loaded
+    :return: api.models.AccountSnapshot or None
+    """
+    previous_snapshots = AccountSnapshot.objects.filter(
+        Q(date_of_snapshot__lt=snapshot.date_of_snapshot) |
+        Q(date_of_snapshot=snapshot.date_of_snapshot, id__lt=snapshot.id),
+        account_id=snapshot.account_id,
+    ).order_by('-date_of_snapshot', '-id')
+
+    if fields is not None:
+        previous_snapshots = previous_snapshots.only(*fields)
+    return previous_snapshots.first()
+
+
+def compare_data(data, previous_data):
+    """
+    Returns change (up, same or down) of every value between two
+    dictionaries, None for every value if there is no previous data
+
+    :param data: dictionary
+    :param previous_data: dictionary or None
+    :return: dictionary
+    """
+    data_difference = {}
+
+    for key in CHANGE_FIELDS:
+        if previous_data is None:
+            data_difference[key] = None
+        elif data[key] > previous_data[key]:
+            data_difference[key] = 'up'
+        elif data[key] == previous_data[key]:
+            data_difference[key] = '-'
+        else:
+            data_difference[key] = 'down'
+
+    return data_difference
+
+
+def get_snapshot_data_change(snapshot):
+    """
+    Calculates change of features and other account data (up, same or down)
+    between input snapshot and previous one
+
+    :param snapshot: api.models.AccountSnapshot
+    :return: dictionary
+    """
+    previous_snapshot = get_previous_snapshot(snapshot, fields=CHANGE_FIELDS)
+    if previous_snapshot is None:
+        return compare_data(None, None)
+
+    data = {}
+    previous_data = {}
+    for key in CHANGE_FIELDS:
+        data[key] = getattr(snapshot, key)
+        previous_data[key] = getattr(previous_snapshot, key)
+
+    return compare_data(data, previous_data)
+
+
 def get_data_change(snapshot_id):
     """
     Calculates change of features and other account data (up, same or down)
@@ -187,59 +579,58 @@ def get_data_change(snapshot_id):
     :return: dictionary
     """
     snapshot = AccountSnapshot.objects.get(id=snapshot_id)
-    snapshots = list(AccountSnapshot.objects.all().filter(
-        account=snapshot.account).order_by('-date_of_snapshot'))
-    if snapshots[-1] == snapshot:
-        return {
-            'statuses_count': None,
-            'followers_count': None,
-            'friends_count': None,
-            'favourites_count': None,
-            'listed_count': None,
-            'default_profile': None,
-            'verified': None,
-            'protected': None,
-            'bot_score': None,
-            'is_active': None
-        }
-    else:
-        snapshot_index = snapshots.index(snapshot)
-        previous_snapshot = snapshots[snapshot_index + 1]
-
-        data = {
-            'statuses_count': snapshot.statuses_count,
-            'followers_count': snapshot.followers_count,
-            'friends_count': snapshot.friends_count,
-            'favourites_count': snapshot.favourites_count,
-            'listed_count': snapshot.listed_count,
-            'default_profile': snapshot.default_profile,
-            'verified': snapshot.verified,
-            'protected': snapshot.protected,
-            'bot_score': snapshot.bot_score,
-            'is_active': snapshot.is_active
-        }
-
-        previous_data = {
-            'statuses_count': previous_snapshot.statuses_count,
-            'followers_count': previous_snapshot.followers_count,
-            'friends_count': previous_snapshot.friends_count,
-            'favourites_count': previous_snapshot.favourites_count,
-            'listed_count': previous_snapshot.listed_count,
-            'default_profile': previous_snapshot.default_profile,
-            'verified': previous_snapshot.verified,
-            'protected': previous_snapshot.protected,
-            'bot_score': previous_snapshot.bot_score,
-            'is_active': previous_snapshot.is_active
-        }
-
-        data_difference = {}
-
-        for key in previous_data:
-            if data[key] > previous_data[key]:
-                data_difference[key] = 'up'
-            elif data[key] == previous_data[key]:
-                data_difference[key] = '-'
-            else:
-                data_difference[key] = 'down'
-
-        return data_difference
+    return get_snapshot_data_change(snapshot)
+
+
+def get_data_changes(account_id, since=None, until=None):
+    """
+    Calculates data changes (see get_data_change) of all account's snapshots
+    made in specific time range with single query. Previous values are taken
+    with window function, so first snapshot in range is also compared with
+    the one made before the range.
+
+    :param account_id: int
+    :param since: datetime.datetime or None
+    :param until: datetime.datetime or None
+    :return: dictionary (snapshot id: dictionary)
+    """
+    snapshots = AccountSnapshot.objects.filter(account_id=account_id)
+    if since is not None:
+        previous_date = AccountSnapshot.objects.filter(
+            account_id=account_id, date_of_snapshot__lt=since
+        ).order_by('-date_of_snapshot').values('date_of_snapshot')[:1]
+        snapshots = snapshots.filter(date_of_snapshot__gte=Coalesce(
+            Subquery(previous_date), Value(since),
+            output_field=DateTimeField()))
+    if until is not None:
+        snapshots = snapshots.filter(date_of_snapshot__lte=until)
+
+    previous_annotations = {}
+    for key in CHANGE_FIELDS:
+        previous_annotations['previous_' + key] = Window(
+            expression=Lag(key),
+            order_by=[F('date_of_snapshot').asc(), F('id').asc()],
+        )
+    previous_annotations['previous_id'] = Window(
+        expression=Lag('id'),
+        order_by=[F('date_of_snapshot').asc(), F('id').asc()],
+    )
+
+    rows = snapshots.annotate(**previous_annotations).values(
+        'id', 'date_of_snapshot', *CHANGE_FIELDS, *previous_annotations)
+
+    changes = {}
+    for row in rows:
+        # snapshot made before the range is only used as previous one
+        if since is not None and row['date_of_snapshot'] < since:
+            continue
+
+        previous_data = None
+        if row['previous_id'] is not None:
+            previous_data = {}
+            for key in CHANGE_FIELDS:
+                previous_data[key] = row['previous_' + key]
+
+        changes[row['id']] = compare_data(row, previous_data)
+
+    return changes
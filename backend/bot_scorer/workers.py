@@ -0,0 +1,203 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection, DatabaseError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api.models import Account
+
+from .scheduler import SnapshotScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def make_worker_id():
+    """
+    Returns unique id of worker (host, process and random part).
+
+    :return: string
+    """
+    return f'{socket.gethostname()[:40]}:{os.getpid()}:' \
+           f'{uuid.uuid4().hex[:8]}'
+
+
+class LeaseWorker(SnapshotScheduler):
+    """
+    Snapshot scheduler which can be run by many workers (processes or
+    machines) at once. Worker claims batch of due accounts by taking their
+    lease (Account.lease_owner and lease_expires_at) with conditional
+    UPDATE, so batches of workers are disjoint. Leases are renewed while
+    batch is processed, accounts of every saved write chunk are rescheduled
+    and released in chunk's transaction (so saved accounts are never left
+    due), lease of crashed worker expires and its accounts are claimed by
+    others. Rescheduled accounts are not due again in the same cycle, so no
+    account is snapshotted twice.
+    """
+
+    def __init__(self, worker_id=None, lease_time=None, **kwargs):
+        """
+        :param worker_id: string or None (generated)
+        :param lease_time: datetime.timedelta or None, if None it is taken
+        from settings.BOT_SCORER_WORKER_LEASE_TIME
+        :param kwargs: arguments of bot_scorer.scheduler.SnapshotScheduler
+        """
+        super().__init__(**kwargs)
+        if lease_time is None:
+            lease_time = settings.BOT_SCORER_WORKER_LEASE_TIME
+        self.worker_id = worker_id if worker_id is not None \
+            else make_worker_id()
+        self.lease_time = lease_time
+        self._claimed = []
+
+    @staticmethod
+    def get_claimable(now):
+        """
+        Returns condition of accounts which are due and have no valid lease.
+
+        :param now: datetime.datetime
+        :return: django.db.models.Q
+        """
+        return (Q(next_snapshot_at__isnull=True) |
+                Q(next_snapshot_at__lte=now)) & \
+            (Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now))
+
+    def get_candidates(self, now):
+        """
+        Returns ids of batch of claimable accounts, the most overdue first.
+
+        :param now: datetime.datetime
+        :return: list of ints
+        """
+        return list(Account.objects.filter(self.get_claimable(now))
+                    .order_by(F('next_snapshot_at').asc(nulls_first=True),
+                              'id')
+                    .values_list('id', flat=True)[:self.batch_size])
+
+    def claim(self, candidates, now):
+        """
+        Takes lease of candidates which are still claimable and returns
+        them. Accounts claimed meanwhile by other worker (or already
+        snapshotted and rescheduled by it) are skipped.
+
+        :param candidates: list of accounts' ids
+        :param now: datetime.datetime
+        :return: list of api.models.Account
+        """
+        expires_at = now + self.lease_time
+        Account.objects.filter(self.get_claimable(now),
+                               id__in=candidates).update(
+            lease_owner=self.worker_id, lease_expires_at=expires_at)
+        self._claimed = list(Account.objects.filter(
+            lease_owner=self.worker_id, lease_expires_at=expires_at)
+            .order_by('id'))
+        return self._claimed
+
+    def get_due_accounts(self, now):
+        """
+        Claims and returns batch of due accounts with no valid lease, the
+        most overdue first.
+
+        :param now: datetime.datetime
+        :return: list of api.models.Account
+        """
+        candidates = self.get_candidates(now)
+        if not candidates:
+            return []
+        return self.claim(candidates, now)
+
+    def renew(self, accounts):
+        """
+        Extends lease of accounts still held by worker.
+
+        :param accounts: list of api.models.Account
+        :return: int, number of renewed leases
+        """
+        return Account.objects.filter(
+            id__in=[account.id for account in accounts],
+            lease_owner=self.worker_id,
+        ).update(lease_expires_at=timezone.now() + self.lease_time)
+
+    def release(self, accounts):
+        """
+        Releases lease of accounts still held by worker.
+
+        :param accounts: list of api.models.Account
+        :return:
+        """
+        Account.objects.filter(
+            id__in=[account.id for account in accounts],
+            lease_owner=self.worker_id,
+        ).update(lease_owner='', lease_expires_at=None)
+
+    def schedule(self, accounts, now):
+        """
+        Overrides default method - releases leases after scheduling.
+        """
+        super().schedule(accounts, now)
+        self.release(accounts)
+
+    def schedule_retry(self, accounts, now):
+        """
+        Overrides default method - releases leases after scheduling.
+        """
+        super().schedule_retry(accounts, now)
+        self.release(accounts)
+
+    def heartbeat(self, stop):
+        """
+        Renews leases of claimed accounts every third of lease time until
+        stop is set (run in separate thread). Failed renewal is logged and
+        tried again with the next beat.
+
+        :param stop: threading.Event
+        :return:
+        """
+        try:
+            while not stop.wait(self.lease_time.total_seconds() / 3):
+                if not self._claimed:
+                    continue
+                try:
+                    self.renew(self._claimed)
+                except DatabaseError:
+                    logger.exception("Renewing leases of worker %s failed",
+                                     self.worker_id)
+        finally:
+            connection.close()
+
+    def run_due(self, now=None):
+        """
+        Overrides default method - renews leases of claimed accounts while
+        they are processed.
+        """
+        self._claimed = []
+        stop = threading.Event()
+        thread = threading.Thread(target=self.heartbeat, args=(stop,),
+                                  daemon=True)
+        thread.start()
+        try:
+            return super().run_due(now)
+        finally:
+            stop.set()
+            thread.join()
+
+    def run_cycle(self):
+        """
+        Processes due accounts until there are none left unclaimed. Report
+        of every batch is saved (see run_due).
+
+        :return: dictionary, summed runners' reports and ids of saved runs
+        """
+        total = {'accounts': 0, 'snapshots': 0, 'failed': 0}
+        runs = []
+        while True:
+            report = self.run_due()
+            if report['accounts'] == 0:
+                return dict(total, runs=runs)
+            for key in total:
+                total[key] += report[key]
+            runs.append(report['id'])